@@ -93,6 +93,8 @@ if "test" in sys.argv:
             'NAME': BASE_DIR / 'test_db.sqlite3',
         }
     }
+    # SQLite создает покрывающие индексы без INCLUDE - для тестов это не важно
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
 else:
     DATABASES = {
         'default': {
@@ -182,6 +184,51 @@ LOGIN_REDIRECT_URL = 'recommendation_system:home'
 LOGIN_URL = 'users:login'
 LOGOUT_REDIRECT_URL = 'recommendation_system:home'
 
+# Реализация системы рекомендаций: 'networkx' (граф networkx) или 'sparse' (разреженные матрицы)
+RECOMMENDATION_ENGINE = os.getenv('RECOMMENDATION_ENGINE', 'networkx')
+
+# Метод рекомендаций по умолчанию: 'graph' (схожие пользователи и соседи в графе), 'mf' (матричная
+# факторизация) или 'ppr' (персонализированный PageRank); запрос может выбрать метод параметром ?recommender=
+RECOMMENDER = os.getenv('RECOMMENDER', 'graph')
+
+# Точность персонализированного PageRank: меньше - точнее оценки и дольше расчет
+PPR_TOLERANCE = float(os.getenv('PPR_TOLERANCE', 1e-5))
+
+# Каталог модели матричной факторизации (команда train_factorization)
+FACTORIZATION_DIR = os.getenv('FACTORIZATION_DIR', BASE_DIR / 'data' / 'factorization')
+
+# Каталог снимка графа предпочтений для хранилища 'sparse' (команда dump_graph); в тестах снимки не используются
+GRAPH_SNAPSHOT_DIR = None if "test" in sys.argv else os.getenv('GRAPH_SNAPSHOT_DIR', BASE_DIR / 'data' / 'graph')
+
+# Приближенный поиск по векторам модели факторизации для ближайших соседей и похожих фильмов
+# и количество просматриваемых кластеров индекса: больше - выше полнота и дольше запрос
+ANN_SEARCH = os.getenv('ANN_SEARCH', False) == 'True'
+ANN_N_PROBE = int(os.getenv('ANN_N_PROBE', 8))
+
+# Шина изменений между воркерами: 'loopback' (один процесс) или 'redis' (Pub/Sub, несколько воркеров gunicorn)
+INVALIDATION_BUS = os.getenv('INVALIDATION_BUS', 'loopback')
+INVALIDATION_BUS_URL = os.getenv('INVALIDATION_BUS_URL', os.getenv('LOCATION'))
+
+# Время жизни кэша фрагментов каталога главной страницы (с); фрагменты сбрасываются при изменении фильмов и жанров
+CATALOG_FRAGMENT_TIMEOUT = int(os.getenv('CATALOG_FRAGMENT_TIMEOUT', 3600))
+
+# Прогрев воркера gunicorn до приема запросов (gunicorn.conf.py): граф, PageRank и каталог строятся при старте
+WARM_UP = os.getenv('WARM_UP', False) == 'True'
+
+# Кэш результатов рекомендаций пользователя: время жизни записей (с) и размер кэша процесса (записей).
+# При нескольких воркерах нужен общий кэш (CACHE_ENABLED) или шина изменений через Redis: иначе после изменения
+# предпочтений остальные воркеры отдают прежние рекомендации до истечения времени жизни
+RECOMMENDATION_CACHE_TIMEOUT = int(os.getenv('RECOMMENDATION_CACHE_TIMEOUT', 300))
+RECOMMENDATION_CACHE_L1_SIZE = int(os.getenv('RECOMMENDATION_CACHE_L1_SIZE', 1000))
+
+# Буфер статистики рекомендаций: сброс при STATISTICS_BUFFER_SIZE записях или раз в STATISTICS_FLUSH_INTERVAL с.
+# В тестах записи сохраняются в конце каждого запроса
+STATISTICS_BUFFER_SIZE = int(os.getenv('STATISTICS_BUFFER_SIZE', 100))
+STATISTICS_FLUSH_INTERVAL = 0 if "test" in sys.argv else float(os.getenv('STATISTICS_FLUSH_INTERVAL', 5))
+
+# Сколько дней хранятся записи статистики, уже учтенные в агрегатах (команда compact_statistics)
+STATISTICS_RAW_RETENTION_DAYS = int(os.getenv('STATISTICS_RAW_RETENTION_DAYS', 30))
+
 CACHE_ENABLED = os.getenv('CACHE_ENABLED', False) == 'True'
 if CACHE_ENABLED:
     CACHES = {
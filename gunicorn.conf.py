@@ -0,0 +1,39 @@
+"""
+Настройки и хуки gunicorn: прогрев воркера до приема запросов (WARM_UP=True) и отчет о времени готовности
+мастера и каждого воркера для сравнения между релизами.
+"""
+import time
+
+# Sync-воркеры: графы и кэши процесса изменяются в потоке запросов и не рассчитаны на параллельные запросы
+worker_class = 'sync'
+threads = 1
+
+started = time.perf_counter()
+
+
+def when_ready(server):
+    server.log.info("Мастер gunicorn готов за %.3f с", time.perf_counter() - started)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # Вызывается после загрузки приложения Django в воркере и до приема запросов
+    from django.conf import settings
+    from django.db import connections
+
+    from recommendation_system.invalidation import invalidation_bus
+
+    # Подключение к шине изменений до прогрева: сброс структур после первой подписки выполняется сейчас,
+    # пока структуры пусты, а изменения, записанные во время прогрева, дойдут до воркера
+    invalidation_bus.start()
+    invalidation_bus.process_pending()
+    if settings.WARM_UP:
+        from recommendation_system.warmup import warm_up
+
+        warm_up()
+        # Воркер не держит соединение с базой данных, открытое прогревом, до первого запроса
+        connections.close_all()
+    worker.log.info("Воркер %s готов за %.3f с", worker.pid, time.perf_counter() - worker.forked_at)
@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Film, RecommendationStatistics, UserGenre, Rating, UserFilm, Genre
+from .film_search import film_search_store
+from .preferences import parse_primary_key
+from .models import Film, RecommendationStatistics, UserGenre, Rating, UserFilm, Genre, RecommendationSnapshot, \
+    HourlyStatistics, DailyStatistics, StatisticsCompaction
 
 
 # создали админку python manage.py createsuperuser
@@ -24,6 +27,17 @@ class FilmAdmin(admin.ModelAdmin):
     )
     search_fields = ("id", "title", "genre", "director",)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по id и по поисковому индексу фильмов (все совпадения) вместо сканирования таблицы по icontains."""
+        if not search_term:
+            return queryset, False
+        ids = [pk for pk, _ in film_search_store.search(search_term, limit=None)]
+        try:
+            ids.append(parse_primary_key(search_term.strip()))
+        except (ValueError, OverflowError):
+            pass
+        return queryset.filter(pk__in=ids), False
+
 
 @admin.register(RecommendationStatistics)
 class RecommendationStatisticsAdmin(admin.ModelAdmin):
@@ -36,11 +50,10 @@ class RecommendationStatisticsAdmin(admin.ModelAdmin):
         "genre_count",
         'timestamp',
     )
-    list_filter = (
-        "user",
-        "timestamp",
-    )
-    search_fields = ("id", "user", "film_count", "timestamp",)
+    # Таблица растет с каждой выдачей: без фильтров и полного подсчета строк, сводка - в агрегатах
+    list_select_related = ("user",)
+    show_full_result_count = False
+    search_fields = ("user__username",)
 
 
 @admin.register(UserGenre)
@@ -107,3 +120,48 @@ class GenreAdmin(admin.ModelAdmin):
         "name",
     )
     search_fields = ("id", "name",)
+
+
+@admin.register(RecommendationSnapshot)
+class RecommendationSnapshotAdmin(admin.ModelAdmin):
+    """Отображает снимки рекомендаций пользователей в админке"""
+
+    list_display = (
+        "id",
+        "user",
+        "computed_at",
+        "changed_at",
+    )
+    search_fields = ("user__username",)
+
+
+@admin.register(HourlyStatistics, DailyStatistics)
+class StatisticsRollupAdmin(admin.ModelAdmin):
+    """Отображает агрегаты статистики рекомендаций в админке"""
+
+    list_display = (
+        "period_start",
+        "user",
+        "count",
+        "film_count_avg",
+        "film_count_min",
+        "film_count_max",
+        "genre_count_avg",
+        "genre_count_min",
+        "genre_count_max",
+    )
+    list_filter = (
+        "period_start",
+    )
+    list_select_related = ("user",)
+    search_fields = ("user__username",)
+
+
+@admin.register(StatisticsCompaction)
+class StatisticsCompactionAdmin(admin.ModelAdmin):
+    """Отображает отметку сжатия статистики в админке"""
+
+    list_display = (
+        "last_id",
+        "compacted_at",
+    )
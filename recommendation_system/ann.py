@@ -0,0 +1,127 @@
+"""
+Приближенный поиск ближайших векторов по косинусной мере: инвертированный индекс по кластерам (IVF).
+Векторы разбиваются на кластеры сферическим k-means и хранятся подряд по кластерам; запрос сравнивается
+с центроидами и просматривает только n_probe ближайших кластеров. Чем больше n_probe, тем выше полнота
+и больше время запроса; n_probe, равный числу кластеров, дает точный поиск.
+"""
+from pathlib import Path
+
+import numpy as np
+
+from recommendation_system.scoring import rank_items
+
+# Количество итераций k-means и размер выборки векторов для обучения центроидов
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 100000
+
+# Количество векторов, сравниваемых с центроидами одним умножением матриц
+ASSIGN_CHUNK_SIZE = 4096
+
+# Количество просматриваемых кластеров по умолчанию
+N_PROBE = 8
+
+
+def normalize(vectors):
+    """Векторы единичной длины; нулевые векторы остаются нулевыми."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def assign(vectors, centroids):
+    """Номер ближайшего центроида для каждого вектора."""
+    return np.concatenate([np.argmax(vectors[start:start + ASSIGN_CHUNK_SIZE] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE)] or [np.empty(0, dtype=np.int64)])
+
+
+def spherical_kmeans(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Центроиды единичной длины для нормированных векторов."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_SAMPLE_SIZE:
+        vectors = vectors[rng.choice(len(vectors), KMEANS_SAMPLE_SIZE, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # Пустой кластер сохраняет прежний центроид
+        filled = np.bincount(labels, minlength=n_lists) > 0
+        centroids[filled] = normalize(sums[filled])
+    return centroids
+
+
+class IVFIndex:
+    """Векторы (нормированные), их id и центроиды; векторы кластера i - строки offsets[i]:offsets[i + 1]."""
+
+    ARRAYS = ('centroids', 'offsets', 'ids', 'vectors')
+
+    def __init__(self, centroids, offsets, ids, vectors):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.positions = {int(pk): position for position, pk in enumerate(ids)}
+
+    @classmethod
+    def build(cls, ids, vectors, n_lists=None, seed=0):
+        """Построение индекса; по умолчанию число кластеров - корень из числа векторов."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalize(vectors)
+        if not len(ids):
+            return cls(np.zeros((0, vectors.shape[1]), dtype=np.float32), np.zeros(1, dtype=np.int64), ids, vectors)
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(ids)))), len(ids))
+        centroids = spherical_kmeans(vectors, n_lists, seed=seed)
+        labels = assign(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids, offsets, ids[order], vectors[order])
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(directory / f"{name}.npy", np.asarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Загрузка индекса; при mmap_mode='r' массивы отображаются в память без копирования."""
+        directory = Path(directory)
+        return cls(*(np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in cls.ARRAYS))
+
+    def vector(self, pk):
+        """Нормированный вектор объекта индекса, None - если его нет."""
+        position = self.positions.get(int(pk))
+        return None if position is None else self.vectors[position]
+
+    def search(self, query, k, n_probe=N_PROBE, exclude=()):
+        """
+        Пары (id, косинусная мера) k ближайших векторов с положительной мерой из n_probe ближайших кластеров,
+        без id из exclude.
+        """
+        if not self.n_lists or k <= 0:
+            return []
+        query = normalize(query)
+        centroid_scores = self.centroids @ query
+        n_probe = min(max(n_probe, 1), self.n_lists)
+        probes = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        rows = np.concatenate([np.arange(self.offsets[probe], self.offsets[probe + 1]) for probe in probes])
+        ids = self.ids[rows]
+        scores = self.vectors[rows] @ query
+        if len(exclude):
+            keep = ~np.isin(ids, np.fromiter(exclude, dtype=np.int64))
+            ids, scores = ids[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        return rank_items(ids, scores, k)
+
+    def neighbors(self, pk, k, n_probe=N_PROBE):
+        """Ближайшие к объекту индекса векторы без него самого; пустой список, если объекта нет."""
+        query = self.vector(pk)
+        if query is None:
+            return []
+        return self.search(query, k, n_probe, exclude=(int(pk),))
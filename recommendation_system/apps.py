@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecommendationSystemConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recommendation_system"
+
+    def ready(self):
+        # Подключаем обработчики сигналов, поддерживающие граф предпочтений в актуальном состоянии
+        from recommendation_system import signals  # noqa: F401
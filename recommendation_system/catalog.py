@@ -0,0 +1,152 @@
+import time
+from datetime import date
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+
+from recommendation_system.models import Film, Genre
+
+# Количество фильмов на странице каталога главной страницы
+HOME_FILMS_PAGE_SIZE = 20
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+class CatalogCache:
+    """
+    Кэш метаданных фильмов и жанров процесса: id -> словарь полей для вывода.
+    Недостающие записи загружаются одним запросом in_bulk, сбрасываются сигналами при сохранении и удалении.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self._entries = {}
+
+    def get_many(self, ids):
+        """Метаданные объектов в порядке ids, отсутствующие в базе данных id пропускаются."""
+        ids = [int(pk) for pk in ids]
+        missing = [pk for pk in ids if pk not in self._entries]
+        if missing:
+            objects = self.model.objects.only(*self.fields).in_bulk(missing)
+            for pk, instance in objects.items():
+                self._entries[pk] = self._to_entry(instance)
+        return [self._entries[pk] for pk in ids if pk in self._entries]
+
+    def preload(self):
+        """Загрузка метаданных всех объектов одним проходом по таблице. Возвращает количество записей в кэше."""
+        for instance in self.model.objects.only(*self.fields).iterator():
+            self._entries[instance.pk] = self._to_entry(instance)
+        return len(self._entries)
+
+    def get_scored(self, items):
+        """Метаданные объектов для пар (id, оценка) с добавленной оценкой, в порядке items."""
+        scores = {int(pk): score for pk, score in items}
+        return [{**entry, "score": scores[entry["id"]]} for entry in self.get_many(scores)]
+
+    def _to_entry(self, instance):
+        entry = {}
+        for field in self.fields:
+            value = getattr(instance, field)
+            # Для файловых полей храним путь, как он записан в базе данных
+            if isinstance(value, FieldFile):
+                value = value.name or None
+            entry[field] = value
+        return entry
+
+    def invalidate(self, pk=None):
+        """Сброс записи объекта или всего кэша."""
+        if pk is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(int(pk), None)
+
+
+film_catalog = CatalogCache(Film, ('id', 'title', 'image', 'rating'))
+genre_catalog = CatalogCache(Genre, ('id', 'name'))
+
+
+def get_catalog_version():
+    """Версия каталога для ключей кэша фрагментов шаблонов; при отсутствии в кэше создается новая."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Смена версии каталога при сохранении и удалении фильмов и жанров: прежние фрагменты больше не читаются."""
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def parse_cursor(value):
+    """Курсор страницы 'дата выхода_id' в пару (date, id); None, если курсор не задан или некорректен."""
+    try:
+        release_date, pk = value.split('_')
+        return date.fromisoformat(release_date), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+class FilmPage:
+    """
+    Страница каталога фильмов от новых к старым с пагинацией по ключу (release_date, id):
+    after - курсор последнего фильма предыдущей страницы, before - первого фильма следующей.
+    Запрос выполняется при первом обращении к фильмам, поэтому при попадании в кэш фрагментов шаблона
+    база данных не читается.
+    """
+
+    FIELDS = ('id', 'title', 'image', 'release_date')
+
+    def __init__(self, after=None, before=None, size=HOME_FILMS_PAGE_SIZE):
+        self.after = parse_cursor(after)
+        self.before = parse_cursor(before) if self.after is None else None
+        self.size = size
+
+    @property
+    def key(self):
+        """Часть ключа кэша фрагментов для страницы."""
+        for name in ('after', 'before'):
+            cursor = getattr(self, name)
+            if cursor is not None:
+                return f"{name}:{cursor[0].isoformat()}_{cursor[1]}"
+        return "first"
+
+    @cached_property
+    def _page(self):
+        queryset = Film.objects.only(*self.FIELDS)
+        if self.before is not None:
+            release_date, pk = self.before
+            films = list(queryset.filter(Q(release_date__gt=release_date) | Q(release_date=release_date, id__gt=pk))
+                         .order_by('release_date', 'id')[:self.size + 1])
+            return films[:self.size][::-1], len(films) > self.size, True
+        films = queryset.order_by('-release_date', '-id')
+        if self.after is not None:
+            release_date, pk = self.after
+            films = films.filter(Q(release_date__lt=release_date) | Q(release_date=release_date, id__lt=pk))
+        films = list(films[:self.size + 1])
+        return films[:self.size], self.after is not None, len(films) > self.size
+
+    @property
+    def films(self):
+        return self._page[0]
+
+    def __iter__(self):
+        return iter(self.films)
+
+    @staticmethod
+    def _cursor(film):
+        return f"{film.release_date.isoformat()}_{film.id}"
+
+    @property
+    def previous_cursor(self):
+        """Курсор before для предыдущей (более новой) страницы, None - это первая страница."""
+        return self._cursor(self.films[0]) if self._page[1] and self.films else None
+
+    @property
+    def next_cursor(self):
+        """Курсор after для следующей страницы, None - это последняя страница."""
+        return self._cursor(self.films[-1]) if self._page[2] and self.films else None
@@ -0,0 +1,133 @@
+from functools import cached_property
+
+from django.conf import settings
+
+from recommendation_system.recommendation_cache import recommendation_cache
+from recommendation_system.services import KNN_K, get_graph_store, get_recommendation_system
+from recommendation_system.snapshots import get_fresh_snapshot
+
+# Методы рекомендаций: по графу предпочтений, по матричной факторизации и по персонализированному PageRank
+RECOMMENDERS = ('graph', 'mf', 'ppr')
+
+
+class RecommendationContext:
+    """
+    Контекст расчета рекомендаций пользователя в рамках одного запроса.
+    Граф, схожие пользователи, ближайшие соседи и PageRank вычисляются не больше одного раза
+    и используются всеми выводами: рекомендациями, топом и статистикой.
+    """
+
+    def __init__(self, user_id, engine=None, recommender=None):
+        self.user_id = user_id
+        self.system = get_recommendation_system(engine)
+        self.engine = engine
+        self.recommender = recommender or settings.RECOMMENDER
+
+    @cached_property
+    def graph(self):
+        return get_graph_store(self.engine).get_graph()
+
+    @cached_property
+    def snapshot(self):
+        """Снимок рекомендаций, если предпочтения не менялись после расчета."""
+        return get_fresh_snapshot(self.user_id)
+
+    @cached_property
+    def pagerank(self):
+        """Оценки PageRank фильмов и жанров и id топ фильмов и жанров."""
+        return self.system.calculate_pagerank(self.graph)
+
+    @cached_property
+    def similar_users(self):
+        return self.system.collaborative_filtering(self.graph, self.user_id)
+
+    @cached_property
+    def k_neighbors(self):
+        """Ближайшие соседи: из индекса приближенного поиска по векторам модели, если он включен, иначе по графу."""
+        if settings.ANN_SEARCH:
+            # Модули методов импортируются при первом использовании: импорт представлений не загружает движки
+            from recommendation_system.factorization import nearest_users
+
+            neighbors = nearest_users(self.user_id, KNN_K)
+            if neighbors is not None:
+                return neighbors
+        return self.system.k_nearest_neighbors(self.graph, self.user_id, KNN_K)
+
+    @cached_property
+    def personalized(self):
+        """Рекомендации и персональный топ по персонализированному PageRank, если выбран метод 'ppr'."""
+        if self.recommender != 'ppr':
+            return None
+        from recommendation_system.personalized_pagerank import recommend_personalized
+
+        return recommend_personalized(self.user_id)
+
+    @cached_property
+    def recommendations(self):
+        """
+        Рекомендации по модели факторизации, если выбран метод 'mf' и пользователь был при обучении,
+        или по персонализированному PageRank, если выбран метод 'ppr' и у пользователя есть взаимодействия.
+        Иначе из актуального снимка или по схожим пользователям и соседям из контекста.
+        """
+        if self.recommender == 'mf':
+            from recommendation_system.factorization import recommend_factorized
+
+            factorized = recommend_factorized(self.user_id)
+            if factorized is not None:
+                return factorized
+        if self.personalized is not None:
+            return self.personalized[0]
+        if self.snapshot is not None:
+            return {"films": self.snapshot.films, "genres": self.snapshot.genres}
+        return self.system.score_candidates(self.graph, self.user_id, self.similar_users, self.k_neighbors)
+
+    @cached_property
+    def top(self):
+        if self.personalized is not None:
+            return self.personalized[1]
+        if self.snapshot is not None:
+            return self.snapshot.top
+        return self.pagerank[1]
+
+    def result(self):
+        """Рекомендации и топ пользователя."""
+        return self.recommendations, self.top
+
+    def statistics(self):
+        """Статистика пользователя: схожие пользователи и ближайшие соседи."""
+        return {
+            'similar_users': self.similar_users,
+            'k_neighbors': self.k_neighbors,
+        }
+
+    def cached_result(self):
+        """Рекомендации и топ из кэша пользователя; при промахе - расчет в контексте."""
+        return recommendation_cache.get_or_compute(f'recommendations:{self.recommender}', self.user_id, self.result)
+
+    def cached_statistics(self):
+        """
+        Статистика рекомендаций: оценки PageRank, схожие пользователи и ближайшие соседи.
+        В кэше пользователя хранится только его часть; оценки PageRank общие для всех пользователей
+        и берутся из кэша PageRank движка по версии графа.
+        """
+        user_statistics = recommendation_cache.get_or_compute('user_statistics', self.user_id, self.statistics)
+        return {'pagerank_scores': self.pagerank[0], **user_statistics}
+
+
+def get_recommendation_context(request):
+    """
+    Контекст рекомендаций текущего пользователя, один на запрос.
+    Метод рекомендаций задается параметром ?recommender=, неизвестное значение - метод по умолчанию.
+    """
+    request = getattr(request, '_request', request)
+    recommender = request.GET.get('recommender')
+    recommender = recommender if recommender in RECOMMENDERS else None
+    context = getattr(request, '_recommendation_context', None)
+    if context is None or context.user_id != request.user.id:
+        context = request._recommendation_context = RecommendationContext(request.user.id, recommender=recommender)
+    return context
+
+
+def get_user_recommendations(user_id):
+    """Рекомендации и топ пользователя: из снимка, если он актуален, иначе расчет по графу процесса."""
+    return RecommendationContext(user_id).result()
@@ -0,0 +1,270 @@
+"""
+Рекомендации по матричной факторизации взаимодействий (неявный ALS).
+Модель обучается отдельно командой train_factorization и сохраняется файлами .npy; процессы сервера
+отображают файлы в память только для чтения и разделяют их страницы без копирования.
+Рекомендации пользователя - скалярные произведения его вектора на векторы фильмов и частичная сортировка.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from recommendation_system.ann import IVFIndex
+from recommendation_system.models import Film, Rating, UserFilm, UserGenre
+from recommendation_system.scoring import RECOMMENDATIONS_TOP_N, rank_items
+from recommendation_system.sparse_engine import InteractionMatrix, SparseRecommendationSystem, film_relevance
+from recommendation_system.versioned_files import current_version, save_version, version_marker
+
+# Параметры обучения: размерность векторов, регуляризация, количество итераций и вес уверенности
+FACTORS = 32
+REGULARIZATION = 0.1
+ITERATIONS = 15
+CONFIDENCE_ALPHA = 40.0
+
+# Оценка качества: длина списка рекомендаций и доля скрываемых фильмов каждого пользователя
+EVALUATION_K = 10
+HOLDOUT_FRACTION = 0.2
+
+
+def _solve(fixed, relevance, regularization, alpha):
+    """
+    Шаг ALS: векторы строк relevance при фиксированных векторах столбцов fixed.
+    Уверенность взаимодействия 1 + alpha * релевантность, для отсутствующих взаимодействий - 1.
+    """
+    gram = fixed.T @ fixed
+    identity = regularization * np.eye(fixed.shape[1])
+    result = np.zeros((relevance.shape[0], fixed.shape[1]))
+    for row in range(relevance.shape[0]):
+        start, end = relevance.indptr[row], relevance.indptr[row + 1]
+        if start == end:
+            continue
+        factors = fixed[relevance.indices[start:end]]
+        confidence = 1 + alpha * relevance.data[start:end]
+        result[row] = np.linalg.solve(gram + (factors.T * (confidence - 1)) @ factors + identity,
+                                      factors.T @ confidence)
+    return result
+
+
+def als(relevance, factors=FACTORS, regularization=REGULARIZATION, iterations=ITERATIONS,
+        alpha=CONFIDENCE_ALPHA, seed=0):
+    """Неявный ALS (Hu, Koren, Volinsky) над разреженной матрицей релевантности пользователь-фильм."""
+    relevance = relevance.tocsr()
+    relevance_t = relevance.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(scale=0.01, size=(relevance.shape[0], factors))
+    film_factors = rng.normal(scale=0.01, size=(relevance.shape[1], factors))
+    for _ in range(iterations):
+        user_factors = _solve(film_factors, relevance, regularization, alpha)
+        film_factors = _solve(user_factors, relevance_t, regularization, alpha)
+    return user_factors.astype(np.float32), film_factors.astype(np.float32)
+
+
+class FactorModel:
+    """
+    Векторы пользователей и фильмов, жанры фильмов (-1 - без жанра)
+    и индексы приближенного поиска ближайших векторов пользователей и фильмов.
+    """
+
+    ARRAYS = ('user_ids', 'film_ids', 'film_genres', 'user_factors', 'film_factors')
+    INDEXES = ('user_ann', 'film_ann')
+
+    def __init__(self, user_ids, film_ids, film_genres, user_factors, film_factors, user_ann=None, film_ann=None):
+        self.user_ids = user_ids
+        self.film_ids = film_ids
+        self.film_genres = film_genres
+        self.user_factors = user_factors
+        self.film_factors = film_factors
+        self.user_ann = user_ann if user_ann is not None else IVFIndex.build(user_ids, user_factors)
+        self.film_ann = film_ann if film_ann is not None else IVFIndex.build(film_ids, film_factors)
+        self.user_index = {int(pk): index for index, pk in enumerate(user_ids)}
+        self.film_index = {int(pk): index for index, pk in enumerate(film_ids)}
+
+    @classmethod
+    def train(cls, matrix, film_genres, **params):
+        """Обучение по матрице взаимодействий; film_genres - словарь id фильма -> id жанра."""
+        relevance = film_relevance(matrix, np.arange(matrix.n_users))
+        user_factors, film_factors = als(relevance, **params)
+        genres = np.array([film_genres.get(int(pk)) or -1 for pk in matrix.film_ids], dtype=np.int64)
+        return cls(matrix.user_ids, matrix.film_ids, genres, user_factors, film_factors)
+
+    def save(self, directory):
+        """Сохранение новой версии модели в подкаталог directory; версия становится текущей."""
+        def write(version):
+            for name in self.ARRAYS:
+                np.save(version / f"{name}.npy", np.asarray(getattr(self, name)))
+            for name in self.INDEXES:
+                getattr(self, name).save(version / name)
+        return save_version(directory, write)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Загрузка текущей версии модели; при mmap_mode='r' массивы отображаются в память без копирования."""
+        version = current_version(directory)
+        return cls(*(np.load(version / f"{name}.npy", mmap_mode=mmap_mode) for name in cls.ARRAYS),
+                   **{name: IVFIndex.load(version / name, mmap_mode) for name in cls.INDEXES
+                      if (version / name).is_dir()})
+
+    def recommend(self, user_id, exclude=(), top_n=RECOMMENDATIONS_TOP_N):
+        """
+        Пары (id, оценка) top_n фильмов по скалярному произведению векторов, без фильмов exclude.
+        None, если пользователя не было при обучении.
+        """
+        row = self.user_index.get(int(user_id))
+        if row is None:
+            return None
+        scores = self.film_factors @ self.user_factors[row]
+        excluded = [self.film_index[pk] for pk in exclude if pk in self.film_index]
+        scores[excluded] = -np.inf
+        count = min(top_n, len(scores))
+        if not count:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        return rank_items(self.film_ids[top], scores[top], top_n)
+
+    def recommend_genres(self, films, exclude=(), top_n=RECOMMENDATIONS_TOP_N):
+        """Жанры по сумме оценок рекомендованных фильмов films, без жанров exclude."""
+        genres = {}
+        for pk, score in films:
+            genre = int(self.film_genres[self.film_index[pk]])
+            if genre >= 0 and genre not in exclude:
+                genres[genre] = genres.get(genre, 0.0) + score
+        return rank_items(list(genres), list(genres.values()), top_n)
+
+
+_model_lock = threading.Lock()
+_loaded_model = (None, None)
+
+
+def get_factor_model():
+    """
+    Текущая модель процесса, отображенная в память. Модель перечитывается, когда команда обучения
+    сохраняет новую версию. None, если модель еще не обучена.
+    """
+    global _loaded_model
+    marker = version_marker(settings.FACTORIZATION_DIR)
+    if marker is None:
+        return None
+    with _model_lock:
+        if _loaded_model[0] != marker:
+            _loaded_model = (marker, FactorModel.load(settings.FACTORIZATION_DIR))
+        return _loaded_model[1]
+
+
+def recommend_factorized(user_id, top_n=RECOMMENDATIONS_TOP_N):
+    """
+    Рекомендации фильмов и жанров пользователя по модели факторизации, в формате get_recommendations.
+    None, если модели нет или пользователь появился после обучения.
+    """
+    model = get_factor_model()
+    if model is None:
+        return None
+    # Фильмы и жанры пользователя читаются из базы: модель не знает о взаимодействиях после обучения
+    own_films = set(UserFilm.objects.filter(user_id=user_id).values_list('film_id', flat=True))
+    own_films.update(Rating.objects.filter(user_id=user_id).values_list('film_id', flat=True))
+    films = model.recommend(user_id, own_films, top_n)
+    if films is None:
+        return None
+    own_genres = set(UserGenre.objects.filter(user_id=user_id).values_list('genre_id', flat=True))
+    return {"films": films, "genres": model.recommend_genres(films, own_genres, top_n)}
+
+
+def nearest_users(user_id, k, n_probe=None):
+    """
+    Ближайшие пользователи по векторам модели из индекса приближенного поиска, в формате k_nearest_neighbors.
+    Расстояние - 2 / косинусная мера: пользователь с тем же вектором весит как сосед через общий фильм.
+    None, если модели нет или пользователь появился после обучения.
+    """
+    model = get_factor_model()
+    if model is None or model.user_ann.vector(user_id) is None:
+        return None
+    neighbors = model.user_ann.neighbors(user_id, k, n_probe or settings.ANN_N_PROBE)
+    return [(f"user_{pk}", 2 / score) for pk, score in neighbors]
+
+
+def similar_films(film_id, limit, n_probe=None):
+    """Похожие фильмы по векторам модели: пары (id, косинусная мера). None, если фильма нет в модели."""
+    model = get_factor_model()
+    if model is None or model.film_ann.vector(film_id) is None:
+        return None
+    return model.film_ann.neighbors(film_id, limit, n_probe or settings.ANN_N_PROBE)
+
+
+def train_factor_model(directory=None, **params):
+    """Обучение модели по базе данных и сохранение новой версии. Возвращает модель и время этапов в секундах."""
+    timings = {}
+    started = time.perf_counter()
+    matrix = InteractionMatrix.from_database()
+    film_genres = dict(Film.objects.values_list('id', 'genre_id'))
+    timings["build"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model = FactorModel.train(matrix, film_genres, **params)
+    timings["train"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model.save(directory or settings.FACTORIZATION_DIR)
+    timings["save"] = time.perf_counter() - started
+    return model, timings
+
+
+def holdout_split(matrix, fraction=HOLDOUT_FRACTION, seed=0):
+    """
+    Разделение взаимодействий: у каждого пользователя с двумя и более фильмами скрывается доля фильмов.
+    Возвращает обучающую матрицу и словарь user_id -> множество скрытых id фильмов.
+    """
+    rng = np.random.default_rng(seed)
+    viewed, rated = matrix.user_film.tocsr(), matrix.film_scores.tocoo()
+    rows = np.repeat(np.arange(matrix.n_users), np.diff(viewed.indptr))
+    cols = viewed.indices
+    hidden = np.zeros(len(cols), dtype=bool)
+    for row in range(matrix.n_users):
+        start, end = viewed.indptr[row], viewed.indptr[row + 1]
+        count = int((end - start) * fraction)
+        if end - start >= 2 and count:
+            hidden[start + rng.choice(end - start, count, replace=False)] = True
+
+    test = {}
+    for row, col in zip(rows[hidden], cols[hidden]):
+        test.setdefault(int(matrix.user_ids[row]), set()).add(int(matrix.film_ids[col]))
+    kept_ratings = ~np.isin(rated.row.astype(np.int64) * matrix.n_films + rated.col,
+                            rows[hidden].astype(np.int64) * matrix.n_films + cols[hidden])
+    genres = matrix.user_genre.tocoo()
+
+    train = InteractionMatrix.from_edges(
+        matrix.user_ids, matrix.film_ids, matrix.genre_ids,
+        np.column_stack([matrix.user_ids[rows[~hidden]], matrix.film_ids[cols[~hidden]]]),
+        np.column_stack([matrix.user_ids[genres.row], matrix.genre_ids[genres.col]]),
+        np.column_stack([matrix.user_ids[rated.row[kept_ratings]], matrix.film_ids[rated.col[kept_ratings]],
+                         rated.data[kept_ratings]]),
+    )
+    return train, test
+
+
+def _precision_recall(recommended, relevant, k):
+    hits = len(set(recommended[:k]) & relevant)
+    return hits / k, hits / len(relevant)
+
+
+def evaluate(matrix, film_genres, k=EVALUATION_K, fraction=HOLDOUT_FRACTION, seed=0, **params):
+    """
+    Офлайн-оценка precision@k и recall@k факторизации и рекомендаций по графу на скрытых взаимодействиях.
+    Возвращает количество оцененных пользователей и средние значения метрик каждого метода.
+    """
+    train, test = holdout_split(matrix, fraction, seed)
+    model = FactorModel.train(train, film_genres, seed=seed, **params)
+    user_films = train.user_film
+    methods = {
+        "graph": lambda user_id: SparseRecommendationSystem.get_recommendations(train, user_id, top_n=k)["films"],
+        "mf": lambda user_id: model.recommend(
+            user_id, train.film_ids[user_films.getrow(train.user_index[user_id]).indices].tolist(), k),
+    }
+    results = {"users": len(test)}
+    for name, recommend in methods.items():
+        metrics = [_precision_recall([pk for pk, _ in recommend(user_id)], relevant, k)
+                   for user_id, relevant in test.items()]
+        results[name] = {
+            "precision": float(np.mean([precision for precision, _ in metrics])) if metrics else 0.0,
+            "recall": float(np.mean([recall for _, recall in metrics])) if metrics else 0.0,
+        }
+    return results
@@ -0,0 +1,170 @@
+"""
+Поиск фильмов по названию, режиссеру и описанию: обратный индекс процесса (слово -> фильмы с весом).
+Последнее слово запроса ищется как префикс по отсортированному словарю индекса (поиск при вводе),
+остальные - как целые слова; в выдачу попадают фильмы, содержащие все слова запроса.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+from recommendation_system.models import Film
+
+# Веса полей фильма: слово названия важнее слова описания
+SEARCH_FIELDS = {'title': 3.0, 'director': 2.0, 'description': 1.0}
+
+# Количество фильмов в выдаче по умолчанию и максимальное
+SEARCH_TOP_N = 10
+SEARCH_MAX_LIMIT = 50
+
+# Минимальная длина префикса (более короткое слово ищется целиком: префиксу из двух букв соответствуют
+# тысячи фильмов) и доля веса слова, совпавшего с запросом только префиксом
+MIN_PREFIX_LENGTH = 3
+PREFIX_WEIGHT = 0.5
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре, ё заменяется на е."""
+    return TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+def _rank(item):
+    """Порядок выдачи: по убыванию оценки, при равенстве - по id."""
+    return -item[1], item[0]
+
+
+class FilmSearchIndex:
+    """
+    Обратный индекс фильмов: для каждого слова - словарь id фильма -> вес (сумма весов полей, где слово есть).
+    Запрос читает только списки фильмов слов запроса; для префикса - слов из диапазона словаря.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._film_tokens = {}
+        self._vocabulary = []
+
+    @classmethod
+    def build(cls, films):
+        """Построение индекса по кортежам (id, title, director, description)."""
+        index = cls()
+        for film in films:
+            index._add(*film)
+        index._vocabulary = sorted(index._postings)
+        return index
+
+    def _add(self, pk, *values):
+        weights = {}
+        for field_weight, value in zip(SEARCH_FIELDS.values(), values):
+            for token in set(tokenize(value)):
+                weights[token] = weights.get(token, 0.0) + field_weight
+        for token, weight in weights.items():
+            self._postings.setdefault(token, {})[pk] = weight
+        self._film_tokens[pk] = set(weights)
+        return weights
+
+    def update(self, pk, *values):
+        """Добавление или изменение фильма."""
+        self.remove(pk)
+        for token in self._add(pk, *values):
+            if len(self._postings[token]) == 1:
+                insort(self._vocabulary, token)
+
+    def remove(self, pk):
+        for token in self._film_tokens.pop(pk, ()):
+            postings = self._postings[token]
+            del postings[pk]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _expand(self, prefix):
+        """Слова словаря, начинающиеся с prefix."""
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            yield self._vocabulary[position]
+            position += 1
+
+    def _term_scores(self, term, prefix):
+        """Лучший вес фильмов для слова запроса: точное совпадение или, для префикса, слова с этим началом."""
+        scores = dict(self._postings.get(term, {}))
+        if prefix:
+            for token in self._expand(term):
+                if token == term:
+                    continue
+                for pk, weight in self._postings[token].items():
+                    if weight * PREFIX_WEIGHT > scores.get(pk, 0.0):
+                        scores[pk] = weight * PREFIX_WEIGHT
+        return scores
+
+    def search(self, query, limit=SEARCH_TOP_N):
+        """
+        Фильмы, содержащие все слова запроса: пары (id, оценка) по убыванию оценки, при равенстве - по id.
+        limit=None - все найденные фильмы.
+        """
+        terms = tokenize(query)
+        matches = []
+        for position, term in enumerate(terms):
+            scores = self._term_scores(term, position == len(terms) - 1 and len(term) >= MIN_PREFIX_LENGTH)
+            if not scores:
+                return []
+            matches.append(scores)
+        if not matches:
+            return []
+        # Пересечение начинается с самого короткого списка
+        matches.sort(key=len)
+        results = {pk: score + sum(other[pk] for other in matches[1:]) for pk, score in matches[0].items()
+                   if all(pk in other for other in matches[1:])}
+        ranked = (sorted(results.items(), key=_rank) if limit is None
+                  else heapq.nsmallest(limit, results.items(), key=_rank))
+        return [(pk, round(score, 6)) for pk, score in ranked]
+
+
+class FilmSearchStore:
+    """
+    Поисковый индекс процесса. Строится из базы данных при первом поиске; сохранение и удаление фильмов
+    отмечают фильм, и его слова перечитываются одним запросом перед следующим поиском.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _values(queryset):
+        return queryset.values_list('id', *SEARCH_FIELDS)
+
+    def get_index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = FilmSearchIndex.build(self._values(Film.objects.all()).iterator())
+                self._dirty = set()
+            elif self._dirty:
+                films = {film[0]: film for film in self._values(Film.objects.filter(pk__in=self._dirty))}
+                for pk in self._dirty:
+                    if pk in films:
+                        self._index.update(*films[pk])
+                    else:
+                        self._index.remove(pk)
+                self._dirty = set()
+            return self._index
+
+    def search(self, query, limit=SEARCH_TOP_N):
+        return self.get_index().search(query, limit)
+
+    def film_changed(self, film_id):
+        """Сохранение или удаление фильма."""
+        with self._lock:
+            if self._index is not None:
+                self._dirty.add(int(film_id))
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+            self._dirty = set()
+
+
+film_search_store = FilmSearchStore()
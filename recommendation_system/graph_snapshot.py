@@ -0,0 +1,175 @@
+"""
+Снимок графа предпочтений на диске: матрицы взаимодействий хранилища 'sparse' в файлах .npy и манифест
+с отметкой времени (watermark) чтения базы данных. Воркер отображает файлы текущей версии в память
+только для чтения, так что страницы разделяются процессами, и дозагружает из базы лишь взаимодействия,
+созданные (оценки - измененные) после отметки. Дозагруженные изменения хранятся в наложении поверх
+отображенных матриц (см. InteractionMatrix) и не копируют их.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from recommendation_system.models import Film, Genre, Rating, UserFilm, UserGenre
+from recommendation_system.sparse_engine import InteractionMatrix
+from recommendation_system.versioned_files import current_version, save_version
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+SNAPSHOT_FORMAT = 2
+
+# Запас перед отметкой снимка: строки, записанные транзакциями, которые завершились после чтения базы,
+# получают created_at (updated_at) раньше отметки. Повтор уже учтенного взаимодействия не меняет граф
+SNAPSHOT_REPLAY_MARGIN = timedelta(minutes=1)
+
+INTERACTION_MODELS = (UserFilm, Rating, UserGenre)
+
+
+def _table_counts():
+    """Количество строк и наибольший id таблиц взаимодействий на момент чтения базы для снимка."""
+    return {model._meta.model_name: model.objects.aggregate(count=Count('id'), max_id=Max('id'))
+            for model in INTERACTION_MODELS}
+
+
+def write_graph_snapshot(directory=None):
+    """Построение матриц из базы данных и запись новой версии снимка. Возвращает манифест и время этапов в секундах."""
+    directory = directory or settings.GRAPH_SNAPSHOT_DIR
+    timings = {}
+    watermark = timezone.now()
+    started = time.perf_counter()
+    # Количество строк читается до матриц: строки, добавленные между чтениями, получают id больше сохраненного
+    counts = _table_counts()
+    matrix = InteractionMatrix.from_database()
+    timings["build"] = time.perf_counter() - started
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "watermark": watermark.isoformat(),
+        "counts": counts,
+        "users": matrix.n_users,
+        "films": matrix.n_films,
+        "genres": matrix.n_genres,
+        "edges": matrix.user_film.nnz + matrix.user_genre.nnz,
+    }
+
+    def write(version):
+        matrix.save(version)
+        (version / MANIFEST_FILE).write_text(json.dumps(manifest))
+
+    started = time.perf_counter()
+    version = save_version(directory, write)
+    timings["save"] = time.perf_counter() - started
+    return dict(manifest, version=version.name), timings
+
+
+def _new_ids(snapshot_ids, queryset):
+    """id, добавленные после снимка; None, если часть id снимка удалена."""
+    current = np.fromiter(queryset.values_list('id', flat=True), dtype=np.int64)
+    if not np.isin(snapshot_ids, current).all():
+        return None
+    return current[~np.isin(current, snapshot_ids)]
+
+
+def _replay_deltas(watermark):
+    """Дельты взаимодействий, созданных (оценок - измененных) не раньше отметки (с запасом)."""
+    since = watermark - SNAPSHOT_REPLAY_MARGIN
+    deltas = [{"op": "add_edge", "user": user_id, "type": "film", "id": film_id}
+              for user_id, film_id in UserFilm.objects.filter(created_at__gte=since).values_list('user_id', 'film_id')]
+    deltas += [{"op": "add_edge", "user": user_id, "type": "film", "id": film_id, "score": rating}
+               for user_id, film_id, rating in Rating.objects.filter(updated_at__gte=since).values_list(
+                   'user_id', 'film_id', 'rating')]
+    deltas += [{"op": "add_edge", "user": user_id, "type": "genre", "id": genre_id}
+               for user_id, genre_id in UserGenre.objects.filter(created_at__gte=since).values_list(
+                   'user_id', 'genre_id')]
+    return deltas
+
+
+def _changes(matrix, deltas):
+    """Дельты, которые меняют матрицы: взаимодействия из запаса перед отметкой обычно уже есть в снимке."""
+    changes = []
+    for delta in deltas:
+        row = matrix.user_index.get(delta["user"])
+        col = (matrix.film_index if delta["type"] == "film" else matrix.genre_index).get(delta["id"])
+        if row is None or col is None:
+            changes.append(delta)
+        elif delta["type"] == "genre":
+            if matrix.user_genre[row, col] != 1:
+                changes.append(delta)
+        elif delta.get("score") is None:
+            if matrix.user_film[row, col] != 1:
+                changes.append(delta)
+        elif matrix.film_scores[row, col] != np.float32(delta["score"]):
+            changes.append(delta)
+    return changes
+
+
+def _rows_deleted(counts):
+    """
+    Удалены ли после снимка строки взаимодействий: удаления не дозагружаются, и снимок устаревает.
+    Строк с id не больше сохраненного наибольшего должно остаться столько же, сколько было при записи снимка;
+    одна агрегация на таблицу без сопоставления строк с матрицами.
+    """
+    for model in INTERACTION_MODELS:
+        stored = counts[model._meta.model_name]
+        current = model.objects.aggregate(count=Count('id'), new=Count('id', filter=Q(id__gt=stored["max_id"] or 0)))
+        if current["count"] - current["new"] != stored["count"]:
+            return True
+    return False
+
+
+def load_graph_snapshot(directory=None):
+    """
+    Загрузка текущей версии снимка с дозагрузкой изменений после отметки.
+    None, если снимки отключены (GRAPH_SNAPSHOT_DIR не задан), снимка нет, его формат устарел
+    или после отметки удалены узлы или взаимодействия: тогда матрицы строятся из базы данных целиком.
+    """
+    directory = directory or settings.GRAPH_SNAPSHOT_DIR
+    version = current_version(directory) if directory else None
+    if version is None:
+        return None
+    try:
+        manifest = json.loads((Path(version) / MANIFEST_FILE).read_text())
+    except FileNotFoundError:
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        logger.info("Снимок графа %s устаревшего формата, граф строится из базы данных", version.name)
+        return None
+
+    started = time.perf_counter()
+    matrix = InteractionMatrix.load(version)
+    deltas = []
+    for node_type, ids, model in (("user", matrix.user_ids, User), ("film", matrix.film_ids, Film),
+                                  ("genre", matrix.genre_ids, Genre)):
+        new_ids = _new_ids(ids, model.objects)
+        if new_ids is None:
+            logger.info("После снимка графа %s удалены узлы, граф строится из базы данных", version.name)
+            return None
+        deltas += [{"op": "add_node", "type": node_type, "id": int(pk)} for pk in new_ids]
+
+    if _rows_deleted(manifest["counts"]):
+        logger.info("После снимка графа %s удалены взаимодействия, граф строится из базы данных", version.name)
+        return None
+    if deltas:
+        matrix.apply(deltas)
+    replayed = _changes(matrix, _replay_deltas(datetime.fromisoformat(manifest["watermark"])))
+    if replayed:
+        matrix.apply(replayed)
+
+    matrix.build_stats = {
+        "snapshot": version.name,
+        "replayed": len(replayed),
+        "seconds": time.perf_counter() - started,
+        "nodes": matrix.n_users + matrix.n_films + matrix.n_genres,
+        "edges": matrix.user_film.nnz + matrix.user_genre.nnz,
+    }
+    logger.info("Матрица взаимодействий загружена из снимка %(snapshot)s: %(nodes)s узлов, %(edges)s ребер, "
+                "дозагружено %(replayed)s взаимодействий за %(seconds).3f с", matrix.build_stats)
+    return matrix
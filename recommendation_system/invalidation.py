@@ -0,0 +1,198 @@
+"""
+Шина изменений между воркерами. Структуры в памяти процесса (графы, каталоги, индекс похожих фильмов)
+обновляются сигналами моделей только в воркере, который выполнил запись; шина рассылает те же изменения
+остальным воркерам, и каждый применяет их к своим структурам без перестроения и без обращения к базе данных.
+Полученные события ставятся в очередь и выполняются в потоке запросов в начале следующего запроса
+(process_pending), а не в потоке подписки: структуры процесса не меняются во время их чтения запросом.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Канал Redis, пауза перед повторным подключением подписчика и ожидание первой подписки при подключении (с)
+INVALIDATION_CHANNEL = 'recommendation_system:invalidation'
+RECONNECT_DELAY = 1.0
+SUBSCRIBE_TIMEOUT = 5.0
+
+
+class LoopbackTransport:
+    """Транспорт внутри процесса: сообщение доставляется всем подключенным шинам. Для тестов и одного процесса."""
+
+    def __init__(self):
+        self._buses = []
+        self._lock = threading.Lock()
+
+    def connect(self, bus):
+        with self._lock:
+            if bus not in self._buses:
+                self._buses.append(bus)
+
+    def send(self, message):
+        with self._lock:
+            buses = list(self._buses)
+        for bus in buses:
+            bus.receive(message)
+
+
+class RedisTransport:
+    """
+    Транспорт через Redis Pub/Sub. Каждый воркер слушает канал в фоновом потоке и ставит сообщения
+    в очередь шины. Сообщения, отправленные, пока подписчик отключен, теряются, поэтому после каждой подписки
+    шина сбрасывает структуры процесса (resync), и они перестраиваются из базы данных при следующем обращении.
+    """
+
+    def __init__(self, url=None, channel=INVALIDATION_CHANNEL):
+        import redis
+
+        self.channel = channel
+        self._client = redis.Redis.from_url(url or settings.INVALIDATION_BUS_URL)
+
+    def connect(self, bus):
+        """
+        Запуск потока подписки и ожидание первой подписки: сброс структур после нее (resync) попадает
+        в очередь шины до того, как воркер начнет строить структуры.
+        """
+        subscribed = threading.Event()
+        threading.Thread(target=self._listen, args=(bus, subscribed), name='invalidation-bus', daemon=True).start()
+        if not subscribed.wait(SUBSCRIBE_TIMEOUT):
+            logger.warning("Подписка на шину изменений не подтверждена за %s с", SUBSCRIBE_TIMEOUT)
+
+    def send(self, message):
+        self._client.publish(self.channel, json.dumps(message))
+
+    def _listen(self, bus, subscribed):
+        pid = os.getpid()
+        while pid == os.getpid():
+            try:
+                pubsub = self._client.pubsub()
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        bus.schedule_resync()
+                        subscribed.set()
+                    elif message['type'] == 'message':
+                        bus.receive(json.loads(message['data']))
+            except Exception:
+                logger.exception("Подписка на шину изменений прервана, повтор через %s с", RECONNECT_DELAY)
+                time.sleep(RECONNECT_DELAY)
+
+
+INVALIDATION_TRANSPORTS = {
+    'loopback': LoopbackTransport,
+    'redis': RedisTransport,
+}
+
+
+class InvalidationBus:
+    """
+    Шина событий изменения данных. publish выполняет обработчики события в текущем процессе
+    и рассылает событие остальным процессам; полученные события копятся в очереди и выполняются
+    обработчиками получателя в process_pending. Обработчики идемпотентны: повтор события не меняет результат.
+    """
+
+    def __init__(self, transport=None):
+        self._transport = transport
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._reset()
+        # Воркер gunicorn после fork - отдельный получатель со своим id и своим потоком подписки
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.origin = uuid.uuid4().hex
+        self._started_pid = None
+        self._pending = queue.SimpleQueue()
+        self._send_failed = False
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            self._transport = INVALIDATION_TRANSPORTS[settings.INVALIDATION_BUS]()
+        return self._transport
+
+    def subscribe(self, event):
+        """Декоратор обработчика события: функция одного аргумента - данных события."""
+        def register(handler):
+            self._handlers.setdefault(event, []).append(handler)
+            return handler
+        return register
+
+    def start(self):
+        """Подключение процесса к транспорту, один раз на процесс."""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid != os.getpid():
+                self.transport.connect(self)
+                self._started_pid = os.getpid()
+
+    def publish(self, event, payload):
+        """Выполнение обработчиков события в процессе и рассылка остальным процессам."""
+        self._dispatch(event, payload)
+        self._send(event, payload)
+
+    def _send(self, event=None, payload=None):
+        """
+        Рассылка события. Недоступность транспорта не должна ломать запись, но потерянное событие не должно
+        пропасть молча: подписчики могут оставаться подключенными и не сбросят структуры сами. Поэтому
+        после неудачной рассылки следующая успешная начинается с события resync для остальных процессов.
+        """
+        try:
+            if self._send_failed:
+                self.transport.send({"origin": self.origin, "event": 'resync', "payload": None})
+                self._send_failed = False
+            if event is not None:
+                self.transport.send({"origin": self.origin, "event": event, "payload": payload})
+        except Exception:
+            self._send_failed = True
+            logger.exception("Не удалось разослать событие %s, остальным процессам будет разослан resync",
+                             event or 'resync')
+
+    def receive(self, message):
+        """
+        Событие другого процесса ставится в очередь; собственные события уже выполнены при публикации.
+        Вызывается из потока транспорта.
+        """
+        if message["origin"] != self.origin:
+            self._pending.put(message)
+
+    def schedule_resync(self):
+        """Сброс структур процесса при следующем process_pending. Вызывается из потока транспорта."""
+        self._pending.put({"origin": None, "event": 'resync', "payload": None})
+
+    def process_pending(self):
+        """
+        Выполнение полученных событий в текущем потоке. Вызывается в начале запроса, до чтения структур;
+        здесь же повторяется рассылка resync после неудачной отправки, не дожидаясь следующей записи.
+        """
+        if self._send_failed:
+            self._send()
+        while True:
+            try:
+                message = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._dispatch(message["event"], message["payload"])
+            except Exception:
+                logger.exception("Ошибка обработки события %s, структуры процесса сбрасываются", message["event"])
+                self.resync()
+
+    def resync(self):
+        """Сброс структур процесса: события могли быть пропущены."""
+        self._dispatch('resync', None)
+
+    def _dispatch(self, event, payload):
+        for handler in self._handlers.get(event, ()):
+            handler(payload)
+
+
+invalidation_bus = InvalidationBus()
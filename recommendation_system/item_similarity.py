@@ -0,0 +1,222 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from recommendation_system.models import Film
+from recommendation_system.scoring import rank_items
+from recommendation_system.services import get_graph_store
+
+# Количество похожих фильмов, хранимых для каждого фильма
+SIMILAR_FILMS_TOP_K = 10
+
+# Веса составляющих схожести: совместные просмотры, совместные оценки и общий жанр
+VIEW_WEIGHT = 1.0
+RATING_WEIGHT = 1.0
+GENRE_WEIGHT = 0.1
+
+# Количество фильмов, схожесть которых считается одним умножением матриц
+SIMILARITY_CHUNK_SIZE = 512
+
+
+def _film_columns(matrix):
+    """Транспонированные матрицы просмотров и оценок (фильм-пользователь), степени и нормы фильмов."""
+    def build():
+        viewed_t = matrix.user_film.T.tocsr()
+        rated_t = matrix.film_scores.T.tocsr()
+        degrees = np.diff(viewed_t.indptr)
+        norms = np.sqrt(np.asarray(rated_t.multiply(rated_t).sum(axis=1)).ravel())
+        return viewed_t, rated_t, degrees, norms
+    return matrix.derived("film_columns", build)
+
+
+def _cosine(products, norms_rows, norms):
+    """Косинусная мера для разреженных скалярных произведений строк и столбцов."""
+    products = products.tocoo()
+    denominator = norms_rows[products.row] * norms[products.col]
+    values = np.divide(products.data, denominator, out=np.zeros(len(products.data)), where=denominator > 0)
+    return products.row, products.col, values
+
+
+def similarity_rows(matrix, genres, films, k=SIMILAR_FILMS_TOP_K):
+    """
+    Top-k похожих фильмов для индексов films матрицы: косинусные меры по совместным просмотрам и оценкам
+    плюс бонус за общий жанр. Если кандидатов меньше k, список дополняется популярными фильмами того же жанра.
+    Возвращает id соседей (k столбцов, -1 - пусто) и оценки схожести.
+    """
+    viewed_t, rated_t, degrees, norms = _film_columns(matrix)
+    # Фильмы каждого жанра по убыванию популярности, при равенстве - по id
+    popular = {}
+    for genre in np.unique(genres[genres >= 0]):
+        members = np.flatnonzero(genres == genre)
+        popular[genre] = members[np.lexsort((matrix.film_ids[members], -degrees[members]))]
+
+    neighbors = np.full((len(films), k), -1, dtype=np.int64)
+    scores = np.zeros((len(films), k), dtype=np.float32)
+    for start in range(0, len(films), SIMILARITY_CHUNK_SIZE):
+        chunk = np.asarray(films[start:start + SIMILARITY_CHUNK_SIZE])
+        view_rows, view_cols, view_values = _cosine(viewed_t[chunk] @ viewed_t.T, np.sqrt(degrees[chunk]),
+                                                    np.sqrt(degrees))
+        rating_rows, rating_cols, rating_values = _cosine(rated_t[chunk] @ rated_t.T, norms[chunk], norms)
+        rows = np.concatenate([view_rows, rating_rows])
+        cols = np.concatenate([view_cols, rating_cols])
+        values = np.concatenate([VIEW_WEIGHT * view_values, RATING_WEIGHT * rating_values])
+
+        order = np.argsort(rows, kind='stable')
+        bounds = np.searchsorted(rows[order], np.arange(len(chunk) + 1))
+        for offset, film in enumerate(chunk):
+            positions = order[bounds[offset]:bounds[offset + 1]]
+            candidates, inverse = np.unique(cols[positions], return_inverse=True)
+            candidate_scores = np.bincount(inverse, weights=values[positions], minlength=len(candidates))
+            keep = (candidates != film) & (candidate_scores > 0)
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+            if genres[film] >= 0:
+                candidate_scores = candidate_scores + GENRE_WEIGHT * (genres[candidates] == genres[film])
+                if len(candidates) < k:
+                    filler = popular[genres[film]]
+                    filler = filler[(filler != film) & ~np.isin(filler, candidates)][:k - len(candidates)]
+                    candidates = np.concatenate([candidates, filler])
+                    candidate_scores = np.concatenate([candidate_scores, np.full(len(filler), GENRE_WEIGHT)])
+            ranked = rank_items(matrix.film_ids[candidates], candidate_scores, k)
+            neighbors[start + offset, :len(ranked)] = [pk for pk, _ in ranked]
+            scores[start + offset, :len(ranked)] = [score for _, score in ranked]
+    return neighbors, scores
+
+
+class ItemSimilarityIndex:
+    """
+    Предрассчитанные похожие фильмы: для каждого фильма k id соседей и оценок в двух массивах.
+    Выдача похожих фильмов - срез строки, O(k).
+    """
+
+    def __init__(self, film_ids, neighbors, scores):
+        self.film_ids = np.asarray(film_ids, dtype=np.int64)
+        self.neighbors = neighbors
+        self.scores = scores
+        self.row_index = {int(pk): row for row, pk in enumerate(self.film_ids)}
+
+    @classmethod
+    def build(cls, matrix, film_genres, k=SIMILAR_FILMS_TOP_K):
+        """Расчет соседей всех фильмов матрицы; film_genres - словарь id фильма -> id жанра."""
+        genres = cls._genre_array(matrix, film_genres)
+        neighbors, scores = similarity_rows(matrix, genres, np.arange(matrix.n_films), k)
+        return cls(matrix.film_ids, neighbors, scores)
+
+    def update(self, matrix, film_genres, film_ids):
+        """Пересчет строк фильмов film_ids; фильмы, появившиеся в матрице после построения, добавляются."""
+        new_ids = [int(pk) for pk in matrix.film_ids if int(pk) not in self.row_index]
+        film_ids = sorted({int(pk) for pk in film_ids if int(pk) in matrix.film_index} | set(new_ids))
+        if not film_ids:
+            return
+        if new_ids:
+            k = self.neighbors.shape[1]
+            self.film_ids = np.append(self.film_ids, np.asarray(new_ids, dtype=np.int64))
+            self.neighbors = np.vstack([self.neighbors, np.full((len(new_ids), k), -1, dtype=np.int64)])
+            self.scores = np.vstack([self.scores, np.zeros((len(new_ids), k), dtype=np.float32)])
+            self.row_index.update({pk: len(self.row_index) + offset for offset, pk in enumerate(new_ids)})
+
+        neighbors, scores = similarity_rows(matrix, self._genre_array(matrix, film_genres),
+                                            np.array([matrix.film_index[pk] for pk in film_ids]),
+                                            self.neighbors.shape[1])
+        rows = [self.row_index[pk] for pk in film_ids]
+        self.neighbors[rows] = neighbors
+        self.scores[rows] = scores
+
+    @staticmethod
+    def _genre_array(matrix, film_genres):
+        return np.array([film_genres.get(int(pk)) or -1 for pk in matrix.film_ids], dtype=np.int64)
+
+    def similar(self, film_id, limit=None):
+        """Похожие фильмы: пары (id, оценка) по убыванию оценки."""
+        row = self.row_index.get(int(film_id))
+        if row is None:
+            return []
+        neighbors, scores = self.neighbors[row, :limit], self.scores[row, :limit]
+        return [(int(pk), round(float(score), 6)) for pk, score in zip(neighbors, scores) if pk >= 0]
+
+
+class ItemSimilarityStore:
+    """
+    Индекс похожих фильмов процесса. Строится по матрице взаимодействий хранилища графа выбранного движка
+    (по умолчанию - из настроек) при прогреве процесса или первом обращении.
+    Изменения просмотров и оценок отмечают затронутые фильмы, их строки пересчитываются при следующем чтении;
+    если хранилище перестроило матрицу (удаление узла), индекс строится заново.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self._index = None
+        self._matrix = None
+        self._film_genres = None
+        self._dirty_films = set()
+        self._dirty_users = set()
+        self._lock = threading.RLock()
+
+    def get_index(self):
+        store = get_graph_store(self.engine)
+        with self._lock:
+            matrix = store.get_matrix()
+            if self._index is None or self._matrix is not matrix:
+                self._film_genres = dict(Film.objects.values_list('id', 'genre_id'))
+                self._index = ItemSimilarityIndex.build(matrix, self._film_genres)
+                self._matrix = matrix
+                self._dirty_films, self._dirty_users = set(), set()
+            elif self._dirty_films or self._dirty_users:
+                self._index.update(matrix, self._film_genres, self._affected_films(matrix))
+                self._dirty_films, self._dirty_users = set(), set()
+            return self._index
+
+    def _affected_films(self, matrix):
+        """Отмеченные фильмы и фильмы пользователей, чьи взаимодействия изменились: их схожесть могла измениться."""
+        films = set(self._dirty_films)
+        user_film = matrix.user_film
+        for user_id in self._dirty_users:
+            row = matrix.user_index.get(user_id)
+            if row is not None:
+                films.update(matrix.film_ids[user_film[row].indices].tolist())
+        return films
+
+    def similar(self, film_id, limit=None):
+        return self.get_index().similar(film_id, limit)
+
+    def mark_interaction(self, user_id, film_id):
+        """Изменение просмотра или оценки фильма пользователем."""
+        with self._lock:
+            if self._index is not None:
+                self._dirty_films.add(int(film_id))
+                self._dirty_users.add(int(user_id))
+
+    def film_saved(self, film_id, genre_id):
+        """Новый фильм или изменение жанра фильма."""
+        with self._lock:
+            if self._index is None:
+                return
+            if self._film_genres.get(film_id) not in (None, genre_id):
+                # Жанр входит в схожесть с остальными фильмами - индекс строится заново
+                self._index = None
+                return
+            self._film_genres[film_id] = genre_id
+            self._dirty_films.add(film_id)
+
+    def reset(self):
+        with self._lock:
+            self._index = self._matrix = self._film_genres = None
+            self._dirty_films, self._dirty_users = set(), set()
+
+
+item_similarity_store = ItemSimilarityStore()
+
+
+def get_similar_films(film_id, limit=SIMILAR_FILMS_TOP_K):
+    """
+    Похожие фильмы: пары (id, оценка). При включенном приближенном поиске - ближайшие векторы фильмов модели
+    факторизации, иначе (и для фильмов, которых нет в модели) - предрассчитанный индекс схожести.
+    """
+    if settings.ANN_SEARCH:
+        # Модель факторизации и ее зависимости загружаются, только если включен приближенный поиск
+        from recommendation_system.factorization import similar_films
+
+        films = similar_films(film_id, limit)
+        if films is not None:
+            return films
+    return item_similarity_store.similar(film_id, limit)
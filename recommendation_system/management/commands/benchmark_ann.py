@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+from django.core.management import BaseCommand, CommandError
+
+from recommendation_system.ann import IVFIndex, normalize
+from recommendation_system.factorization import get_factor_model
+from recommendation_system.scoring import rank_items
+
+
+def synthetic_vectors(n_vectors, dim, n_clusters, seed):
+    """Случайные векторы вокруг n_clusters центров: векторы моделей факторизации тоже сгруппированы."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    return centers[rng.integers(0, n_clusters, size=n_vectors)] + rng.normal(scale=0.5, size=(n_vectors, dim))
+
+
+def exact_search(ids, vectors, query, k):
+    """Точный поиск: сравнение запроса со всеми нормированными векторами."""
+    return rank_items(ids, vectors @ normalize(query), k)
+
+
+class Command(BaseCommand):
+    help = "Сравнение приближенного поиска ближайших векторов (IVF) с точным поиском: полнота и время запроса"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--dim', type=int, default=32)
+        parser.add_argument('--clusters', type=int, default=200, help="Количество групп синтетических векторов")
+        parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+        parser.add_argument('--queries', type=int, default=100, help="Количество запросов на размер")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--model', action='store_true',
+                            help="Векторы фильмов обученной модели факторизации вместо синтетических")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['model']:
+            model = get_factor_model()
+            if model is None:
+                raise CommandError("Модель не обучена: запустите train_factorization")
+            datasets = [(model.film_ids, np.asarray(model.film_factors))]
+        else:
+            datasets = [(np.arange(1, size + 1), synthetic_vectors(size, options['dim'], options['clusters'],
+                                                                   options['seed']))
+                        for size in options['sizes']]
+
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        for ids, vectors in datasets:
+            started = time.perf_counter()
+            index = IVFIndex.build(ids, vectors)
+            build_seconds = time.perf_counter() - started
+            queries = normalize(vectors[rng.integers(0, len(ids), size=options['queries'])])
+            normalized = normalize(vectors)
+
+            started = time.perf_counter()
+            exact = [{pk for pk, _ in exact_search(ids, normalized, query, k)} for query in queries]
+            exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{len(ids)} векторов, {index.n_lists} кластеров, построение {build_seconds:.2f} с, "
+                f"точный поиск {exact_ms:.3f} мс"))
+            self.stdout.write(f"{'n_probe':>8} {'мс':>9} {f'recall@{k}':>10}")
+            for n_probe in options['n_probe']:
+                started = time.perf_counter()
+                found = [{pk for pk, _ in index.search(query, k, n_probe)} for query in queries]
+                ann_ms = (time.perf_counter() - started) * 1000 / len(queries)
+                recall = np.mean([len(approximate & expected) / len(expected)
+                                  for approximate, expected in zip(found, exact) if expected])
+                self.stdout.write(f"{n_probe:>8} {ann_ms:>9.3f} {recall:>10.3f}")
@@ -0,0 +1,78 @@
+import time
+
+import networkx as nx
+import numpy as np
+from django.core.management import BaseCommand
+
+from recommendation_system.services import RecommendationSystem
+from recommendation_system.sparse_engine import InteractionMatrix, SparseRecommendationSystem
+
+
+def synthetic_interactions(n_users, items_per_user, users_per_item, seed):
+    """Случайные взаимодействия с постоянной средней степенью объектов: каталог растет вместе с пользователями."""
+    rng = np.random.default_rng(seed)
+    n_films = max(1, n_users * items_per_user // users_per_item)
+    users = np.repeat(np.arange(1, n_users + 1), items_per_user)
+    films = rng.integers(1, n_films + 1, size=len(users))
+    return n_films, np.column_stack([users, films])
+
+
+class Command(BaseCommand):
+    help = "Замер времени поиска ближайших соседей при росте числа пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+        parser.add_argument('--queries', type=int, default=50, help="Количество запросов на размер графа")
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--items-per-user', type=int, default=10)
+        parser.add_argument('--users-per-item', type=int, default=20)
+        parser.add_argument('--legacy', action='store_true',
+                            help="Также замерить прежний алгоритм (shortest_path_length для каждого пользователя)")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        header = f"{'users':>8} {'edges':>9} {'networkx, мс':>14} {'sparse, мс':>12}"
+        if options['legacy']:
+            header += f" {'прежний, мс':>13}"
+        self.stdout.write(header)
+
+        for n_users in options['sizes']:
+            n_films, edges = synthetic_interactions(n_users, options['items_per_user'], options['users_per_item'],
+                                                    options['seed'])
+            graph = nx.Graph()
+            graph.add_nodes_from((f"user_{pk}" for pk in range(1, n_users + 1)), type='user')
+            graph.add_nodes_from((f"film_{pk}" for pk in range(1, n_films + 1)), type='film')
+            graph.add_edges_from((f"user_{user}", f"film_{film}") for user, film in edges)
+            matrix = InteractionMatrix.from_edges(np.arange(1, n_users + 1), np.arange(1, n_films + 1), [], edges)
+            matrix.interactions_t  # построение производных структур не входит в замер
+
+            users = rng.integers(1, n_users + 1, size=options['queries']).tolist()
+            networkx_ms = self._measure(RecommendationSystem.k_nearest_neighbors, graph, users, options['k'])
+            sparse_ms = self._measure(SparseRecommendationSystem.k_nearest_neighbors, matrix, users, options['k'])
+            row = f"{n_users:>8} {len(edges):>9} {networkx_ms:>14.3f} {sparse_ms:>12.3f}"
+            if options['legacy']:
+                row += f" {self._measure(self._legacy_knn, graph, users[:3], options['k']):>13.3f}"
+            self.stdout.write(row)
+
+    @staticmethod
+    def _measure(method, structure, users, k):
+        """Среднее время одного запроса в миллисекундах."""
+        started = time.perf_counter()
+        for user_id in users:
+            method(structure, user_id, k)
+        return (time.perf_counter() - started) * 1000 / len(users)
+
+    @staticmethod
+    def _legacy_knn(graph, user_id, k):
+        """Прежняя реализация: кратчайший путь до каждого пользователя графа."""
+        user_node = f"user_{user_id}"
+        distances = []
+        for other_node in graph.nodes():
+            if other_node != user_node and graph.nodes[other_node].get('type') == 'user':
+                try:
+                    distances.append((other_node, nx.shortest_path_length(graph, user_node, other_node)))
+                except nx.NetworkXNoPath:
+                    continue
+        distances.sort(key=lambda x: x[1])
+        return distances[:k]
@@ -0,0 +1,33 @@
+import time
+
+import schedule
+from django.core.management import BaseCommand
+
+from recommendation_system.rollups import compact_statistics
+
+
+class Command(BaseCommand):
+    help = "Сжатие статистики рекомендаций в почасовые и ежедневные агрегаты и удаление старых записей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help="Сколько дней хранить учтенные записи статистики")
+        parser.add_argument('--loop', action='store_true', help="Запускать сжатие по расписанию")
+        parser.add_argument('--interval', type=int, default=60, help="Интервал сжатия в минутах")
+
+    def handle(self, *args, **options):
+        self.compact(options['retention_days'])
+        if not options['loop']:
+            return
+
+        schedule.every(options['interval']).minutes.do(self.compact, retention_days=options['retention_days'])
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+
+    def compact(self, retention_days):
+        started = time.perf_counter()
+        result = compact_statistics(retention_days)
+        self.stdout.write(self.style.SUCCESS(
+            f"Сжато {result['compacted']} записей статистики, удалено {result['deleted']} "
+            f"за {time.perf_counter() - started:.2f} с"))
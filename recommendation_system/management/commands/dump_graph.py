@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from recommendation_system.graph_snapshot import write_graph_snapshot
+
+
+class Command(BaseCommand):
+    help = "Запись снимка графа предпочтений, который воркеры отображают в память вместо построения из базы данных"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Каталог снимков, по умолчанию GRAPH_SNAPSHOT_DIR")
+
+    def handle(self, *args, **options):
+        manifest, timings = write_graph_snapshot(options['directory'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {manifest['version']} записан: {manifest['users']} пользователей, {manifest['films']} фильмов, "
+            f"{manifest['genres']} жанров, {manifest['edges']} ребер"))
+        self.stdout.write(f"  отметка времени: {manifest['watermark']}")
+        self.stdout.write(f"  построение матрицы: {timings['build']:.2f} с")
+        self.stdout.write(f"  сохранение: {timings['save']:.2f} с")
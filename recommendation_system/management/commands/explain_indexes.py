@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from recommendation_system.models import Rating, RecommendationStatistics, UserFilm, UserGenre
+
+# Модели, индексы которых сравниваются (все индексы из Meta.indexes)
+INDEXED_MODELS = (UserFilm, Rating, UserGenre, RecommendationStatistics)
+
+
+# Сколько DROP INDEX ждет блокировку таблицы на PostgreSQL: ожидающий DROP INDEX блокирует и все следующие запросы
+LOCK_TIMEOUT = '2s'
+
+
+def sample_id(model, field, using):
+    """Существующее значение поля для подстановки в запросы, 0 - если таблица пуста."""
+    return model.objects.using(using).values_list(field, flat=True).first() or 0
+
+
+def access_pattern_queries(using='default'):
+    """Запросы системы рекомендаций, для которых добавлены индексы."""
+    user_id = sample_id(Rating, 'user_id', using) or sample_id(UserFilm, 'user_id', using)
+    film_id = sample_id(UserFilm, 'film_id', using)
+    since = timezone.now() - timedelta(hours=1)
+    queries = [
+        ("Статистика пользователя по времени",
+         RecommendationStatistics.objects.filter(user_id=user_id).order_by('-timestamp')),
+        ("Пользователи фильма", UserFilm.objects.filter(film_id=film_id).values_list('user_id', flat=True)),
+        ("Оценки фильма", Rating.objects.filter(film_id=film_id).values_list('user_id', 'rating')),
+        ("Пользователи жанра", UserGenre.objects.filter(genre_id=sample_id(UserGenre, 'genre_id', using))
+         .values_list('user_id', flat=True)),
+        ("Просмотры после момента времени", UserFilm.objects.filter(created_at__gte=since)
+         .values_list('user_id', 'film_id')),
+        ("Оценки после момента времени", Rating.objects.filter(created_at__gte=since)
+         .values_list('user_id', 'film_id', 'rating')),
+        ("Оценки пользователя", Rating.objects.filter(user_id=user_id).values_list('film_id', 'rating')),
+    ]
+    return [(title, queryset.using(using)) for title, queryset in queries]
+
+
+def explain(queryset, phase, **options):
+    """
+    План выполнения запроса. Комментарий с этапом делает текст запроса уникальным:
+    SQLite кэширует подготовленные запросы по тексту и иначе вернул бы план до удаления индексов.
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{connection.ops.explain_query_prefix(**options)} {sql} /* {phase} */", params)
+        return "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+
+
+class Command(BaseCommand):
+    help = ("Планы выполнения запросов системы рекомендаций без индексов из Meta.indexes и с ними. "
+            "Не для рабочей базы данных: запускайте на копии (--database)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help="Псевдоним базы данных из DATABASES, например копии рабочей базы")
+        parser.add_argument('--analyze', action='store_true',
+                            help="EXPLAIN ANALYZE для планов с индексами: выполнить запросы и показать фактическое "
+                                 "время (PostgreSQL)")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        options_explain = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        queries = access_pattern_queries(using)
+
+        after = [explain(query, 'after', **options_explain) for _, query in queries]
+        # Индексы удаляются внутри транзакции, которая затем откатывается: схема базы данных не меняется.
+        # DDL в транзакции поддерживают PostgreSQL и SQLite. До отката таблицы заблокированы (ACCESS EXCLUSIVE),
+        # поэтому планы без индексов строятся без ANALYZE - запросы не выполняются, и транзакция короткая
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                for model in INDEXED_MODELS:
+                    for index in model._meta.indexes:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+            before = [explain(query, 'before') for _, query in queries]
+            transaction.set_rollback(True, using=using)
+
+        for (title, _), plan_before, plan_after in zip(queries, before, after):
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write("  без индексов:")
+            self.stdout.write(self._indent(plan_before))
+            self.stdout.write("  с индексами:")
+            self.stdout.write(self._indent(plan_after))
+
+    @staticmethod
+    def _indent(plan):
+        return "\n".join(f"    {line}" for line in plan.splitlines())
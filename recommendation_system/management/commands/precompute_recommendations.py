@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from recommendation_system.precompute import PRECOMPUTE_CHUNK_SIZE, precompute_recommendations
+
+
+class Command(BaseCommand):
+    help = "Пересчет рекомендаций всех пользователей в пуле процессов с общими матрицами в памяти"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Количество процессов пула, по умолчанию - число процессоров")
+        parser.add_argument('--chunk-size', type=int, default=PRECOMPUTE_CHUNK_SIZE,
+                            help="Количество пользователей в одной задаче процесса пула")
+
+    def handle(self, *args, **options):
+        result = precompute_recommendations(options['workers'], options['chunk_size'])
+        timings = result["timings"]
+        total = sum(timings.values())
+        for phase in ("build", "dump", "compute", "write"):
+            self.stdout.write(f"{phase:>8}: {timings[phase]:.3f} с")
+        rate = result["users"] / total if total else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитаны рекомендации {result['users']} пользователей за {total:.3f} с ({rate:.1f} польз./с)"))
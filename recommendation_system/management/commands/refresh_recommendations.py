@@ -0,0 +1,32 @@
+import time
+
+import schedule
+from django.core.management import BaseCommand
+
+from recommendation_system.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = "Пересчет снимков рекомендаций пользователей, чья окрестность изменилась"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Пересчитать рекомендации всех пользователей")
+        parser.add_argument('--loop', action='store_true', help="Запускать пересчет по расписанию")
+        parser.add_argument('--interval', type=int, default=10, help="Интервал пересчета в минутах")
+        parser.add_argument('--engine', default=None, help="Реализация системы рекомендаций")
+
+    def handle(self, *args, **options):
+        self.refresh(options['full'], options['engine'])
+        if not options['loop']:
+            return
+
+        schedule.every(options['interval']).minutes.do(self.refresh, full=False, engine=options['engine'])
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+
+    def refresh(self, full, engine):
+        started = time.perf_counter()
+        count = refresh_snapshots(full=full, engine=engine)
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитаны рекомендации {count} пользователей за {time.perf_counter() - started:.2f} с"))
@@ -0,0 +1,44 @@
+from django.core.management import BaseCommand
+
+from recommendation_system.factorization import CONFIDENCE_ALPHA, EVALUATION_K, FACTORS, HOLDOUT_FRACTION, \
+    ITERATIONS, REGULARIZATION, evaluate, train_factor_model
+from recommendation_system.models import Film
+from recommendation_system.sparse_engine import InteractionMatrix
+
+
+class Command(BaseCommand):
+    help = "Обучение модели матричной факторизации по просмотрам и оценкам и офлайн-оценка качества"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=FACTORS, help="Размерность векторов")
+        parser.add_argument('--regularization', type=float, default=REGULARIZATION)
+        parser.add_argument('--iterations', type=int, default=ITERATIONS)
+        parser.add_argument('--alpha', type=float, default=CONFIDENCE_ALPHA, help="Вес уверенности взаимодействий")
+        parser.add_argument('--evaluate', action='store_true',
+                            help="Сравнить precision@k и recall@k с методом по графу на скрытых взаимодействиях")
+        parser.add_argument('--k', type=int, default=EVALUATION_K)
+        parser.add_argument('--holdout', type=float, default=HOLDOUT_FRACTION,
+                            help="Доля скрываемых фильмов каждого пользователя")
+
+    def handle(self, *args, **options):
+        params = {
+            'factors': options['factors'],
+            'regularization': options['regularization'],
+            'iterations': options['iterations'],
+            'alpha': options['alpha'],
+        }
+        model, timings = train_factor_model(**params)
+        self.stdout.write(self.style.SUCCESS(
+            f"Модель обучена: {len(model.user_ids)} пользователей, {len(model.film_ids)} фильмов"))
+        self.stdout.write(f"  построение матрицы: {timings['build']:.2f} с")
+        self.stdout.write(f"  обучение: {timings['train']:.2f} с")
+        self.stdout.write(f"  сохранение: {timings['save']:.2f} с")
+
+        if options['evaluate']:
+            k = options['k']
+            results = evaluate(InteractionMatrix.from_database(), dict(Film.objects.values_list('id', 'genre_id')),
+                               k=k, fraction=options['holdout'], **params)
+            self.stdout.write(f"Оценка на скрытых взаимодействиях {results['users']} пользователей:")
+            for name, title in (('graph', "граф"), ('mf', "факторизация")):
+                self.stdout.write(f"  {title}: precision@{k} {results[name]['precision']:.4f}, "
+                                  f"recall@{k} {results[name]['recall']:.4f}")
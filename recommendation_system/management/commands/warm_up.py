@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from recommendation_system.services import RECOMMENDATION_ENGINES
+from recommendation_system.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "Прогрев структур рекомендаций и отчет о времени этапов (время готовности воркера)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=RECOMMENDATION_ENGINES,
+                            help="Движок рекомендаций, по умолчанию RECOMMENDATION_ENGINE")
+
+    def handle(self, *args, **options):
+        timings = warm_up(options['engine'])
+        self.stdout.write(self.style.SUCCESS(f"Прогрев выполнен за {timings['total']:.3f} с"))
+        for name, title in (('import', "импорт движка"), ('graph', "граф предпочтений"), ('pagerank', "PageRank"),
+                            ('similar_films', "похожие фильмы"), ('catalog', "каталог фильмов и жанров")):
+            self.stdout.write(f"  {title}: {timings[name]:.3f} с")
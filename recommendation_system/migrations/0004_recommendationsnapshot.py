@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendation_system", "0003_recommendationstatistics"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecommendationSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "films",
+                    models.JSONField(
+                        default=list, verbose_name="Рекомендованные фильмы (id)"
+                    ),
+                ),
+                (
+                    "genres",
+                    models.JSONField(
+                        default=list, verbose_name="Рекомендованные жанры (id)"
+                    ),
+                ),
+                (
+                    "top",
+                    models.JSONField(
+                        default=dict, verbose_name="Топ фильмов и жанров (id)"
+                    ),
+                ),
+                (
+                    "computed_at",
+                    models.DateTimeField(verbose_name="Версия: время расчета"),
+                ),
+                (
+                    "changed_at",
+                    models.DateTimeField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Время изменения предпочтений",
+                    ),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recommendation_snapshot",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Снимок рекомендаций",
+                "verbose_name_plural": "Снимки рекомендаций",
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+def delete_snapshots(apps, schema_editor):
+    # Снимки прежнего формата (только id) пересчитываются командой refresh_recommendations
+    apps.get_model("recommendation_system", "RecommendationSnapshot").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendation_system", "0004_recommendationsnapshot"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recommendationsnapshot",
+            name="films",
+            field=models.JSONField(
+                default=list, verbose_name="Рекомендованные фильмы (id, оценка)"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recommendationsnapshot",
+            name="genres",
+            field=models.JSONField(
+                default=list, verbose_name="Рекомендованные жанры (id, оценка)"
+            ),
+        ),
+        migrations.RunPython(delete_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendation_system", "0005_scored_recommendation_snapshots"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recommendationstatistics",
+            name="timestamp",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
@@ -0,0 +1,198 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendation_system", "0006_statistics_timestamp_default"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatisticsCompaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "last_id",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Последняя учтенная запись"
+                    ),
+                ),
+                (
+                    "compacted_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время сжатия"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Отметка сжатия статистики",
+                "verbose_name_plural": "Отметки сжатия статистики",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period_start", models.DateTimeField(verbose_name="Начало периода")),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Количество рекомендаций"
+                    ),
+                ),
+                (
+                    "film_count_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма количества фильмов"
+                    ),
+                ),
+                (
+                    "film_count_min",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Минимум фильмов"
+                    ),
+                ),
+                (
+                    "film_count_max",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Максимум фильмов"
+                    ),
+                ),
+                (
+                    "genre_count_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма количества жанров"
+                    ),
+                ),
+                (
+                    "genre_count_min",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Минимум жанров"
+                    ),
+                ),
+                (
+                    "genre_count_max",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Максимум жанров"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ежедневная статистика рекомендаций",
+                "verbose_name_plural": "Ежедневная статистика рекомендаций",
+                "ordering": ("-period_start",),
+                "abstract": False,
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "period_start"), name="unique_daily_statistics"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="HourlyStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period_start", models.DateTimeField(verbose_name="Начало периода")),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Количество рекомендаций"
+                    ),
+                ),
+                (
+                    "film_count_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма количества фильмов"
+                    ),
+                ),
+                (
+                    "film_count_min",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Минимум фильмов"
+                    ),
+                ),
+                (
+                    "film_count_max",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Максимум фильмов"
+                    ),
+                ),
+                (
+                    "genre_count_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма количества жанров"
+                    ),
+                ),
+                (
+                    "genre_count_min",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Минимум жанров"
+                    ),
+                ),
+                (
+                    "genre_count_max",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Максимум жанров"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Почасовая статистика рекомендаций",
+                "verbose_name_plural": "Почасовая статистика рекомендаций",
+                "ordering": ("-period_start",),
+                "abstract": False,
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "period_start"), name="unique_hourly_statistics"
+                    )
+                ],
+            },
+        ),
+    ]
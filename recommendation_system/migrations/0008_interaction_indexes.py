@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+from recommendation_system.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # Индексы больших таблиц создаются без блокировки записи (CREATE INDEX CONCURRENTLY вне транзакции)
+    atomic = False
+
+    dependencies = [
+        ("recommendation_system", "0007_statistics_rollups"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name="rating",
+            index=models.Index(fields=["film", "user"], name="rating_film_user_idx"),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="rating",
+            index=models.Index(fields=["created_at"], name="rating_created_at_idx"),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="rating",
+            index=models.Index(
+                fields=["user", "film"],
+                include=("rating",),
+                name="rating_user_film_cover_idx",
+            ),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="recommendationstatistics",
+            index=models.Index(
+                fields=["user", "timestamp"], name="statistics_user_time_idx"
+            ),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="userfilm",
+            index=models.Index(fields=["film", "user"], name="userfilm_film_user_idx"),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="userfilm",
+            index=models.Index(fields=["created_at"], name="userfilm_created_at_idx"),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="usergenre",
+            index=models.Index(
+                fields=["genre", "user"], name="usergenre_genre_user_idx"
+            ),
+        ),
+    ]
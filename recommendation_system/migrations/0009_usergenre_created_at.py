@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from recommendation_system.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # Индекс большой таблицы создается без блокировки записи (CREATE INDEX CONCURRENTLY вне транзакции)
+    atomic = False
+
+    dependencies = [
+        ("recommendation_system", "0008_interaction_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usergenre",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="usergenre",
+            index=models.Index(fields=["created_at"], name="usergenre_created_at_idx"),
+        ),
+    ]
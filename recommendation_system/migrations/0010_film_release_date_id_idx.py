@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+from recommendation_system.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # Индекс большой таблицы создается без блокировки записи (CREATE INDEX CONCURRENTLY вне транзакции)
+    atomic = False
+
+    dependencies = [
+        ("recommendation_system", "0009_usergenre_created_at"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name="film",
+            index=models.Index(fields=["release_date", "id"], name="film_release_date_id_idx"),
+        ),
+    ]
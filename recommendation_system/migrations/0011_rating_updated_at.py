@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from recommendation_system.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    # Индекс большой таблицы создается без блокировки записи (CREATE INDEX CONCURRENTLY вне транзакции)
+    atomic = False
+
+    dependencies = [
+        ("recommendation_system", "0010_film_release_date_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rating",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name="rating",
+            index=models.Index(fields=["updated_at"], name="rating_updated_at_idx"),
+        ),
+    ]
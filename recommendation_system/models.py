@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
@@ -34,6 +35,10 @@ class Film(models.Model):
     class Meta:
         verbose_name = "Фильм"
         verbose_name_plural = "Фильмы"
+        indexes = [
+            # Пагинация каталога на главной странице по ключу (release_date, id)
+            models.Index(fields=['release_date', 'id'], name='film_release_date_id_idx'),
+        ]
 
 
 class UserFilm(models.Model):
@@ -46,6 +51,11 @@ class UserFilm(models.Model):
         verbose_name = "Просмотр фильма пользователем"
         verbose_name_plural = "Просмотры фильма пользователя"
         unique_together = ('user', 'film')  # Обеспечить уникальность предпочтения для каждого пользователя и фильма
+        indexes = [
+            # Обратный поиск пользователей фильма (соседи по фильму) и выборка изменений после момента времени
+            models.Index(fields=['film', 'user'], name='userfilm_film_user_idx'),
+            models.Index(fields=['created_at'], name='userfilm_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - посмотрел - {self.film.title}"
@@ -57,11 +67,20 @@ class Rating(models.Model):
     film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='ratings')
     rating = models.FloatField(verbose_name="Оценка фильма")  # Оценка, например, от 1 до 10
     created_at = models.DateTimeField(auto_now_add=True)  # Время, когда была оставлена оценка
+    updated_at = models.DateTimeField(auto_now=True)  # Время последнего изменения оценки
 
     class Meta:
         verbose_name = "Рейтинг"
         verbose_name_plural = "Рейтинги"
         unique_together = ('user', 'film')  # Пользователь может оценить фильм только один раз
+        indexes = [
+            models.Index(fields=['film', 'user'], name='rating_film_user_idx'),
+            models.Index(fields=['created_at'], name='rating_created_at_idx'),
+            models.Index(fields=['updated_at'], name='rating_updated_at_idx'),
+            # Оценки пользователя читаются только из индекса; INCLUDE поддерживается PostgreSQL,
+            # в остальных базах данных индекс создается без него
+            models.Index(fields=['user', 'film'], include=['rating'], name='rating_user_film_cover_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} оценил {self.film.title} на {self.rating}"
@@ -71,9 +90,14 @@ class UserGenre(models.Model):
     """Модель связи пользователя и жанра фильмов"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorite_genres')
     genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='liked_by_users')
+    created_at = models.DateTimeField(auto_now_add=True)  # Время добавления жанра
 
     class Meta:
         unique_together = ('user', 'genre')
+        indexes = [
+            models.Index(fields=['genre', 'user'], name='usergenre_genre_user_idx'),
+            models.Index(fields=['created_at'], name='usergenre_created_at_idx'),
+        ]
         verbose_name = "Жанр пользователя"
         verbose_name_plural = "Жанры пользователя"
 
@@ -88,7 +112,8 @@ class RecommendationStatistics(models.Model):
                                              default=0)
     genre_count = models.PositiveIntegerField(verbose_name="Количество рекомендованных жанров", null=True, blank=True,
                                               default=0)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Время выдачи задается при создании объекта: записи сохраняются из буфера позже
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f"Статистика {self.user} создана {self.timestamp}"
@@ -96,3 +121,89 @@ class RecommendationStatistics(models.Model):
     class Meta:
         verbose_name = 'Статистика рекомендаций'
         verbose_name_plural = 'Статистики рекомендаций'
+        indexes = [
+            # Статистика пользователя по времени выдачи
+            models.Index(fields=['user', 'timestamp'], name='statistics_user_time_idx'),
+        ]
+
+
+class RecommendationSnapshot(models.Model):
+    """Модель предрассчитанных рекомендаций пользователя."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation_snapshot',
+                                verbose_name="Пользователь")
+    films = models.JSONField(default=list, verbose_name="Рекомендованные фильмы (id, оценка)")
+    genres = models.JSONField(default=list, verbose_name="Рекомендованные жанры (id, оценка)")
+    top = models.JSONField(default=dict, verbose_name="Топ фильмов и жанров (id)")
+    computed_at = models.DateTimeField(verbose_name="Версия: время расчета")
+    changed_at = models.DateTimeField(null=True, blank=True, verbose_name="Время изменения предпочтений")
+
+    def __str__(self):
+        return f"Рекомендации {self.user} рассчитаны {self.computed_at}"
+
+    @property
+    def is_stale(self):
+        """Предпочтения пользователя изменились после расчета."""
+        return self.changed_at is not None and self.changed_at > self.computed_at
+
+    class Meta:
+        verbose_name = 'Снимок рекомендаций'
+        verbose_name_plural = 'Снимки рекомендаций'
+
+
+class StatisticsRollup(models.Model):
+    """Агрегат статистики рекомендаций пользователя за период: количество выдач, сумма, минимум и максимум."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    period_start = models.DateTimeField(verbose_name="Начало периода")
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество рекомендаций")
+    film_count_sum = models.PositiveBigIntegerField(default=0, verbose_name="Сумма количества фильмов")
+    film_count_min = models.PositiveIntegerField(null=True, blank=True, verbose_name="Минимум фильмов")
+    film_count_max = models.PositiveIntegerField(null=True, blank=True, verbose_name="Максимум фильмов")
+    genre_count_sum = models.PositiveBigIntegerField(default=0, verbose_name="Сумма количества жанров")
+    genre_count_min = models.PositiveIntegerField(null=True, blank=True, verbose_name="Минимум жанров")
+    genre_count_max = models.PositiveIntegerField(null=True, blank=True, verbose_name="Максимум жанров")
+
+    @property
+    def film_count_avg(self):
+        return self.film_count_sum / self.count if self.count else 0
+
+    @property
+    def genre_count_avg(self):
+        return self.genre_count_sum / self.count if self.count else 0
+
+    def __str__(self):
+        return f"Статистика {self.user} за {self.period_start}"
+
+    class Meta:
+        abstract = True
+        ordering = ('-period_start',)
+
+
+class HourlyStatistics(StatisticsRollup):
+    """Модель почасовой статистики рекомендаций."""
+
+    class Meta(StatisticsRollup.Meta):
+        verbose_name = 'Почасовая статистика рекомендаций'
+        verbose_name_plural = 'Почасовая статистика рекомендаций'
+        constraints = [models.UniqueConstraint(fields=['user', 'period_start'], name='unique_hourly_statistics')]
+
+
+class DailyStatistics(StatisticsRollup):
+    """Модель ежедневной статистики рекомендаций."""
+
+    class Meta(StatisticsRollup.Meta):
+        verbose_name = 'Ежедневная статистика рекомендаций'
+        verbose_name_plural = 'Ежедневная статистика рекомендаций'
+        constraints = [models.UniqueConstraint(fields=['user', 'period_start'], name='unique_daily_statistics')]
+
+
+class StatisticsCompaction(models.Model):
+    """Отметка сжатия статистики: записи с id не больше last_id уже учтены в агрегатах."""
+    last_id = models.PositiveBigIntegerField(default=0, verbose_name="Последняя учтенная запись")
+    compacted_at = models.DateTimeField(null=True, blank=True, verbose_name="Время сжатия")
+
+    def __str__(self):
+        return f"Статистика сжата до записи {self.last_id}"
+
+    class Meta:
+        verbose_name = 'Отметка сжатия статистики'
+        verbose_name_plural = 'Отметки сжатия статистики'
@@ -0,0 +1,151 @@
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+import numpy as np
+
+
+def pagerank(adjacency, alpha=0.85, max_iter=100, tol=1.0e-6, start=None):
+    """
+    Степенной метод PageRank над разреженной матрицей смежности.
+    Совпадает с nx.pagerank: висячие узлы распределяют вес равномерно, сходимость по норме L1 < N * tol.
+    start - начальный вектор (теплый старт от предыдущего результата).
+    """
+    # scipy загружается при первом расчете, а не при импорте модуля
+    from scipy import sparse
+
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.empty(0)
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    inverse = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    transition_t = (sparse.diags(inverse) @ adjacency).T.tocsr()
+
+    x = np.full(n, 1.0 / n) if start is None else np.asarray(start, dtype=np.float64) / np.sum(start)
+    for _ in range(max_iter):
+        previous = x
+        x = alpha * (transition_t @ previous + previous[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x - previous).sum() < n * tol:
+            return x
+    raise RuntimeError(f"PageRank не сошелся за {max_iter} итераций")
+
+
+def top_k_indices(scores, k):
+    """Индексы k наибольших значений по убыванию: частичный отбор argpartition вместо полной сортировки."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def forward_push(indptr, indices, seeds, alpha=0.85, tolerance=1.0e-4, estimate=None, residual=None):
+    """
+    Персонализированный PageRank локальным проталкиванием (forward push, Andersen-Chung-Lang).
+    seeds - словарь {узел: вес} начального распределения (сумма 1), alpha - вероятность продолжить блуждание.
+    Узел с остатком больше tolerance * степень переносит (1 - alpha) остатка в оценку, остальное поровну
+    раздает соседям. Обрабатываются только узлы, до которых дошел остаток: стоимость зависит от окрестности
+    начальных узлов и tolerance, а не от размера графа.
+    estimate, residual - результат предыдущего расчета с большим tolerance для продолжения проталкивания.
+    Возвращает словари оценок и остатков и количество проталкиваний.
+    """
+    estimate = dict(estimate) if estimate is not None else {}
+    residual = dict(residual) if residual is not None else dict(seeds)
+
+    def threshold(node):
+        return tolerance * (indptr[node + 1] - indptr[node])
+
+    queue = deque(node for node, value in residual.items() if value > threshold(node))
+    queued = set(queue)
+    pushes = 0
+    while queue:
+        node = queue.popleft()
+        queued.discard(node)
+        mass = residual[node]
+        start, end = indptr[node], indptr[node + 1]
+        residual[node] = 0.0
+        if start == end:
+            # Висячий узел: остаток целиком переходит в оценку
+            estimate[node] = estimate.get(node, 0.0) + mass
+            continue
+        estimate[node] = estimate.get(node, 0.0) + (1 - alpha) * mass
+        share = alpha * mass / (end - start)
+        pushes += 1
+        for neighbor in indices[start:end].tolist():
+            value = residual.get(neighbor, 0.0) + share
+            residual[neighbor] = value
+            if neighbor not in queued and value > threshold(neighbor):
+                queue.append(neighbor)
+                queued.add(neighbor)
+    return estimate, residual, pushes
+
+
+class PageRankCache:
+    """
+    Кэш результата PageRank с отметкой версии графа.
+    При изменении версии результат пересчитывается с теплым стартом от предыдущего вектора.
+    """
+
+    def __init__(self):
+        self._structure = None
+        self._version = None
+        self._result = None
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def get(self, structure, version, compute):
+        """
+        Возвращает результат для структуры графа заданной версии.
+        compute(previous) должна вернуть пару (результат, данные для следующего теплого старта).
+        """
+        if not self._is_current(structure, version):
+            with self._lock:
+                if not self._is_current(structure, version):
+                    self._result, self._previous = compute(self._previous)
+                    self._structure = weakref.ref(structure)
+                    self._version = version
+        return self._result
+
+    def _is_current(self, structure, version):
+        return self._structure is not None and self._structure() is structure and self._version == version
+
+    def clear(self):
+        with self._lock:
+            self._structure = self._version = self._result = self._previous = None
+
+
+class PersonalizedPageRankCache:
+    """
+    Кэш оценок и остатков персонализированного PageRank по ключу (пользователю), LRU на max_entries записей.
+    Запись действительна для той же структуры графа той же версии. Запрос с меньшим tolerance продолжает
+    проталкивание от сохраненных остатков, с большим или равным - использует сохраненные оценки.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, structure, version, tolerance, compute):
+        """compute(estimate, residual) должна вернуть оценки и остатки для tolerance; None - расчет с начала."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is structure and entry[1] == version:
+                self._entries.move_to_end(key)
+                if entry[2] <= tolerance:
+                    return entry[3]
+                previous = entry[3:]
+            else:
+                previous = (None, None)
+        estimate, residual = compute(*previous)
+        with self._lock:
+            self._entries[key] = (weakref.ref(structure), version, tolerance, estimate, residual)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return estimate
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
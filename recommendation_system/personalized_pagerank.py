@@ -0,0 +1,85 @@
+"""
+Рекомендации по персонализированному PageRank: случайное блуждание по графу предпочтений,
+перезапускаемое с фильмов и жанров пользователя. Оценки считаются локальным проталкиванием по матрице
+взаимодействий хранилища графа движка из настроек (та же матрица, что у индекса похожих фильмов),
+остатки кэшируются по пользователю до изменения графа.
+Модуль движка на разреженных матрицах импортируется при первом расчете: кэш остатков нужен обработчикам
+сигналов, которые загружаются при старте процесса.
+"""
+import numpy as np
+from django.conf import settings
+
+from recommendation_system.pagerank import PersonalizedPageRankCache, forward_push
+from recommendation_system.scoring import RECOMMENDATIONS_TOP_N, rank_items
+from recommendation_system.services import TOP_K, get_graph_store
+
+# Вероятность продолжить блуждание (как в глобальном PageRank) и количество пользователей в кэше остатков
+PPR_ALPHA = 0.85
+PPR_CACHE_SIZE = 1000
+
+personalized_pagerank_cache = PersonalizedPageRankCache(PPR_CACHE_SIZE)
+
+
+def seed_distribution(matrix, user):
+    """
+    Начальное распределение блуждания по узлам bipartite_adjacency: фильмы пользователя с весом релевантности
+    (оценка или просмотр) и жанры с весом 1, в сумме 1.
+    """
+    from recommendation_system.sparse_engine import film_relevance
+
+    films = film_relevance(matrix, [user]).tocsr()
+    genres = matrix.user_genre[user]
+    nodes = np.concatenate([films.indices + matrix.n_users, genres.indices + matrix.n_users + matrix.n_films])
+    weights = np.concatenate([films.data, np.ones(len(genres.indices))])
+    total = weights.sum()
+    return {int(node): float(weight / total) for node, weight in zip(nodes, weights) if weight > 0}
+
+
+def personalized_pagerank(matrix, user_id, tolerance=None, alpha=PPR_ALPHA):
+    """
+    Оценки персонализированного PageRank узлов графа пользователя: словарь {индекс узла: оценка}.
+    Меньший tolerance - точнее оценки и больше проталкиваний. None, если у пользователя нет взаимодействий.
+    """
+    from recommendation_system.sparse_engine import bipartite_adjacency
+
+    tolerance = tolerance or settings.PPR_TOLERANCE
+    user = matrix.user_index.get(user_id)
+    if user is None:
+        return None
+    seeds = seed_distribution(matrix, user)
+    if not seeds:
+        return None
+    adjacency = matrix.derived("adjacency", lambda: bipartite_adjacency(matrix))
+
+    def compute(estimate, residual):
+        estimate, residual, _ = forward_push(adjacency.indptr, adjacency.indices, seeds, alpha, tolerance,
+                                             estimate, residual)
+        return estimate, residual
+
+    return personalized_pagerank_cache.get(user_id, matrix, matrix.version, tolerance, compute)
+
+
+def recommend_personalized(user_id, top_n=RECOMMENDATIONS_TOP_N, tolerance=None):
+    """
+    Рекомендации фильмов и жанров по персонализированному PageRank без объектов пользователя
+    и персональный топ фильмов и жанров в формате calculate_pagerank. None, если оценок нет.
+    """
+    matrix = get_graph_store().get_matrix()
+    estimate = personalized_pagerank(matrix, user_id, tolerance)
+    if estimate is None:
+        return None
+    nodes = np.fromiter(estimate.keys(), dtype=np.int64, count=len(estimate))
+    scores = np.fromiter(estimate.values(), dtype=np.float64, count=len(estimate))
+    films_start, genres_start = matrix.n_users, matrix.n_users + matrix.n_films
+    user = matrix.user_index[user_id]
+
+    result, top = {}, {}
+    for name, start, end, ids, own in (
+            ("films", films_start, genres_start, matrix.film_ids, matrix.user_film),
+            ("genres", genres_start, genres_start + matrix.n_genres, matrix.genre_ids, matrix.user_genre)):
+        selected = (nodes >= start) & (nodes < end)
+        columns, column_scores = nodes[selected] - start, scores[selected]
+        top[f"top_5_{name}"] = [pk for pk, _ in rank_items(ids[columns], column_scores, TOP_K)]
+        new = ~np.isin(columns, own[user].indices)
+        result[name] = rank_items(ids[columns[new]], column_scores[new], top_n)
+    return result, top
@@ -0,0 +1,82 @@
+"""
+Параллельный пересчет рекомендаций всех пользователей.
+Матрицы взаимодействий строятся один раз, сохраняются файлами .npy и отображаются в память процессов пула
+только для чтения: страницы файлов разделяются процессами, копии матриц не создаются.
+Модули, зависящие от моделей, импортируются внутри функций: процесс пула может быть запущен
+методом spawn и импортирует этот модуль до настройки Django.
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+
+# Количество пользователей в одной задаче процесса пула
+PRECOMPUTE_CHUNK_SIZE = 1000
+
+# Каталог в оперативной памяти для файлов матриц, если он есть в системе
+SHARED_MEMORY_DIR = '/dev/shm'
+
+_worker_matrix = None
+
+
+def _init_worker(directory):
+    """Инициализация процесса пула: отображение матриц в память. Процессы пула не обращаются к базе данных."""
+    global _worker_matrix
+    if not apps.ready:
+        django.setup()
+    from recommendation_system.sparse_engine import InteractionMatrix
+
+    _worker_matrix = InteractionMatrix.load(directory)
+
+
+def _compute_chunk(user_ids):
+    """Рекомендации для части пользователей в процессе пула: список пар (user_id, рекомендации)."""
+    from recommendation_system.sparse_engine import SparseRecommendationSystem
+
+    return [(user_id, SparseRecommendationSystem.get_recommendations(_worker_matrix, user_id))
+            for user_id in user_ids]
+
+
+def precompute_recommendations(workers=None, chunk_size=PRECOMPUTE_CHUNK_SIZE):
+    """
+    Пересчет снимков рекомендаций всех пользователей в пуле процессов.
+    Возвращает словарь с количеством пользователей и временем этапов в секундах.
+    """
+    from django.utils import timezone
+
+    from recommendation_system.snapshots import save_snapshots
+    from recommendation_system.sparse_engine import InteractionMatrix, SparseRecommendationSystem
+
+    timings = {}
+    started = time.perf_counter()
+    computed_at = timezone.now()
+    matrix = InteractionMatrix.from_database()
+    _, top = SparseRecommendationSystem.calculate_pagerank(matrix)
+    timings["build"] = time.perf_counter() - started
+
+    shared_dir = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+    with tempfile.TemporaryDirectory(prefix='recommendations-', dir=shared_dir) as directory:
+        started = time.perf_counter()
+        matrix.save(directory)
+        timings["dump"] = time.perf_counter() - started
+
+        user_ids = matrix.user_ids.tolist()
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+        del matrix
+
+        started = time.perf_counter()
+        write_seconds = 0.0
+        saved = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(directory,)) as pool:
+            # Результаты записываются по мере готовности, пока процессы пула считают следующие части
+            for rows in pool.map(_compute_chunk, chunks):
+                write_started = time.perf_counter()
+                saved += save_snapshots(rows, top, computed_at)
+                write_seconds += time.perf_counter() - write_started
+        timings["write"] = write_seconds
+        timings["compute"] = time.perf_counter() - started - write_seconds
+
+    return {"users": saved, "timings": timings}
@@ -0,0 +1,146 @@
+from django.db import transaction
+from rest_framework import serializers
+
+from recommendation_system.models import Film, Genre, Rating, UserFilm, UserGenre
+from recommendation_system.signals import preferences_changed
+
+# Максимальное количество предпочтений в одном пакете
+BULK_PREFERENCES_MAX_ITEMS = 1000
+
+# Наибольшее значение первичного ключа (BigAutoField)
+PRIMARY_KEY_MAX = 2 ** 63 - 1
+
+PREFERENCE_TYPE_ERROR = "Укажите предпочтения: 'rating' и 'film', 'genre' или 'film'."
+
+
+def preference_type(item):
+    """Тип предпочтения по полям элемента, как в PreferenceCreateAPIView; None - тип не определен."""
+    if not isinstance(item, dict):
+        return None
+    if 'rating' in item and 'film' in item:
+        return 'rating'
+    if 'genre' in item:
+        return 'genre'
+    if 'film' in item:
+        return 'film'
+    return None
+
+
+def parse_primary_key(value):
+    """
+    id объекта из целого числа или строки десятичных цифр. ValueError - значение не id,
+    OverflowError - id больше наибольшего первичного ключа.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdecimal():
+        raise ValueError(value)
+    pk = int(value)
+    if pk > PRIMARY_KEY_MAX:
+        raise OverflowError(value)
+    return pk
+
+
+def _primary_key(value):
+    """id объекта: целое число или строка из десятичных цифр в пределах первичного ключа."""
+    error_messages = serializers.PrimaryKeyRelatedField.default_error_messages
+    try:
+        return parse_primary_key(value)
+    except ValueError:
+        raise serializers.ValidationError(error_messages['incorrect_type'].format(data_type=type(value).__name__))
+    except OverflowError:
+        raise serializers.ValidationError(error_messages['does_not_exist'].format(pk_value=value))
+
+
+def validate_preferences(items):
+    """
+    Проверка пакета предпочтений за один проход: существование фильмов и жанров проверяется
+    двумя запросами на весь пакет, а не запросом на каждый элемент.
+    Возвращает список пар (тип, значения) для корректных элементов и (None, ошибки) для остальных.
+    """
+    parsed = []
+    for item in items:
+        kind = preference_type(item)
+        if kind is None:
+            parsed.append((None, {"non_field_errors": [PREFERENCE_TYPE_ERROR]}))
+            continue
+        field = 'genre' if kind == 'genre' else 'film'
+        values, errors = {}, {}
+        try:
+            values[field] = _primary_key(item[field])
+        except serializers.ValidationError as error:
+            errors[field] = error.detail
+        if kind == 'rating':
+            try:
+                values['rating'] = serializers.FloatField().run_validation(item['rating'])
+            except serializers.ValidationError as error:
+                errors['rating'] = error.detail
+        parsed.append((kind, values) if not errors else (None, errors))
+
+    film_ids = {values['film'] for kind, values in parsed if kind in ('film', 'rating')}
+    genre_ids = {values['genre'] for kind, values in parsed if kind == 'genre'}
+    existing = {
+        'film': set(Film.objects.filter(pk__in=film_ids).values_list('pk', flat=True)),
+        'genre': set(Genre.objects.filter(pk__in=genre_ids).values_list('pk', flat=True)),
+    }
+    does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+    for position, (kind, values) in enumerate(parsed):
+        field = 'genre' if kind == 'genre' else 'film'
+        if kind is not None and values[field] not in existing[field]:
+            parsed[position] = (None, {field: [does_not_exist.format(pk_value=values[field])]})
+    return parsed
+
+
+def save_preferences(user, items):
+    """
+    Сохранение пакета предпочтений пользователя в одной транзакции: оценки обновляются при конфликте,
+    уже существующие просмотры и жанры пропускаются. Повтор фильма или жанра в пакете - одна запись,
+    для оценок действует последняя. Графы, индекс похожих фильмов, снимок и кэш рекомендаций
+    обновляются один раз на пакет.
+    Возвращает результаты по элементам в порядке пакета: тип, id объекта и статус
+    ('created', 'updated', 'exists') или ошибки проверки.
+    """
+    parsed = validate_preferences(items)
+    ratings, films, genres = {}, {}, {}
+    for kind, values in parsed:
+        if kind == 'rating':
+            ratings[values['film']] = values['rating']
+        elif kind == 'film':
+            films[values['film']] = True
+        elif kind == 'genre':
+            genres[values['genre']] = True
+
+    with transaction.atomic():
+        rated = set(Rating.objects.filter(user=user, film_id__in=ratings).values_list('film_id', flat=True))
+        viewed = set(UserFilm.objects.filter(user=user, film_id__in=films).values_list('film_id', flat=True))
+        liked = set(UserGenre.objects.filter(user=user, genre_id__in=genres).values_list('genre_id', flat=True))
+
+        # Время изменения оценки обновляется: снимок графа дозагружает оценки по updated_at
+        Rating.objects.bulk_create(
+            [Rating(user=user, film_id=film_id, rating=rating) for film_id, rating in ratings.items()],
+            update_conflicts=True, unique_fields=['user', 'film'], update_fields=['rating', 'updated_at'])
+        UserFilm.objects.bulk_create([UserFilm(user=user, film_id=film_id) for film_id in films
+                                      if film_id not in viewed], ignore_conflicts=True)
+        UserGenre.objects.bulk_create([UserGenre(user=user, genre_id=genre_id) for genre_id in genres
+                                       if genre_id not in liked], ignore_conflicts=True)
+
+        deltas = [{"op": "add_edge", "user": user.id, "type": "film", "id": film_id, "score": rating}
+                  for film_id, rating in ratings.items()]
+        deltas += [{"op": "add_edge", "user": user.id, "type": "film", "id": film_id}
+                   for film_id in films if film_id not in viewed]
+        deltas += [{"op": "add_edge", "user": user.id, "type": "genre", "id": genre_id}
+                   for genre_id in genres if genre_id not in liked]
+        if deltas:
+            preferences_changed(user.id, deltas, {delta["id"] for delta in deltas if delta["type"] == "film"})
+
+    statuses = {
+        'rating': lambda pk: 'updated' if pk in rated else 'created',
+        'film': lambda pk: 'exists' if pk in viewed else 'created',
+        'genre': lambda pk: 'exists' if pk in liked else 'created',
+    }
+    results = []
+    for kind, values in parsed:
+        if kind is None:
+            results.append({"status": "invalid", "errors": values})
+            continue
+        pk = values['genre' if kind == 'genre' else 'film']
+        results.append({"type": kind, "id": pk, "status": statuses[kind](pk)})
+    return results
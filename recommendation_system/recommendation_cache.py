@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class RecommendationCache:
+    """
+    Двухуровневый кэш результатов рекомендаций пользователя.
+    L1 - словарь процесса с вытеснением давно не использованных записей, L2 - кэш Django (Redis при CACHE_ENABLED).
+    Ключ содержит id пользователя и версию его данных: при изменении оценок, просмотров и жанров
+    пользователя версия меняется, и прежние записи больше не читаются.
+    Версия общая для всех процессов только при общем L2 (CACHE_ENABLED=True). С LocMemCache по умолчанию
+    у каждого процесса свои L2 и версии: смену версии в остальные воркеры доставляет только шина изменений
+    (INVALIDATION_BUS=redis), без нее они отдают прежние записи до истечения RECOMMENDATION_CACHE_TIMEOUT.
+    """
+
+    KEY_PREFIX = 'recommendations'
+
+    def __init__(self, max_entries=None, timeout=None):
+        self._max_entries = max_entries
+        self._timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(("l1_hits", "l2_hits", "misses", "evictions"), 0)
+
+    @property
+    def max_entries(self):
+        return self._max_entries if self._max_entries is not None else settings.RECOMMENDATION_CACHE_L1_SIZE
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None else settings.RECOMMENDATION_CACHE_TIMEOUT
+
+    def _version_key(self, user_id):
+        return f"{self.KEY_PREFIX}:version:{user_id}"
+
+    def get_version(self, user_id):
+        """Версия данных пользователя; при отсутствии в L2 создается новая."""
+        version = cache.get(self._version_key(user_id))
+        if version is None:
+            # Новая версия не совпадает с версиями записей, оставшихся от вытесненного ключа
+            cache.add(self._version_key(user_id), time.time_ns(), timeout=None)
+            version = cache.get(self._version_key(user_id))
+        return version
+
+    def bump(self, user_id):
+        """Смена версии данных пользователя: все его записи становятся недоступны."""
+        cache.set(self._version_key(user_id), time.time_ns(), timeout=None)
+
+    def get_or_compute(self, kind, user_id, compute):
+        """Результат вида kind для пользователя из L1, затем из L2; при промахе - compute() с записью в оба уровня."""
+        key = f"{self.KEY_PREFIX}:{kind}:{user_id}:{self.get_version(user_id)}"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._counters["l1_hits"] += 1
+                return entry[1]
+
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, timeout=self.timeout)
+            self._count("misses")
+        else:
+            self._count("l2_hits")
+        self._store(key, value, now + self.timeout)
+        return value
+
+    def _store(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        """Счетчики попаданий в L1 и L2, промахов и вытеснений из L1 процесса."""
+        with self._lock:
+            return {**self._counters, "l1_size": len(self._entries)}
+
+    def clear(self):
+        """Сброс L1 и счетчиков процесса; L2 и версии не затрагиваются."""
+        with self._lock:
+            self._entries.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+recommendation_cache = RecommendationCache()
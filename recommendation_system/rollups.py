@@ -0,0 +1,103 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.utils import timezone
+
+from recommendation_system.models import DailyStatistics, HourlyStatistics, RecommendationStatistics, \
+    StatisticsCompaction
+
+logger = logging.getLogger(__name__)
+
+# Количество записей статистики, сжимаемых в одной транзакции
+COMPACTION_BATCH_SIZE = 10000
+
+# Агрегаты и функции округления времени записи до начала периода
+ROLLUPS = ((HourlyStatistics, TruncHour), (DailyStatistics, TruncDay))
+
+AGGREGATE_FIELDS = ('count', 'film_count_sum', 'film_count_min', 'film_count_max', 'genre_count_sum',
+                    'genre_count_min', 'genre_count_max')
+
+
+def _combine(current, delta, combine):
+    if current is None:
+        return delta
+    if delta is None:
+        return current
+    return combine(current, delta)
+
+
+def merge_rollup(model, rows, trunc):
+    """Добавление записей rows к агрегатам model: одна группировка в базе данных и одна запись с обновлением."""
+    # Сортировка сбрасывается: поле сортировки попало бы в GROUP BY
+    deltas = list(rows.order_by().annotate(period_start=trunc('timestamp')).values('user_id', 'period_start').annotate(
+        count=Count('id'),
+        film_count_sum=Coalesce(Sum('film_count'), Value(0)),
+        film_count_min=Min('film_count'),
+        film_count_max=Max('film_count'),
+        genre_count_sum=Coalesce(Sum('genre_count'), Value(0)),
+        genre_count_min=Min('genre_count'),
+        genre_count_max=Max('genre_count'),
+    ))
+    if not deltas:
+        return 0
+
+    existing = {(rollup.user_id, rollup.period_start): rollup for rollup in model.objects.filter(
+        user_id__in={delta['user_id'] for delta in deltas},
+        period_start__in={delta['period_start'] for delta in deltas},
+    )}
+    rollups = []
+    for delta in deltas:
+        rollup = existing.get((delta['user_id'], delta['period_start']))
+        if rollup is None:
+            rollup = model(user_id=delta['user_id'], period_start=delta['period_start'], count=0)
+        rollup.count += delta['count']
+        rollup.film_count_sum += delta['film_count_sum']
+        rollup.genre_count_sum += delta['genre_count_sum']
+        rollup.film_count_min = _combine(rollup.film_count_min, delta['film_count_min'], min)
+        rollup.film_count_max = _combine(rollup.film_count_max, delta['film_count_max'], max)
+        rollup.genre_count_min = _combine(rollup.genre_count_min, delta['genre_count_min'], min)
+        rollup.genre_count_max = _combine(rollup.genre_count_max, delta['genre_count_max'], max)
+        rollups.append(rollup)
+
+    model.objects.bulk_create(rollups, update_conflicts=True, unique_fields=['user', 'period_start'],
+                              update_fields=list(AGGREGATE_FIELDS))
+    return sum(delta['count'] for delta in deltas)
+
+
+def compact_statistics(retention_days=None, batch_size=COMPACTION_BATCH_SIZE):
+    """
+    Инкрементальное сжатие статистики: записи после отметки добавляются к почасовым и ежедневным агрегатам,
+    затем удаляются учтенные записи старше retention_days дней.
+    Возвращает количество учтенных и удаленных записей.
+    """
+    if retention_days is None:
+        retention_days = settings.STATISTICS_RAW_RETENTION_DAYS
+
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            # Блокировка отметки: одновременные запуски не учтут одни и те же записи дважды
+            mark, _ = StatisticsCompaction.objects.select_for_update().get_or_create(pk=1)
+            new_rows = RecommendationStatistics.objects.filter(id__gt=mark.last_id).order_by('id')
+            upper = next(iter(new_rows.values_list('id', flat=True)[batch_size - 1:batch_size]), None)
+            if upper is None:
+                upper = new_rows.aggregate(last_id=Max('id'))['last_id']
+            if upper is None:
+                break
+
+            batch = new_rows.filter(id__lte=upper)
+            counts = [merge_rollup(model, batch, trunc) for model, trunc in ROLLUPS]
+            compacted += counts[0]
+            mark.last_id = upper
+            mark.compacted_at = timezone.now()
+            mark.save()
+
+    last_id = StatisticsCompaction.objects.filter(pk=1).values_list('last_id', flat=True).first() or 0
+    deleted, _ = RecommendationStatistics.objects.filter(
+        id__lte=last_id, timestamp__lt=timezone.now() - timedelta(days=retention_days)).delete()
+    logger.info("Сжато %s записей статистики, удалено %s", compacted, deleted)
+    return {"compacted": compacted, "deleted": deleted}
@@ -0,0 +1,45 @@
+import numpy as np
+
+from recommendation_system.similarity import top_similar
+
+# Количество фильмов и жанров в рекомендациях пользователя
+RECOMMENDATIONS_TOP_N = 20
+
+# Шкала оценок фильмов: оценка переводится в релевантность от 0 до 1
+RATING_SCALE = 10.0
+
+# Релевантность просмотренного, но не оцененного фильма
+VIEW_RELEVANCE = 0.5
+
+
+def neighbor_weights(similar, nearest):
+    """
+    Веса пользователей окрестности: схожесть из коллаборативной фильтрации
+    плюс величина, обратная расстоянию из поиска ближайших соседей. similar, nearest - пары (id, значение).
+    """
+    weights = {}
+    for user_id, score in similar:
+        weights[user_id] = weights.get(user_id, 0.0) + float(score)
+    for user_id, distance in nearest:
+        weights[user_id] = weights.get(user_id, 0.0) + 1.0 / distance
+    return weights
+
+
+def item_relevance(score):
+    """Релевантность фильма для пользователя окрестности: по оценке, если она есть, иначе как просмотр."""
+    return VIEW_RELEVANCE if score is None else score / RATING_SCALE
+
+
+def rank_items(ids, scores, top_n=RECOMMENDATIONS_TOP_N):
+    """
+    Пары (id, оценка) top_n кандидатов с положительной оценкой по убыванию оценки, при равенстве - по id.
+    Оценки округляются до 6 знаков, чтобы порядок не зависел от порядка суммирования.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    scores = np.round(np.asarray(scores, dtype=np.float64), 6)
+    return [(int(ids[index]), float(scores[index])) for index in top_similar(ids, scores, top_n)]
+
+
+def paginate(items, limit=None, offset=0):
+    """Срез рекомендаций по limit и offset."""
+    return items[offset:] if limit is None else items[offset:offset + limit]
@@ -1,172 +1,386 @@
-import networkx as nx
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
 
 from recommendation_system.models import Film, Genre, UserFilm, UserGenre, Rating
+from recommendation_system.pagerank import PageRankCache, pagerank, top_k_indices
+from recommendation_system.scoring import RECOMMENDATIONS_TOP_N, item_relevance, neighbor_weights, rank_items
+from recommendation_system.similarity import SIMILAR_USERS_TOP_N, as_score, check_metric, overlap_similarity, \
+    rating_similarity, top_similar
 from users.models import User
 
+logger = logging.getLogger(__name__)
+
+# Размер пачки строк, читаемых из базы данных при построении графа
+GRAPH_LOAD_CHUNK_SIZE = 2000
+
+# Размер топ фильмов и жанров по PageRank
+TOP_K = 5
+
+# Количество ближайших соседей пользователя
+KNN_K = 5
+
+# Максимальная глубина поиска ближайших соседей (пользователь - объект - пользователь - ...)
+KNN_MAX_DEPTH = 6
+
+# Доступные реализации системы рекомендаций, выбираются настройкой RECOMMENDATION_ENGINE
+RECOMMENDATION_ENGINES = {
+    'networkx': 'recommendation_system.services.RecommendationSystem',
+    'sparse': 'recommendation_system.sparse_engine.SparseRecommendationSystem',
+}
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов для connection.execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def iter_batches(queryset, chunk_size):
+    """Потоковое чтение queryset пачками (серверный курсор в PostgreSQL)."""
+    batch = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _rating_norm(graph, node):
+    """Норма вектора оценок пользователя."""
+    return math.sqrt(sum(data['score'] ** 2 for *_, data in graph.edges(node, data=True) if 'score' in data))
+
 
 class RecommendationSystem:
     """Класс реализации системы рекомендаций"""
 
+    _pagerank_cache = PageRankCache()
+
     @staticmethod
-    def build_preference_graph():
-        """Построение графа на основе узлов - объектов и ребер - взаимодействий."""
+    def build_preference_graph(chunk_size=GRAPH_LOAD_CHUNK_SIZE):
+        """
+        Построение графа на основе узлов - объектов и ребер - взаимодействий.
+        Данные читаются кортежами id без загрузки моделей, узлы и ребра добавляются пачками.
+        Количество запросов и время построения сохраняются в graph.graph["build_stats"].
+        """
+        # networkx импортируется при первом использовании движка, а не при импорте модуля
+        import networkx as nx
+
         G = nx.Graph()
+        counter = QueryCounter()
+        started = time.perf_counter()
+
+        with connection.execute_wrapper(counter):
+            # Добавляем узлы пользователей, фильмов и жанров
+            for prefix, model in (('user', User), ('film', Film), ('genre', Genre)):
+                for batch in iter_batches(model.objects.values_list('id', flat=True), chunk_size):
+                    G.add_nodes_from((f"{prefix}_{pk}" for pk in batch), type=prefix)
+
+            # Добавляем ребра для взаимодействий пользователей с фильмами
+            for batch in iter_batches(UserFilm.objects.values_list('user_id', 'film_id'), chunk_size):
+                G.add_edges_from(((f"user_{user_id}", f"film_{film_id}") for user_id, film_id in batch),
+                                 interaction='rated')
+
+            # Добавляем ребра для взаимодействий пользователей с жанрами
+            for batch in iter_batches(UserGenre.objects.values_list('user_id', 'genre_id'), chunk_size):
+                G.add_edges_from(((f"user_{user_id}", f"genre_{genre_id}") for user_id, genre_id in batch),
+                                 interaction='rated')
 
-        # Добавляем узлы пользователей
-        users = User.objects.all()
-        for user in users:
-            G.add_node(f"user_{user.id}", type='user')
-
-        # Добавляем узлы фильмов
-        films = Film.objects.all()
-        for film in films:
-            G.add_node(f"film_{film.id}", type='film')
-
-        # Добавляем узлы жанров
-        genres = Genre.objects.all()
-        for genre in genres:
-            G.add_node(f"genre_{genre.id}", type='genre')
-
-        # Добавляем ребра для взаимодействий пользователей с фильмами
-        user_films = UserFilm.objects.all()
-        for user_film in user_films:
-            user_id = f"user_{user_film.user.id}"
-            film_id = f"film_{user_film.film.id}"
-            G.add_edge(user_id, film_id, interaction='rated')
-
-        # Добавляем ребра для взаимодействий пользователей с жанрами
-        user_genres = UserGenre.objects.all()
-        for user_genre in user_genres:
-            user_id = f"user_{user_genre.user.id}"
-            genre_id = f"genre_{user_genre.genre.id}"
-            G.add_edge(user_id, genre_id, interaction='rated')
-
-        # Добавляем ребра с рейтингами
-        ratings = Rating.objects.all()
-        for rating in ratings:
-            user_id = f"user_{rating.user.id}"
-            film_id = f"film_{rating.film.id}"
-            G.add_edge(user_id, film_id, score=rating.rating, interaction='rated')
+            # Добавляем ребра с рейтингами
+            for batch in iter_batches(Rating.objects.values_list('user_id', 'film_id', 'rating'), chunk_size):
+                G.add_edges_from(((f"user_{user_id}", f"film_{film_id}", {'score': score})
+                                  for user_id, film_id, score in batch), interaction='rated')
 
+        G.graph["build_stats"] = {
+            "queries": counter.count,
+            "seconds": time.perf_counter() - started,
+            "nodes": G.number_of_nodes(),
+            "edges": G.number_of_edges(),
+        }
+        logger.info("Граф предпочтений построен: %(nodes)s узлов, %(edges)s ребер, "
+                    "%(queries)s запросов за %(seconds).3f с", G.graph["build_stats"])
         return G
 
     @staticmethod
     def calculate_pagerank(graph):
-        """Оценка важности узлов, количество взаимодействий пользователей с объектом"""
-        sort_key = ('film', 'genre',)
-        pagerank = nx.pagerank(graph)
-
-        # Сортировка исключает пользователей из словаря.
-        # Забираем только те пары, когда в ключе есть ключевое слово из (sort_key).
-        nodes_without_users = {k: v for k, v in pagerank.items() if any(key in k for key in sort_key)}
-        sorted_top_nodes = dict(sorted(nodes_without_users.items(), key=lambda value: value[1], reverse=True))
-
-        # Сбор топ фильмов и жанров, по оценки важности узлов.
-        top_5_films = list()
-        top_5_genres = list()
-
-        for key, _ in sorted_top_nodes.items():
-            if key.split('_')[0] == 'film':
-                film_id = int(key.split('_')[1])  # Извлекаем ID фильма
-                film_instance = Film.objects.get(id=film_id)
-                # Получаем объект фильма
-                top_5_films.append(film_instance.title)
-            elif key.split('_')[0] == 'genre':
-                genre_id = int(key.split('_')[1])  # Извлекаем ID фильма
-                genre_instance = Genre.objects.get(id=genre_id)  # Получаем объект фильма
-                top_5_genres.append(genre_instance.name)
-
-        return sorted_top_nodes, {"top_5_films": list(top_5_films)[:5], "top_5_genres": list(top_5_genres)[:5]}
+        """
+        Оценка важности узлов, количество взаимодействий пользователей с объектом.
+        Возвращает оценки фильмов и жанров и id топ фильмов и жанров.
+        Результат кэшируется по версии графа и пересчитывается с теплым стартом после изменений.
+        """
+        return RecommendationSystem._pagerank_cache.get(
+            graph, graph.graph.get("version", 0),
+            lambda previous: RecommendationSystem._compute_pagerank(graph, previous))
 
     @staticmethod
-    def collaborative_filtering(graph, user_id):
-        """Алгоритм коллаборативной фильтрации для рекомендаций на основе схожести пользователей."""
+    def _compute_pagerank(graph, previous):
+        """Векторизованный PageRank графа; previous - оценки узлов предыдущей версии графа."""
+        import networkx as nx
+
+        nodes = list(graph)
+        if not nodes:
+            return ({}, {"top_5_films": [], "top_5_genres": []}), None
+        adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=None, format='csr')
+        start = None
+        if previous:
+            start = np.fromiter((previous.get(node, 1.0 / len(nodes)) for node in nodes), dtype=np.float64,
+                                count=len(nodes))
+        scores = pagerank(adjacency, start=start)
+
+        # Пользователи в рейтинг не попадают, фильмы и жанры отбираются частичной сортировкой
+        types = np.array([graph.nodes[node].get('type') for node in nodes])
+        films, genres = np.flatnonzero(types == 'film'), np.flatnonzero(types == 'genre')
+        items = np.concatenate([films, genres])
+        sorted_top_nodes = {nodes[index]: float(scores[index])
+                            for index in items[np.argsort(-scores[items], kind='stable')]}
+        top_ids = {
+            "top_5_films": [int(nodes[index].split('_')[1]) for index in films[top_k_indices(scores[films], TOP_K)]],
+            "top_5_genres": [int(nodes[index].split('_')[1])
+                             for index in genres[top_k_indices(scores[genres], TOP_K)]],
+        }
+        return (sorted_top_nodes, top_ids), dict(zip(nodes, scores))
+
+    @staticmethod
+    def collaborative_filtering(graph, user_id, metric='common', top_n=SIMILAR_USERS_TOP_N):
+        """
+        Алгоритм коллаборативной фильтрации для рекомендаций на основе схожести пользователей.
+        Общие соседи со всеми пользователями считаются за один проход по соседям соседей,
+        возвращаются top_n наиболее схожих пользователей по мере metric (см. SIMILARITY_METRICS).
+        """
+        check_metric(metric)
         # Добавляем префикс к user_id
         user_node = f"user_{user_id}"
 
-        similar_users = []
+        # Пользователь мог появиться позже построения графа
+        if user_node not in graph:
+            return []
 
+        overlaps = Counter()
+        dots = Counter()
         for neighbor in graph.neighbors(user_node):
-            for user_neighbors in graph.neighbors(neighbor):
+            user_score = graph.edges[user_node, neighbor].get('score')
+            for other in graph.neighbors(neighbor):
                 # Проверяем, что сосед — это другой пользователь
-                if user_neighbors != user_node and graph.nodes[user_neighbors].get('type') == 'user':
-                    # Общие соседи (например, фильмы или жанры) между пользователями
-                    common_neighbors = list(nx.common_neighbors(graph, user_node, user_neighbors))
-                    similar_tuple = (user_neighbors, len(common_neighbors))
-                    if similar_tuple not in similar_users:
-                        similar_users.append(similar_tuple)
+                if other != user_node and graph.nodes[other].get('type') == 'user':
+                    overlaps[other] += 1
+                    other_score = graph.edges[neighbor, other].get('score')
+                    if user_score is not None and other_score is not None:
+                        dots[other] += user_score * other_score
 
-        # Сортируем пользователей по схожести
-        similar_users.sort(key=lambda x: x[1], reverse=True)
-        return similar_users
+        nodes = list(overlaps)
+        if metric == 'rating':
+            scores = rating_similarity([dots[node] for node in nodes], _rating_norm(graph, user_node),
+                                       [_rating_norm(graph, node) for node in nodes])
+        else:
+            scores = overlap_similarity(metric, [overlaps[node] for node in nodes], graph.degree(user_node),
+                                        [graph.degree(node) for node in nodes])
+        ids = np.array([int(node.split('_')[1]) for node in nodes], dtype=np.int64)
+        return [(nodes[index], as_score(metric, scores[index])) for index in top_similar(ids, scores, top_n)]
 
     @staticmethod
-    def k_nearest_neighbors(graph, user_id, k=5):
+    def k_nearest_neighbors(graph, user_id, k=KNN_K, max_depth=KNN_MAX_DEPTH):
         """
         Алгоритм нахождения ближайших соседей (k-Nearest Neighbors) для нахождения пользователей с похожими интересами.
+        Один поиск в ширину от пользователя: обход останавливается на уровне, где набрано k пользователей,
+        или на глубине max_depth. При равном расстоянии пользователи упорядочены по id.
         """
         # Добавляем префикс к user_id
         user_node = f"user_{user_id}"
 
+        if user_node not in graph:
+            return []
+
+        visited = {user_node}
+        frontier = [user_node]
         distances = []
-        for other_node in graph.nodes():
-            # Проверяем, что это другой пользователь
-            if other_node != user_node and graph.nodes[other_node].get('type') == 'user':
-                try:
-                    # Вычисляем расстояние (короткий путь)
-                    distance = nx.shortest_path_length(graph, user_node, other_node)
-                    distances.append((other_node, distance))
-                except nx.NetworkXNoPath:
-                    # Игнорируем, если пути нет
-                    continue
+        depth = 0
+        while frontier and len(distances) < k and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for node in frontier:
+                for neighbor in graph.neighbors(node):
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        next_frontier.append(neighbor)
+            # Пользователи текущего уровня находятся на одинаковом расстоянии
+            level_users = [node for node in next_frontier if graph.nodes[node].get('type') == 'user']
+            level_users.sort(key=lambda node: int(node.split('_')[1]))
+            distances.extend((node, depth) for node in level_users)
+            frontier = next_frontier
 
-        # Сортируем по расстоянию и берём k ближайших
-        distances.sort(key=lambda x: x[1])
         return distances[:k]
 
     @staticmethod
-    def get_recommendations(graph, user_id, k=5):
-        """Метод для получения рекомендаций фильмов и жанров для пользователя."""
+    def get_recommendations(graph, user_id, k=KNN_K, metric='common', top_n=RECOMMENDATIONS_TOP_N):
+        """
+        Метод для получения рекомендаций фильмов и жанров для пользователя: пары (id, оценка) по убыванию оценки.
+        Кандидаты - объекты схожих пользователей и ближайших соседей (см. score_candidates).
+        """
+        if f"user_{user_id}" not in graph:
+            return {"films": [], "genres": []}
+
         # Получаем схожих пользователей с помощью коллаборативной фильтрации
-        similar_users = RecommendationSystem.collaborative_filtering(graph, user_id)
+        similar_users = RecommendationSystem.collaborative_filtering(graph, user_id, metric)
 
         # Нахождение ближайших соседей (k-Nearest Neighbors)
         nearest_neighbors = RecommendationSystem.k_nearest_neighbors(graph, user_id, k)
 
-        # Сбор уникальных фильмов и жанров, которые оценили схожие пользователи
-        recommended_films = set()
-        recommended_genres = set()
-
-        # Обработка схожих пользователей
-        for similar_user, _ in similar_users:
-            # Получаем все фильмы, которые оценил схожий пользователь
-            for film in graph.neighbors(similar_user):
-                if graph.nodes[film]['type'] == 'film':
-                    film_id = int(film.split('_')[1])  # Извлекаем ID фильма
-                    film_instance = Film.objects.get(id=film_id)  # Получаем объект фильма
-                    recommended_films.add(film_instance.title)
-
-            # Получаем все жанры, которые оценил схожий пользователь
-            for genre in graph.neighbors(similar_user):
-                if graph.nodes[genre]['type'] == 'genre':
-                    genre_id = int(genre.split('_')[1])  # Извлекаем ID жанра
-                    genre_instance = Genre.objects.get(id=genre_id)  # Получаем объект жанра
-                    recommended_genres.add(genre_instance.name)
-
-        # Обработка ближайших соседей
-        for neighbor, _ in nearest_neighbors:
-            # Получаем все фильмы, которые оценил сосед
-            for film in graph.neighbors(neighbor):
-                if graph.nodes[film]['type'] == 'film':
-                    film_id = int(film.split('_')[1])
-                    film_instance = Film.objects.get(id=film_id)
-                    recommended_films.add(film_instance.title)
-
-            # Получаем все жанры, которые оценил сосед
-            for genre in graph.neighbors(neighbor):
-                if graph.nodes[genre]['type'] == 'genre':
-                    genre_id = int(genre.split('_')[1])
-                    genre_instance = Genre.objects.get(id=genre_id)
-                    recommended_genres.add(genre_instance.name)
-
-        return {"films": list(recommended_films), "genres": list(recommended_genres)}
+        return RecommendationSystem.score_candidates(graph, user_id, similar_users, nearest_neighbors, top_n)
+
+    @staticmethod
+    def score_candidates(graph, user_id, similar_users, nearest_neighbors, top_n=RECOMMENDATIONS_TOP_N):
+        """
+        Оценка кандидатов по уже найденным схожим пользователям и ближайшим соседям:
+        объекты окрестности взвешиваются схожестью и оценкой фильма, объекты пользователя исключаются.
+        """
+        user_node = f"user_{user_id}"
+        if user_node not in graph:
+            return {"films": [], "genres": []}
+
+        own = set(graph.neighbors(user_node))
+        candidates = {"film": Counter(), "genre": Counter()}
+        for node, weight in neighbor_weights(similar_users, nearest_neighbors).items():
+            for item in graph.neighbors(node):
+                if item in own:
+                    continue
+                node_type = graph.nodes[item]['type']
+                relevance = item_relevance(graph.edges[node, item].get('score')) if node_type == 'film' else 1.0
+                candidates[node_type][int(item.split('_')[1])] += weight * relevance
+
+        return {
+            "films": rank_items(list(candidates["film"]), list(candidates["film"].values()), top_n),
+            "genres": rank_items(list(candidates["genre"]), list(candidates["genre"].values()), top_n),
+        }
+
+    @staticmethod
+    def apply_deltas(graph, deltas):
+        """
+        Применение изменений взаимодействий к уже построенному графу.
+        Дельта - словарь вида {"op": "add_edge", "user": 1, "type": "film", "id": 2, "score": 5.0}.
+        """
+        for delta in deltas:
+            op = delta["op"]
+            if op == "add_node":
+                graph.add_node(f"{delta['type']}_{delta['id']}", type=delta["type"])
+            elif op == "remove_node":
+                node = f"{delta['type']}_{delta['id']}"
+                if node in graph:
+                    graph.remove_node(node)
+            elif op == "add_edge":
+                user_node = f"user_{delta['user']}"
+                object_node = f"{delta['type']}_{delta['id']}"
+                # Узлы могли быть созданы после построения графа
+                graph.add_node(user_node, type='user')
+                graph.add_node(object_node, type=delta["type"])
+                graph.add_edge(user_node, object_node, interaction='rated')
+                if delta.get("score") is not None:
+                    graph.edges[user_node, object_node]["score"] = delta["score"]
+            elif op == "remove_edge":
+                user_node = f"user_{delta['user']}"
+                object_node = f"{delta['type']}_{delta['id']}"
+                if graph.has_edge(user_node, object_node):
+                    graph.remove_edge(user_node, object_node)
+        graph.graph["version"] = graph.graph.get("version", 0) + 1
+        return True
+
+    @staticmethod
+    def interaction_matrix(graph):
+        """Граф в виде InteractionMatrix для алгоритмов над разреженными матрицами."""
+        from recommendation_system.sparse_engine import InteractionMatrix
+
+        return InteractionMatrix.from_graph(graph)
+
+
+class PreferenceGraphStore:
+    """
+    Долгоживущий граф предпочтений процесса (воркера).
+    Граф строится один раз при первом обращении, далее к нему применяются дельты из сигналов моделей
+    и шины изменений. Рассчитан на один поток запросов в процессе (sync-воркеры gunicorn): дельты применяются
+    в потоке запросов между запросами или после записи, чтение графа не блокируется и не пересекается с изменением.
+    Хранит структуру выбранной реализации: nx.Graph или InteractionMatrix.
+    """
+
+    def __init__(self, system=RecommendationSystem):
+        self.system = system
+        self.version = 0
+        self._graph = None
+        self._matrix = None
+        self._lock = threading.RLock()
+
+    @property
+    def is_built(self):
+        return self._graph is not None
+
+    def get_graph(self):
+        """Возвращает актуальный граф, при необходимости строит его из базы данных."""
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = self.system.build_preference_graph()
+                    self.version += 1
+        return self._graph
+
+    def apply(self, deltas):
+        """Применяет дельты к графу. Если граф ещё не построен, он прочитает актуальные данные при построении."""
+        with self._lock:
+            if self._graph is None:
+                return
+            if not self.system.apply_deltas(self._graph, deltas):
+                # Изменение нельзя применить инкрементально - перестроим граф при следующем обращении
+                self._graph = self._matrix = None
+            elif self._matrix is not None and self._matrix is not self._graph and not self._matrix.apply(deltas):
+                self._matrix = None
+            self.version += 1
+
+    def get_matrix(self):
+        """
+        Граф в виде InteractionMatrix для похожих фильмов и персонализированного PageRank.
+        Для движка 'sparse' это сам граф; для остальных матрица строится по графу один раз
+        и дальше получает те же дельты, что и граф, - второй граф из базы данных не строится.
+        """
+        graph = self.get_graph()
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = self.system.interaction_matrix(graph)
+            return self._matrix
+
+    def reset(self):
+        """Сбрасывает граф, следующее обращение построит его заново."""
+        with self._lock:
+            self._graph = self._matrix = None
+            self.version += 1
+
+
+_graph_stores = {}
+
+
+def get_recommendation_system(engine=None):
+    """Класс реализации системы рекомендаций по имени движка (по умолчанию из настроек)."""
+    return import_string(RECOMMENDATION_ENGINES[engine or settings.RECOMMENDATION_ENGINE])
+
+
+def get_graph_store(engine=None):
+    """Хранилище графа процесса для выбранного движка."""
+    engine = engine or settings.RECOMMENDATION_ENGINE
+    if engine not in _graph_stores:
+        _graph_stores[engine] = PreferenceGraphStore(get_recommendation_system(engine))
+    return _graph_stores[engine]
+
+
+def iter_graph_stores():
+    """Все созданные в процессе хранилища графа."""
+    return list(_graph_stores.values())
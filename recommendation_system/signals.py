@@ -0,0 +1,186 @@
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from recommendation_system.catalog import bump_catalog_version, film_catalog, genre_catalog
+from recommendation_system.film_search import film_search_store
+from recommendation_system.invalidation import invalidation_bus
+from recommendation_system.item_similarity import item_similarity_store
+from recommendation_system.models import Film, Genre, UserFilm, UserGenre, Rating
+from recommendation_system.personalized_pagerank import personalized_pagerank_cache
+from recommendation_system.recommendation_cache import recommendation_cache
+from recommendation_system.services import iter_graph_stores
+from recommendation_system.snapshots import mark_changed
+from recommendation_system.statistics_buffer import statistics_buffer
+
+
+@invalidation_bus.subscribe('deltas')
+def apply_deltas(deltas):
+    for store in iter_graph_stores():
+        store.apply(deltas)
+
+
+@invalidation_bus.subscribe('film')
+def film_updated(film):
+    """
+    Сброс метаданных фильма в кэше каталога и фрагментов главной страницы, изменение фильма в индексе похожих фильмов
+    и в поисковом индексе.
+    """
+    film_catalog.invalidate(film["id"])
+    bump_catalog_version()
+    film_search_store.film_changed(film["id"])
+    if film.get("saved"):
+        item_similarity_store.film_saved(film["id"], film["genre"])
+
+
+@invalidation_bus.subscribe('genre')
+def genre_updated(pk):
+    genre_catalog.invalidate(pk)
+    bump_catalog_version()
+
+
+@invalidation_bus.subscribe('interactions')
+def interactions_updated(interactions):
+    """Смена версии кэша рекомендаций пользователя и отметка фильмов для пересчета схожести."""
+    recommendation_cache.bump(interactions["user"])
+    for film_id in interactions["films"]:
+        item_similarity_store.mark_interaction(interactions["user"], film_id)
+
+
+@invalidation_bus.subscribe('resync')
+def reset_process_structures(payload):
+    """Сброс всех структур процесса: они перестроятся из базы данных при следующем обращении."""
+    for store in iter_graph_stores():
+        store.reset()
+    film_catalog.invalidate()
+    genre_catalog.invalidate()
+    bump_catalog_version()
+    film_search_store.reset()
+    item_similarity_store.reset()
+    personalized_pagerank_cache.clear()
+    recommendation_cache.clear()
+
+
+def publish_deltas(deltas):
+    """Передает дельты в графы всех процессов после фиксации транзакции."""
+    transaction.on_commit(lambda: invalidation_bus.publish('deltas', deltas))
+
+
+def publish_interactions(user_id, film_ids=()):
+    """После фиксации: кэш рекомендаций пользователя и схожесть фильмов film_ids устаревают во всех процессах."""
+    payload = {"user": user_id, "films": list(film_ids)}
+    transaction.on_commit(lambda: invalidation_bus.publish('interactions', payload))
+
+
+def preferences_changed(user_id, deltas, film_ids=()):
+    """
+    Изменение пакета предпочтений пользователя, сохраненного без сигналов моделей (bulk_create):
+    графы, индекс похожих фильмов, снимок и кэш рекомендаций обновляются один раз на пакет.
+    """
+    publish_deltas(deltas)
+    mark_changed(user_id)
+    publish_interactions(user_id, film_ids)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=Film)
+@receiver(post_save, sender=Genre)
+def node_saved(sender, instance, created, **kwargs):
+    """Добавление узла пользователя, фильма или жанра."""
+    if created:
+        publish_deltas([{"op": "add_node", "type": sender._meta.model_name, "id": instance.pk}])
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=Film)
+@receiver(post_delete, sender=Genre)
+def node_deleted(sender, instance, **kwargs):
+    """Удаление узла вместе со всеми его ребрами."""
+    publish_deltas([{"op": "remove_node", "type": sender._meta.model_name, "id": instance.pk}])
+
+
+@receiver(post_save, sender=Film)
+@receiver(post_delete, sender=Film)
+def film_changed(sender, instance, **kwargs):
+    """Сброс метаданных фильма в кэше каталога; новый фильм или изменение жанра - в индексе похожих фильмов."""
+    film = {"id": instance.pk, "genre": instance.genre_id, "saved": kwargs.get('signal') is post_save}
+    transaction.on_commit(lambda: invalidation_bus.publish('film', film))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_changed(sender, instance, **kwargs):
+    """Сброс метаданных жанра в кэше каталога."""
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidation_bus.publish('genre', pk))
+
+
+@receiver(post_save, sender=UserFilm)
+def user_film_saved(sender, instance, **kwargs):
+    publish_deltas([{"op": "add_edge", "user": instance.user_id, "type": "film", "id": instance.film_id}])
+
+
+@receiver(post_delete, sender=UserFilm)
+def user_film_deleted(sender, instance, **kwargs):
+    # Ребро остается, пока у пользователя есть оценка этого фильма
+    if not Rating.objects.filter(user_id=instance.user_id, film_id=instance.film_id).exists():
+        publish_deltas([{"op": "remove_edge", "user": instance.user_id, "type": "film", "id": instance.film_id}])
+
+
+@receiver(post_save, sender=UserGenre)
+def user_genre_saved(sender, instance, **kwargs):
+    publish_deltas([{"op": "add_edge", "user": instance.user_id, "type": "genre", "id": instance.genre_id}])
+
+
+@receiver(post_delete, sender=UserGenre)
+def user_genre_deleted(sender, instance, **kwargs):
+    publish_deltas([{"op": "remove_edge", "user": instance.user_id, "type": "genre", "id": instance.genre_id}])
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, **kwargs):
+    publish_deltas([{"op": "add_edge", "user": instance.user_id, "type": "film", "id": instance.film_id,
+                     "score": float(instance.rating)}])
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    deltas = [{"op": "remove_edge", "user": instance.user_id, "type": "film", "id": instance.film_id}]
+    # Если фильм просмотрен, ребро остается, но без оценки
+    if UserFilm.objects.filter(user_id=instance.user_id, film_id=instance.film_id).exists():
+        deltas.append({"op": "add_edge", "user": instance.user_id, "type": "film", "id": instance.film_id})
+    publish_deltas(deltas)
+
+
+@receiver(post_save, sender=UserFilm)
+@receiver(post_delete, sender=UserFilm)
+@receiver(post_save, sender=UserGenre)
+@receiver(post_delete, sender=UserGenre)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def interaction_changed(sender, instance, **kwargs):
+    """
+    Снимок и кэш рекомендаций пользователя устаревают вместе с его предпочтениями;
+    схожесть фильма пересчитывается при следующем чтении индекса.
+    """
+    mark_changed(instance.user_id)
+    # Версия меняется после фиксации, чтобы под новой версией не закэшировался результат по старым данным
+    publish_interactions(instance.user_id, [instance.film_id] if sender is not UserGenre else [])
+
+
+@receiver(request_started)
+def process_invalidation_events(sender, **kwargs):
+    """
+    Подключение воркера к шине изменений (если процесс еще не подключен) и выполнение событий других воркеров,
+    полученных с прошлого запроса.
+    """
+    invalidation_bus.start()
+    invalidation_bus.process_pending()
+
+
+@receiver(request_finished)
+def flush_statistics(sender, **kwargs):
+    """Сброс буфера статистики в конце запроса, если записи ждут дольше интервала."""
+    statistics_buffer.flush_if_due()
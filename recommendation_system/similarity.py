@@ -0,0 +1,53 @@
+import numpy as np
+
+# Меры схожести пользователей:
+# common - число общих фильмов и жанров, jaccard - мера Жаккара, cosine - косинусная мера по взаимодействиям,
+# rating - косинусная мера по векторам оценок фильмов
+SIMILARITY_METRICS = ('common', 'jaccard', 'cosine', 'rating')
+
+# Количество схожих пользователей, возвращаемых по умолчанию
+SIMILAR_USERS_TOP_N = 20
+
+
+def check_metric(metric):
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Неизвестная мера схожести '{metric}', доступны: {', '.join(SIMILARITY_METRICS)}")
+
+
+def overlap_similarity(metric, overlaps, user_degree, degrees):
+    """Схожесть по числу общих соседей и степеням пользователей."""
+    overlaps = np.asarray(overlaps, dtype=np.float64)
+    degrees = np.asarray(degrees, dtype=np.float64)
+    if metric == 'jaccard':
+        denominator = user_degree + degrees - overlaps
+    elif metric == 'cosine':
+        denominator = np.sqrt(user_degree * degrees)
+    else:
+        return overlaps
+    return np.divide(overlaps, denominator, out=np.zeros(len(overlaps)), where=denominator > 0)
+
+
+def rating_similarity(dots, user_norm, norms):
+    """Косинусная мера по оценкам: скалярные произведения, деленные на нормы векторов оценок."""
+    denominator = user_norm * np.asarray(norms, dtype=np.float64)
+    return np.divide(dots, denominator, out=np.zeros(len(denominator)), where=denominator > 0)
+
+
+def as_score(metric, value):
+    """Число общих соседей возвращается целым, остальные меры - дробными."""
+    return int(value) if metric == 'common' else float(value)
+
+
+def top_similar(ids, scores, top_n=SIMILAR_USERS_TOP_N):
+    """
+    Позиции top_n пользователей с наибольшей ненулевой схожестью.
+    Порядок: по убыванию схожести, при равенстве - по возрастанию id.
+    """
+    ids, scores = np.asarray(ids), np.asarray(scores)
+    candidates = np.flatnonzero(scores > 0)
+    if top_n is not None and len(candidates) > top_n:
+        # Частичный отбор с запасом на равные значения на границе
+        threshold = np.partition(scores[candidates], len(candidates) - top_n)[len(candidates) - top_n]
+        candidates = candidates[scores[candidates] >= threshold]
+    order = candidates[np.lexsort((ids[candidates], -scores[candidates]))]
+    return order[:top_n] if top_n is not None else order
@@ -0,0 +1,93 @@
+import logging
+import time
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from recommendation_system.models import RecommendationSnapshot
+from recommendation_system.services import get_recommendation_system
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки записей при сохранении снимков
+SNAPSHOT_BATCH_SIZE = 500
+
+
+def get_fresh_snapshot(user_id):
+    """Снимок рекомендаций пользователя, если предпочтения не менялись после расчета."""
+    return RecommendationSnapshot.objects.filter(
+        Q(changed_at__isnull=True) | Q(changed_at__lte=F('computed_at')), user_id=user_id
+    ).first()
+
+
+def mark_changed(user_id):
+    """Отметка изменения предпочтений пользователя: снимок устаревает до следующего пересчета."""
+    RecommendationSnapshot.objects.filter(user_id=user_id).update(changed_at=timezone.now())
+
+
+def users_to_refresh(system, structure):
+    """
+    Пользователи, чьи рекомендации нужно пересчитать: без снимка или с устаревшим снимком,
+    а также их окрестность - пользователи с общими фильмами или жанрами.
+    """
+    changed = set(RecommendationSnapshot.objects.filter(changed_at__gt=F('computed_at'))
+                  .values_list('user_id', flat=True))
+    missing = set(User.objects.filter(recommendation_snapshot__isnull=True).values_list('id', flat=True))
+
+    affected = set(changed)
+    for user_id in changed:
+        affected.update(int(node.split('_')[1]) for node, _ in
+                        system.collaborative_filtering(structure, user_id, top_n=None))
+    return affected | missing
+
+
+def refresh_snapshots(full=False, engine=None):
+    """
+    Пересчет снимков рекомендаций. Без full пересчитываются только пользователи,
+    чья окрестность изменилась после прошлого запуска. Возвращает количество пересчитанных пользователей.
+    """
+    started = time.perf_counter()
+    computed_at = timezone.now()
+    system = get_recommendation_system(engine)
+    structure = system.build_preference_graph()
+
+    if full:
+        user_ids = set(User.objects.values_list('id', flat=True))
+    else:
+        user_ids = users_to_refresh(system, structure)
+    if not user_ids:
+        return 0
+
+    _, top = system.calculate_pagerank(structure)
+    rows = ((user_id, system.get_recommendations(structure, user_id)) for user_id in sorted(user_ids))
+    saved = save_snapshots(rows, top, computed_at)
+    logger.info("Пересчитаны рекомендации %s пользователей за %.3f с", saved, time.perf_counter() - started)
+    return saved
+
+
+def save_snapshots(rows, top, computed_at):
+    """
+    Сохранение снимков пачками по SNAPSHOT_BATCH_SIZE: rows - пары (user_id, рекомендации).
+    Возвращает количество сохраненных снимков.
+    """
+    saved = 0
+    batch = []
+    for user_id, recommendations in rows:
+        batch.append(RecommendationSnapshot(user_id=user_id, films=recommendations["films"],
+                                            genres=recommendations["genres"], top=top, computed_at=computed_at))
+        if len(batch) >= SNAPSHOT_BATCH_SIZE:
+            saved += _upsert(batch)
+            batch = []
+    if batch:
+        saved += _upsert(batch)
+    return saved
+
+
+def _upsert(snapshots):
+    # Изменение предпочтений во время расчета оставит changed_at позже computed_at - снимок останется устаревшим
+    RecommendationSnapshot.objects.bulk_create(
+        snapshots, update_conflicts=True, unique_fields=['user'],
+        update_fields=['films', 'genres', 'top', 'computed_at'],
+    )
+    return len(snapshots)
@@ -0,0 +1,647 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.db import connection
+from scipy import sparse
+
+from recommendation_system.models import Film, Genre, UserFilm, UserGenre, Rating
+from recommendation_system.pagerank import PageRankCache, pagerank, top_k_indices
+from recommendation_system.services import GRAPH_LOAD_CHUNK_SIZE, KNN_K, KNN_MAX_DEPTH, TOP_K, QueryCounter, \
+    iter_batches
+from recommendation_system.scoring import RATING_SCALE, RECOMMENDATIONS_TOP_N, VIEW_RELEVANCE, neighbor_weights, \
+    rank_items
+from recommendation_system.similarity import SIMILAR_USERS_TOP_N, as_score, check_metric, overlap_similarity, \
+    rating_similarity, top_similar
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def _load_ids(queryset, chunk_size):
+    """Чтение списка id в массив numpy."""
+    batches = [np.asarray(batch, dtype=np.int64) for batch in iter_batches(queryset, chunk_size)]
+    return np.concatenate(batches) if batches else np.empty(0, dtype=np.int64)
+
+
+def _load_edges(queryset, chunk_size, columns):
+    """Чтение кортежей взаимодействий в массив numpy формы (n, columns)."""
+    batches = [np.asarray(batch, dtype=np.float64) for batch in iter_batches(queryset, chunk_size)]
+    return np.concatenate(batches) if batches else np.empty((0, columns), dtype=np.float64)
+
+
+def _to_index(ids, values):
+    """Перевод id в индексы по отсортированному массиву ids. Неизвестным id соответствует -1."""
+    positions = np.searchsorted(ids, values)
+    positions = np.clip(positions, 0, max(len(ids) - 1, 0))
+    found = (ids[positions] == values) if len(ids) else np.zeros(len(values), dtype=bool)
+    return np.where(found, positions, -1)
+
+
+def _csr(rows, cols, data, shape, binary=False):
+    matrix = sparse.csr_matrix((np.asarray(data, dtype=np.float32), (rows, cols)), shape=shape)
+    matrix.sum_duplicates()
+    if binary:
+        matrix.data[:] = 1
+    return matrix
+
+
+def _merge(matrix, shape, updates):
+    """
+    Применение точечных изменений к разреженной матрице за один проход.
+    updates - словарь {(row, col): value}, value=None удаляет элемент.
+    """
+    coo = matrix.tocoo()
+    rows, cols, data = coo.row.astype(np.int64), coo.col.astype(np.int64), coo.data
+    if updates:
+        update_rows = np.fromiter((row for row, _ in updates), dtype=np.int64, count=len(updates))
+        update_cols = np.fromiter((col for _, col in updates), dtype=np.int64, count=len(updates))
+        values = np.array([np.nan if value is None else value for value in updates.values()], dtype=np.float32)
+
+        keep = ~np.isin(rows * shape[1] + cols, update_rows * shape[1] + update_cols)
+        added = ~np.isnan(values)
+        rows = np.concatenate([rows[keep], update_rows[added]])
+        cols = np.concatenate([cols[keep], update_cols[added]])
+        data = np.concatenate([data[keep], values[added]])
+    return sparse.csr_matrix((data, (rows, cols)), shape=shape)
+
+
+def _extend(matrix, shape):
+    """Матрица CSR большей формы без копирования данных: новые строки пусты, дописывается только indptr."""
+    if matrix.shape == shape:
+        return matrix
+    indptr = matrix.indptr
+    if shape[0] > matrix.shape[0]:
+        indptr = np.concatenate([indptr, np.full(shape[0] - matrix.shape[0], indptr[-1], dtype=indptr.dtype)])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape, copy=False)
+
+
+def _combine(base, overlay, replaced, axis=0):
+    """Матрица CSR из элементов base вне строк (axis=0) или столбцов (axis=1) replaced и всех элементов overlay."""
+    base, overlay = base.tocoo(), overlay.tocoo()
+    keep = ~replaced[base.row if axis == 0 else base.col]
+    return sparse.csr_matrix((np.concatenate([base.data[keep], overlay.data]),
+                              (np.concatenate([base.row[keep], overlay.row]),
+                               np.concatenate([base.col[keep], overlay.col]))), shape=overlay.shape)
+
+
+class OverlayMatrix:
+    """
+    Разреженная матрица из неизменяемой базы (CSR, в том числе отображенной в память из снимка) и наложения:
+    строки replaced (у транспонированной матрицы, axis=1, - столбцы) берутся из наложения целиком,
+    остальные - из базы. Изменения не копируют базу, операции выполняются над частями по отдельности.
+    Поддерживает операции алгоритмов движка над строками: выбор строк и элементов, умножение, количество
+    элементов; tocsr() собирает обычную матрицу для расчетов по всей матрице.
+    """
+
+    def __init__(self, base, overlay, replaced, axis=0):
+        self.base = base
+        self.overlay = overlay
+        self.replaced = replaced
+        self.axis = axis
+        self.shape = overlay.shape
+        self._keep = sparse.diags((~replaced).astype(np.float32))
+
+    @property
+    def nnz(self):
+        counts = self.base.getnnz(axis=1 - self.axis)
+        return int(counts[~self.replaced].sum()) + self.overlay.nnz
+
+    def getnnz(self, axis=None):
+        if axis is None:
+            return self.nnz
+        if axis == 1 and self.axis == 0:
+            return np.where(self.replaced, 0, self.base.getnnz(axis=1)) + self.overlay.getnnz(axis=1)
+        return self.tocsr().getnnz(axis=axis)
+
+    def __getitem__(self, key):
+        """Строка (номер), строки (массив номеров) или элемент (строка, столбец)."""
+        if isinstance(key, tuple):
+            row, col = key
+            return self[row][0, col]
+        rows = np.atleast_1d(np.asarray(key, dtype=np.int64))
+        replaced = self.replaced[rows] if self.axis == 0 else self.replaced
+        return _combine(self.base[rows], self.overlay[rows], replaced, self.axis)
+
+    def getrow(self, row):
+        return self[row]
+
+    def __matmul__(self, other):
+        if self.axis == 0:
+            return self._keep @ (self.base @ other) + self.overlay @ other
+        return self.base @ (self._keep @ other) + self.overlay @ other
+
+    @property
+    def T(self):
+        return OverlayMatrix(self.base.T, self.overlay.T, self.replaced, 1 - self.axis)
+
+    def tocsr(self):
+        return _combine(self.base, self.overlay, self.replaced, self.axis)
+
+    def tocoo(self):
+        return self.tocsr().tocoo()
+
+
+# Наложение изменений сливается с базовыми матрицами, когда в нем больше этой доли их элементов
+# и больше OVERLAY_MIN_NNZ элементов
+OVERLAY_MAX_SHARE = 0.1
+OVERLAY_MIN_NNZ = 10000
+
+
+class InteractionMatrix:
+    """
+    Граф предпочтений в виде разреженных матриц над непрерывными целочисленными индексами.
+    Строки - пользователи, столбцы - фильмы или жанры; id и индексы связаны прямыми и обратными картами.
+    Дельты не переписывают базовые матрицы (они могут быть отображены в память из снимка и разделяться
+    процессами): строки измененных пользователей хранятся в наложении (OverlayMatrix), которое сливается
+    с базой, только когда разрастается.
+    """
+
+    SAVED_MATRICES = ('user_film', 'user_genre', 'film_scores', 'interactions', 'interactions_t')
+    # Базовая матрица и ключ дельт для нее
+    MATRIX_UPDATES = (('user_film', 'film'), ('film_scores', 'score'), ('user_genre', 'genre'))
+
+    def __init__(self, user_ids, film_ids, genre_ids, user_film, user_genre, film_scores):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.film_ids = np.asarray(film_ids, dtype=np.int64)
+        self.genre_ids = np.asarray(genre_ids, dtype=np.int64)
+        self.user_index = {int(pk): index for index, pk in enumerate(self.user_ids)}
+        self.film_index = {int(pk): index for index, pk in enumerate(self.film_ids)}
+        self.genre_index = {int(pk): index for index, pk in enumerate(self.genre_ids)}
+
+        self._base = {"user_film": user_film.tocsr(), "user_genre": user_genre.tocsr(),
+                      "film_scores": film_scores.tocsr()}
+        # Объединенная базовая матрица и транспонированная к ней с количеством столбцов фильмов в них
+        self._combined = None
+        self._overlay = {}
+        self._replaced = np.zeros(self.n_users, dtype=bool)
+        self._views = dict(self._base)
+        self._pending = {"film": {}, "genre": {}, "score": {}}
+        self._derived = {}
+        # Слияние изменений и прием новых дельт не пересекаются: дельта, пришедшая во время слияния, не теряется
+        self._lock = threading.RLock()
+        self.version = 0
+        self.build_stats = {}
+
+    @classmethod
+    def from_edges(cls, user_ids, film_ids, genre_ids, film_edges=(), genre_edges=(), rating_edges=()):
+        """
+        Построение матриц из массивов id и взаимодействий.
+        film_edges, genre_edges - пары (user_id, object_id), rating_edges - тройки (user_id, film_id, rating).
+        """
+        user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+        film_ids = np.unique(np.asarray(film_ids, dtype=np.int64))
+        genre_ids = np.unique(np.asarray(genre_ids, dtype=np.int64))
+        film_edges = np.asarray(film_edges, dtype=np.float64).reshape(-1, 2)
+        genre_edges = np.asarray(genre_edges, dtype=np.float64).reshape(-1, 2)
+        rating_edges = np.asarray(rating_edges, dtype=np.float64).reshape(-1, 3)
+
+        def index_edges(edges, object_ids):
+            rows = _to_index(user_ids, edges[:, 0].astype(np.int64))
+            cols = _to_index(object_ids, edges[:, 1].astype(np.int64))
+            # Пропускаем взаимодействия с объектами, удаленными во время чтения
+            known = (rows >= 0) & (cols >= 0)
+            return rows[known], cols[known], edges[known]
+
+        film_shape = (len(user_ids), len(film_ids))
+        view_rows, view_cols, _ = index_edges(film_edges, film_ids)
+        rating_rows, rating_cols, ratings = index_edges(rating_edges, film_ids)
+        genre_rows, genre_cols, _ = index_edges(genre_edges, genre_ids)
+
+        user_film = _csr(np.concatenate([view_rows, rating_rows]), np.concatenate([view_cols, rating_cols]),
+                         np.ones(len(view_rows) + len(rating_rows)), film_shape, binary=True)
+        film_scores = _csr(rating_rows, rating_cols, ratings[:, 2], film_shape)
+        user_genre = _csr(genre_rows, genre_cols, np.ones(len(genre_rows)), (len(user_ids), len(genre_ids)),
+                          binary=True)
+        return cls(user_ids, film_ids, genre_ids, user_film, user_genre, film_scores)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Построение матриц по графу networkx движка по умолчанию (узлы вида "user_1", "film_2", "genre_3")."""
+        ids = {"user": [], "film": [], "genre": []}
+        for node in graph:
+            prefix, pk = node.split('_')
+            ids[prefix].append(int(pk))
+        edges = {"film": [], "genre": [], "score": []}
+        for first, second, score in graph.edges(data='score'):
+            user, other = (first, second) if first.startswith('user_') else (second, first)
+            user_id = int(user.split('_')[1])
+            prefix, pk = other.split('_')
+            edges[prefix].append((user_id, int(pk)))
+            if score is not None:
+                edges["score"].append((user_id, int(pk), score))
+        return cls.from_edges(ids["user"], ids["film"], ids["genre"], edges["film"], edges["genre"], edges["score"])
+
+    @classmethod
+    def from_database(cls, chunk_size=GRAPH_LOAD_CHUNK_SIZE):
+        """Построение матриц из базы данных с подсчетом запросов и времени построения."""
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            matrix = cls.from_edges(
+                _load_ids(User.objects.values_list('id', flat=True), chunk_size),
+                _load_ids(Film.objects.values_list('id', flat=True), chunk_size),
+                _load_ids(Genre.objects.values_list('id', flat=True), chunk_size),
+                _load_edges(UserFilm.objects.values_list('user_id', 'film_id'), chunk_size, 2),
+                _load_edges(UserGenre.objects.values_list('user_id', 'genre_id'), chunk_size, 2),
+                _load_edges(Rating.objects.values_list('user_id', 'film_id', 'rating'), chunk_size, 3),
+            )
+        matrix.build_stats = {
+            "queries": counter.count,
+            "seconds": time.perf_counter() - started,
+            "nodes": matrix.n_users + matrix.n_films + matrix.n_genres,
+            "edges": matrix.user_film.nnz + matrix.user_genre.nnz,
+        }
+        logger.info("Матрица взаимодействий построена: %(nodes)s узлов, %(edges)s ребер, "
+                    "%(queries)s запросов за %(seconds).3f с", matrix.build_stats)
+        return matrix
+
+    def save(self, directory):
+        """
+        Сохранение матриц в каталог файлами .npy, пригодными для np.load(mmap_mode='r').
+        Сохраняются и производные объединенные матрицы, чтобы процессы разделяли их страницы, а не строили копии.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ('user_ids', 'film_ids', 'genre_ids'):
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        for name in self.SAVED_MATRICES:
+            matrix = getattr(self, name).tocsr()
+            for part in ('data', 'indices', 'indptr'):
+                np.save(directory / f"{name}.{part}.npy", getattr(matrix, part))
+            np.save(directory / f"{name}.shape.npy", np.asarray(matrix.shape, dtype=np.int64))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Загрузка матриц из каталога; при mmap_mode='r' страницы файлов разделяются процессами без копирования."""
+        directory = Path(directory)
+
+        def load_array(name):
+            return np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+
+        matrices = {}
+        for name in cls.SAVED_MATRICES:
+            shape = tuple(np.load(directory / f"{name}.shape.npy"))
+            matrices[name] = sparse.csr_matrix(
+                (load_array(f"{name}.data"), load_array(f"{name}.indices"), load_array(f"{name}.indptr")),
+                shape=shape, copy=False)
+
+        matrix = cls(load_array("user_ids"), load_array("film_ids"), load_array("genre_ids"),
+                     matrices["user_film"], matrices["user_genre"], matrices["film_scores"])
+        matrix._combined = (matrix.n_films, matrices["interactions"], matrices["interactions_t"])
+        return matrix
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_films(self):
+        return len(self.film_ids)
+
+    @property
+    def n_genres(self):
+        return len(self.genre_ids)
+
+    @property
+    def user_film(self):
+        """Бинарная матрица пользователь-фильм (просмотры и оценки), CSR или OverlayMatrix."""
+        self._flush()
+        return self._views["user_film"]
+
+    @property
+    def user_genre(self):
+        """Бинарная матрица пользователь-жанр, CSR или OverlayMatrix."""
+        self._flush()
+        return self._views["user_genre"]
+
+    @property
+    def film_scores(self):
+        """Матрица оценок пользователь-фильм, CSR или OverlayMatrix."""
+        self._flush()
+        return self._views["film_scores"]
+
+    def derived(self, name, factory):
+        """Кэш производных структур, сбрасывается при изменении матриц."""
+        with self._lock:
+            self._flush()
+            if name not in self._derived:
+                self._derived[name] = factory()
+            return self._derived[name]
+
+    @property
+    def interactions(self):
+        """Объединенная матрица пользователь-(фильмы|жанры), CSR или OverlayMatrix."""
+        return self.derived("interactions", lambda: self._interactions(transposed=False))
+
+    @property
+    def interactions_t(self):
+        """Транспонированная объединенная матрица объект-пользователь, CSR или OverlayMatrix."""
+        return self.derived("interactions_t", lambda: self._interactions(transposed=True))
+
+    def _interactions(self, transposed):
+        """
+        Объединенная матрица над общей базой: база строится один раз (или загружается из снимка)
+        и заново - только после добавления фильма, которое сдвигает столбцы жанров.
+        """
+        if self._combined is None or self._combined[0] != self.n_films:
+            user_film, user_genre = self._base["user_film"], self._base["user_genre"]
+            combined = sparse.hstack([_extend(user_film, (user_film.shape[0], self.n_films)), user_genre],
+                                     format='csr')
+            self._combined = (self.n_films, combined, combined.T.tocsr())
+        _, combined, combined_t = self._combined
+        shape = (self.n_users, self.n_films + self.n_genres)
+        combined, combined_t = _extend(combined, shape), _extend(combined_t, shape[::-1])
+        if not self._overlay:
+            return combined_t if transposed else combined
+        overlay = sparse.hstack([self._overlay["user_film"], self._overlay["user_genre"]], format='csr')
+        if transposed:
+            return OverlayMatrix(combined_t, overlay.T.tocsr(), self._replaced, axis=1)
+        return OverlayMatrix(combined, overlay, self._replaced)
+
+    def _add_node(self, node_type, pk):
+        ids, index = {
+            "user": ("user_ids", self.user_index),
+            "film": ("film_ids", self.film_index),
+            "genre": ("genre_ids", self.genre_index),
+        }[node_type]
+        if pk not in index:
+            index[pk] = len(getattr(self, ids))
+            setattr(self, ids, np.append(getattr(self, ids), np.int64(pk)))
+        return index[pk]
+
+    def apply(self, deltas):
+        """
+        Применение дельт взаимодействий. Изменения копятся и сливаются в матрицы при следующем чтении.
+        Возвращает False, если дельты нельзя применить инкрементально (удаление узла).
+        """
+        with self._lock:
+            for delta in deltas:
+                op = delta["op"]
+                if op == "add_node":
+                    self._add_node(delta["type"], delta["id"])
+                elif op == "remove_node":
+                    return False
+                elif op in ("add_edge", "remove_edge"):
+                    row = self._add_node("user", delta["user"])
+                    col = self._add_node(delta["type"], delta["id"])
+                    if op == "remove_edge":
+                        self._pending[delta["type"]][row, col] = None
+                        if delta["type"] == "film":
+                            self._pending["score"][row, col] = None
+                    else:
+                        self._pending[delta["type"]][row, col] = 1.0
+                        if delta.get("score") is not None:
+                            self._pending["score"][row, col] = float(delta["score"])
+            self._derived = {}
+            self.version += 1
+            return True
+
+    def _flush(self):
+        """
+        Перенос накопленных дельт в наложение: строки измененных пользователей копируются из текущих матриц
+        в наложение и меняются там, база не изменяется. Если наложение больше доли OVERLAY_MAX_SHARE базы
+        (и OVERLAY_MIN_NNZ элементов), оно сливается с базой в новые матрицы.
+        """
+        with self._lock:
+            shapes = {"user_film": (self.n_users, self.n_films), "film_scores": (self.n_users, self.n_films),
+                      "user_genre": (self.n_users, self.n_genres)}
+            if (not any(self._pending.values())
+                    and all(self._views[name].shape == shape for name, shape in shapes.items())):
+                return
+            replaced = np.zeros(self.n_users, dtype=bool)
+            replaced[:len(self._replaced)] = self._replaced
+            replaced[[row for updates in self._pending.values() for row, _ in updates]] = True
+            rows = np.flatnonzero(replaced)
+            self._derived = {}
+            if not len(rows):
+                # Добавлены только узлы: базовые матрицы расширяются без копирования
+                self._replaced = replaced
+                self._views = {name: _extend(self._base[name], shape) for name, shape in shapes.items()}
+                return
+
+            for name, key in self.MATRIX_UPDATES:
+                view = self._views[name]
+                old_rows = rows[rows < view.shape[0]]
+                part = view[old_rows].tocoo()
+                overlay = sparse.csr_matrix((part.data, (old_rows[part.row], part.col)), shape=shapes[name])
+                self._overlay[name] = _merge(overlay, shapes[name], self._pending[key])
+            self._replaced = replaced
+            self._pending = {"film": {}, "genre": {}, "score": {}}
+
+            overlay_nnz = sum(overlay.nnz for overlay in self._overlay.values())
+            base_nnz = sum(base.nnz for base in self._base.values())
+            compact = overlay_nnz > max(OVERLAY_MIN_NNZ, OVERLAY_MAX_SHARE * base_nnz)
+            for name, _ in self.MATRIX_UPDATES:
+                view = OverlayMatrix(_extend(self._base[name], shapes[name]), self._overlay[name], replaced)
+                if compact:
+                    self._base[name] = view = view.tocsr()
+                self._views[name] = view
+            if compact:
+                self._overlay, self._combined = {}, None
+                self._replaced = np.zeros(self.n_users, dtype=bool)
+
+
+def bipartite_adjacency(matrix):
+    """Симметричная матрица смежности графа: сначала пользователи, затем фильмы, затем жанры."""
+    interactions = matrix.interactions.tocoo()
+    n = matrix.n_users + interactions.shape[1]
+    rows = np.concatenate([interactions.row, interactions.col + matrix.n_users])
+    cols = np.concatenate([interactions.col + matrix.n_users, interactions.row])
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+
+def similar_user_indices(matrix, user, metric='common', top_n=SIMILAR_USERS_TOP_N):
+    """
+    Индексы top_n наиболее схожих пользователей и значения схожести.
+    Схожесть со всеми пользователями считается одним умножением разреженной матрицы на вектор.
+    """
+    if metric == 'rating':
+        scores_matrix = matrix.film_scores
+        dots = np.asarray((scores_matrix @ scores_matrix.getrow(user).T).todense()).ravel()
+        norms = matrix.derived("rating_norms", lambda: np.sqrt(
+            np.asarray(scores_matrix.tocsr().power(2).sum(axis=1)).ravel()))
+        scores = rating_similarity(dots, norms[user], norms)
+    else:
+        interactions = matrix.interactions
+        overlaps = np.asarray((interactions @ interactions.getrow(user).T).todense()).ravel()
+        degrees = matrix.derived("degrees", lambda: interactions.getnnz(axis=1))
+        scores = overlap_similarity(metric, overlaps, degrees[user], degrees)
+    scores[user] = 0
+    similar = top_similar(matrix.user_ids, scores, top_n)
+    return similar, scores[similar]
+
+
+def row_neighbors(matrix, rows):
+    """
+    Уникальные индексы столбцов ненулевых элементов строк rows матрицы CSR (или OverlayMatrix),
+    без обхода остальных строк.
+    """
+    if isinstance(matrix, OverlayMatrix):
+        return np.unique(matrix[rows].indices)
+    starts, ends = matrix.indptr[rows], matrix.indptr[np.asarray(rows) + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=matrix.indices.dtype)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return np.unique(matrix.indices[offsets])
+
+
+def nearest_user_indices(matrix, user, k, max_depth=KNN_MAX_DEPTH):
+    """
+    Индексы k ближайших пользователей и расстояния до них: поиск в ширину по двудольному графу.
+    Фронт обхода раскрывается по строкам CSR: стоимость зависит от окрестности пользователя, а не от размера графа.
+    Обход останавливается на уровне, где набрано k пользователей, или на глубине max_depth.
+    """
+    interactions, interactions_t = matrix.interactions, matrix.interactions_t
+    frontier = reached = np.array([user])
+    seen_items = np.empty(0, dtype=np.int64)
+    nearest, distances = [], []
+    depth = found = 0
+    while found < k and (max_depth is None or depth + 2 <= max_depth):
+        items = np.setdiff1d(row_neighbors(interactions, frontier), seen_items, assume_unique=True)
+        if not len(items):
+            break
+        seen_items = np.union1d(seen_items, items)
+        frontier = np.setdiff1d(row_neighbors(interactions_t, items), reached, assume_unique=True)
+        reached = np.union1d(reached, frontier)
+        depth += 2
+        # Пользователи текущего уровня упорядочены по id
+        nearest.append(frontier[np.argsort(matrix.user_ids[frontier], kind='stable')])
+        distances.append(np.full(len(frontier), depth, dtype=np.int64))
+        found += len(frontier)
+
+    if not nearest:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(nearest)[:k], np.concatenate(distances)[:k]
+
+
+def matrix_pagerank(matrix, previous=None):
+    """
+    PageRank матрицы взаимодействий; previous - размеры сегментов и оценки предыдущей версии.
+    Индексы при дельтах только дописываются в конец сегментов, поэтому старый вектор дополняется для теплого старта.
+    """
+    sizes = (matrix.n_users, matrix.n_films, matrix.n_genres)
+    n = sum(sizes)
+    start = None
+    if previous is not None and all(old <= new for old, new in zip(previous[0], sizes)):
+        segments = np.split(previous[1], np.cumsum(previous[0])[:-1])
+        start = np.concatenate([np.pad(segment, (0, new - old), constant_values=1.0 / n)
+                                for segment, old, new in zip(segments, previous[0], sizes)])
+    scores = pagerank(bipartite_adjacency(matrix), start=start)
+
+    film_scores = scores[matrix.n_users:matrix.n_users + matrix.n_films]
+    genre_scores = scores[matrix.n_users + matrix.n_films:]
+    item_scores = scores[matrix.n_users:]
+    labels = [f"film_{pk}" for pk in matrix.film_ids] + [f"genre_{pk}" for pk in matrix.genre_ids]
+    sorted_top_nodes = {labels[index]: float(item_scores[index])
+                        for index in np.argsort(-item_scores, kind='stable')}
+    top_ids = {
+        "top_5_films": matrix.film_ids[top_k_indices(film_scores, TOP_K)].tolist(),
+        "top_5_genres": matrix.genre_ids[top_k_indices(genre_scores, TOP_K)].tolist(),
+    }
+    return (sorted_top_nodes, top_ids), (sizes, scores)
+
+
+def film_relevance(matrix, users):
+    """Релевантность фильмов для пользователей users: по оценке, если она есть, иначе как просмотр."""
+    viewed = matrix.user_film[users]
+    rated = matrix.film_scores[users]
+    rated_mask = rated.copy()
+    rated_mask.data = np.ones(len(rated_mask.data))
+    rated.data = rated.data / RATING_SCALE
+    return viewed * VIEW_RELEVANCE - rated_mask * VIEW_RELEVANCE + rated
+
+
+def _rank_columns(scores, own, user, ids, top_n):
+    """Рейтинг столбцов разреженной строки оценок без объектов, которые уже есть у пользователя."""
+    scores = scores.tocsr()
+    columns = scores.indices
+    keep = ~np.isin(columns, own[user].indices)
+    return rank_items(ids[columns[keep]], scores.data[keep], top_n)
+
+
+class SparseRecommendationSystem:
+    """Реализация системы рекомендаций над разреженными матрицами взаимодействий"""
+
+    _pagerank_cache = PageRankCache()
+
+    @staticmethod
+    def build_preference_graph(chunk_size=GRAPH_LOAD_CHUNK_SIZE):
+        """
+        Загрузка матрицы взаимодействий из снимка на диске (GRAPH_SNAPSHOT_DIR) с дозагрузкой изменений,
+        при отсутствии актуального снимка - построение из базы данных.
+        """
+        # Импорт внутри метода: модуль снимка сам импортирует InteractionMatrix
+        from recommendation_system.graph_snapshot import load_graph_snapshot
+
+        return load_graph_snapshot() or InteractionMatrix.from_database(chunk_size)
+
+    @staticmethod
+    def apply_deltas(matrix, deltas):
+        """Применение изменений взаимодействий к матрице."""
+        return matrix.apply(deltas)
+
+    @staticmethod
+    def interaction_matrix(matrix):
+        return matrix
+
+    @staticmethod
+    def calculate_pagerank(matrix):
+        """
+        Оценка важности фильмов и жанров по PageRank двудольного графа.
+        Возвращает оценки фильмов и жанров и id топ фильмов и жанров.
+        Результат кэшируется по версии матрицы и пересчитывается с теплым стартом после изменений.
+        """
+        return SparseRecommendationSystem._pagerank_cache.get(
+            matrix, matrix.version, lambda previous: matrix_pagerank(matrix, previous))
+
+    @staticmethod
+    def collaborative_filtering(matrix, user_id, metric='common', top_n=SIMILAR_USERS_TOP_N):
+        """Схожие пользователи по мере metric (см. SIMILARITY_METRICS), top_n наиболее схожих."""
+        check_metric(metric)
+        user = matrix.user_index.get(user_id)
+        if user is None:
+            return []
+        similar, scores = similar_user_indices(matrix, user, metric, top_n)
+        return [(f"user_{matrix.user_ids[index]}", as_score(metric, score)) for index, score in zip(similar, scores)]
+
+    @staticmethod
+    def k_nearest_neighbors(matrix, user_id, k=KNN_K, max_depth=KNN_MAX_DEPTH):
+        """Ближайшие пользователи по длине кратчайшего пути в графе (не дальше max_depth)."""
+        user = matrix.user_index.get(user_id)
+        if user is None:
+            return []
+        nearest, distances = nearest_user_indices(matrix, user, k, max_depth)
+        return [(f"user_{matrix.user_ids[index]}", int(distance)) for index, distance in zip(nearest, distances)]
+
+    @staticmethod
+    def get_recommendations(matrix, user_id, k=KNN_K, metric='common', top_n=RECOMMENDATIONS_TOP_N):
+        """Метод для получения рекомендаций фильмов и жанров для пользователя: пары (id, оценка)."""
+        if user_id not in matrix.user_index:
+            return {"films": [], "genres": []}
+        return SparseRecommendationSystem.score_candidates(
+            matrix, user_id, SparseRecommendationSystem.collaborative_filtering(matrix, user_id, metric),
+            SparseRecommendationSystem.k_nearest_neighbors(matrix, user_id, k), top_n)
+
+    @staticmethod
+    def score_candidates(matrix, user_id, similar_users, nearest_neighbors, top_n=RECOMMENDATIONS_TOP_N):
+        """Оценка кандидатов по уже найденным схожим пользователям и ближайшим соседям."""
+        user = matrix.user_index.get(user_id)
+        weights = neighbor_weights(similar_users, nearest_neighbors)
+        if user is None or not weights:
+            return {"films": [], "genres": []}
+        users = np.fromiter((matrix.user_index[int(node.split('_')[1])] for node in weights), dtype=np.int64,
+                            count=len(weights))
+        # Разреженная строка весов: оценки считаются только по объектам окрестности, без плотных векторов каталога
+        weight_row = sparse.csr_matrix(np.fromiter(weights.values(), dtype=np.float64, count=len(weights))[None, :])
+
+        return {
+            "films": _rank_columns(weight_row @ film_relevance(matrix, users), matrix.user_film, user,
+                                   matrix.film_ids, top_n),
+            "genres": _rank_columns(weight_row @ matrix.user_genre[users], matrix.user_genre, user,
+                                    matrix.genre_ids, top_n),
+        }
@@ -0,0 +1,109 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from recommendation_system.models import RecommendationStatistics
+
+logger = logging.getLogger(__name__)
+
+
+class StatisticsBuffer:
+    """
+    Буфер записей статистики процесса: записи копятся в памяти и сохраняются одним bulk_create,
+    когда набрано max_size записей или самой старой записи больше flush_interval секунд.
+    По времени буфер сбрасывается фоновым потоком и в конце запроса, а также при завершении процесса.
+    flush_interval = 0 - сброс в конце каждого запроса без фонового потока.
+    """
+
+    # Во сколько раз буфер может превысить max_size, пока база данных недоступна
+    RETRY_LIMIT = 10
+
+    def __init__(self, model, max_size=None, flush_interval=None):
+        self.model = model
+        self._max_size = max_size
+        self._flush_interval = flush_interval
+        self._reset()
+        # Дочерний процесс (воркер gunicorn после fork) начинает с пустым буфером: записи родителя сохранит родитель
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._rows = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = os.getpid()
+
+    @property
+    def max_size(self):
+        return self._max_size if self._max_size is not None else settings.STATISTICS_BUFFER_SIZE
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval if self._flush_interval is not None else settings.STATISTICS_FLUSH_INTERVAL
+
+    def add(self, instance):
+        """Добавление несохраненного объекта модели; при заполнении буфера он сбрасывается в базу данных."""
+        with self._lock:
+            self._rows.append(instance)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._rows) >= self.max_size
+        if full:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def flush(self):
+        """Сохранение накопленных записей. Возвращает количество сохраненных записей."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._oldest = None
+        if not rows:
+            return 0
+        try:
+            self.model.objects.bulk_create(rows)
+        except Exception:
+            logger.exception("Не удалось сохранить %s записей статистики, повтор при следующем сбросе", len(rows))
+            with self._lock:
+                # Размер буфера ограничен: при недоступной базе данных отбрасываются самые старые записи
+                self._rows = (rows + self._rows)[-self.max_size * self.RETRY_LIMIT:]
+                self._oldest = time.monotonic()
+            return 0
+        return len(rows)
+
+    def flush_if_due(self):
+        """Сброс, если самая старая запись ждет дольше flush_interval."""
+        with self._lock:
+            due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+        if due:
+            self.flush()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
+
+    def _ensure_thread(self):
+        if self.flush_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='statistics-buffer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while self._pid == os.getpid():
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_if_due()
+            finally:
+                # Соединение потока не должно оставаться открытым между сбросами
+                connection.close()
+
+
+statistics_buffer = StatisticsBuffer(RecommendationStatistics)
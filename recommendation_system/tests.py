@@ -1,11 +1,63 @@
+import queue
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import numpy as np
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
-from .models import Film, Genre, UserGenre, Rating, RecommendationStatistics, UserFilm
+from .models import Film, Genre, UserGenre, Rating, RecommendationStatistics, UserFilm, RecommendationSnapshot, \
+    DailyStatistics, HourlyStatistics
+from .ann import IVFIndex
+from .catalog import HOME_FILMS_PAGE_SIZE, bump_catalog_version, film_catalog, genre_catalog
+from .factorization import get_factor_model
+from .film_search import SEARCH_MAX_LIMIT, film_search_store
+from .graph_snapshot import load_graph_snapshot
+from .invalidation import InvalidationBus, LoopbackTransport, invalidation_bus
+from .item_similarity import item_similarity_store
+from .pagerank import forward_push, pagerank, top_k_indices
+from .personalized_pagerank import personalized_pagerank, personalized_pagerank_cache, seed_distribution
+from .precompute import precompute_recommendations
+from .recommendation_cache import RecommendationCache, recommendation_cache
+from .rollups import compact_statistics
+from .services import RecommendationSystem, get_graph_store, iter_graph_stores
+from .signals import process_invalidation_events
+from .similarity import SIMILARITY_METRICS
+from .snapshots import refresh_snapshots
+from .statistics_buffer import StatisticsBuffer, statistics_buffer
+from . import sparse_engine
+from .sparse_engine import InteractionMatrix, OverlayMatrix, SparseRecommendationSystem, bipartite_adjacency
+
+
+def reset_process_caches():
+    """Сброс графов и кэшей процесса между тестами: база данных откатывается, а они живут дольше теста."""
+    for store in iter_graph_stores():
+        store.reset()
+    film_catalog.invalidate()
+    genre_catalog.invalidate()
+    recommendation_cache.clear()
+    item_similarity_store.reset()
+    personalized_pagerank_cache.clear()
+    film_search_store.reset()
+    cache.clear()
 
 
 class RecommendationSystemTestCase(TestCase):
@@ -23,6 +75,7 @@ class RecommendationSystemTestCase(TestCase):
         self.rating = Rating.objects.create(user=self.user, film=self.film, rating=5)
         # Создаем статистику рекомендаций для пользователя
         self.statistic = RecommendationStatistics.objects.create(user=self.user, film_count=5, genre_count=2)
+        reset_process_caches()
 
     def test_home_page_get(self):
         """Тестируем GET запрос на главную страницу."""
@@ -84,6 +137,7 @@ class RecommendationSystemTestCase(TestCase):
 
     def test_statistic_view(self):
         """Тестируем представление статистики рекомендаций."""
+        compact_statistics()
         response = self.client.get(reverse('recommendation_system:statistics'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'recommendation_system/statistics.html')
@@ -145,8 +199,81 @@ class PreferenceCreateAPIViewTestCase(APITestCase):
         self.assertIn("error", response.data)
 
 
+class BulkPreferenceCreateAPIViewTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.client.force_authenticate(user=self.user)
+        self.genre = Genre.objects.create(name='Action')
+        self.films = [Film.objects.create(title=f'Film {i}', release_date="2024-05-20", genre=self.genre,
+                                          director="test_director") for i in range(3)]
+        Rating.objects.create(user=self.user, film=self.films[0], rating=3)
+        self.url = reverse('recommendation_system:add-preference-bulk')
+
+    def test_mixed_batch_with_per_item_results(self):
+        """Тестируем пакет из оценок, просмотров и жанров с ошибочными элементами и результаты по элементам."""
+        a, b, c = self.films
+        items = [
+            {'film': a.id, 'rating': 8},
+            {'film': b.id, 'rating': 6},
+            {'film': c.id},
+            {'film': c.id},
+            {'genre': self.genre.id},
+            {'film': 999999},
+            {'film': b.id, 'rating': 'x'},
+            {'unknown': 1},
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results],
+                         ['updated', 'created', 'created', 'created', 'created', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('film', results[5]["errors"])
+        self.assertIn('rating', results[6]["errors"])
+        self.assertEqual(Rating.objects.get(user=self.user, film=a).rating, 8)
+        self.assertEqual(Rating.objects.get(user=self.user, film=b).rating, 6)
+        self.assertEqual(UserFilm.objects.filter(user=self.user, film=c).count(), 1)
+        self.assertTrue(UserGenre.objects.filter(user=self.user, genre=self.genre).exists())
+
+        response = self.client.post(self.url, [{'film': c.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["results"][0]["status"], 'exists')
+        self.assertEqual(self.client.post(self.url, {'film': c.id}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_primary_keys(self):
+        """Тестируем, что нецелые и слишком большие id фильма - ошибки элементов, а не ошибка сервера."""
+        items = [{'film': value} for value in ('²', '½', '-1', ' 1', 1.5, 2 ** 63, str(2 ** 64))]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result["status"] for result in response.data["results"]], ['invalid'] * len(items))
+        self.assertTrue(all('film' in result["errors"] for result in response.data["results"]))
+
+    def test_graph_and_caches_updated_once_per_batch(self):
+        """Тестируем, что число запросов и обновлений графа и кэша не зависит от размера пакета."""
+        films = self.films + [Film.objects.create(title=f'More {i}', release_date="2024-05-20", genre=self.genre,
+                                                  director="test_director") for i in range(20)]
+        store = get_graph_store('networkx')
+        graph = store.get_graph()
+        version = graph.graph.get("version", 0)
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, [{'film': film.id} for film in films[1:3]], format='json')
+        with patch.object(recommendation_cache, 'bump') as bump, self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as large:
+                response = self.client.post(self.url, [{'film': film.id, 'rating': 7} for film in films],
+                                            format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(small), len(large))
+        bump.assert_called_once_with(self.user.id)
+        self.assertEqual(graph.graph["version"], version + 1)
+        self.assertEqual(graph.edges[f"user_{self.user.id}", f"film_{films[-1].id}"]["score"], 7)
+
+
 class RecommendationAPIViewTestCase(APITestCase):
     def setUp(self):
+        reset_process_caches()
         self.client = APIClient()
         User = get_user_model()
         self.user = User.objects.create_user(username='testuser', password='12345')
@@ -164,9 +291,76 @@ class RecommendationAPIViewTestCase(APITestCase):
         self.assertIn('top', response.data)
         self.assertIn('recommendations', response.data)
 
+    def test_recommendations_carry_ids(self):
+        """Тестируем, что рекомендации содержат id и метаданные из кэша каталога."""
+        User = get_user_model()
+        other = User.objects.create_user(username='other', password='12345')
+        second = Film.objects.create(title='Second Film', release_date="2024-05-20", genre=self.genre,
+                                     director="test_director")
+        Rating.objects.create(user=self.user, film=self.film, rating=5)
+        Rating.objects.create(user=other, film=self.film, rating=7)
+        UserFilm.objects.create(user=other, film=second)
+        UserGenre.objects.create(user=other, genre=self.genre)
+
+        response = self.client.get(reverse('recommendation_system:recommendation'))
+        films = response.data["recommendations"]["films"]
+        # Схожесть 1 и расстояние 2 дают вес 1.5, просмотренный без оценки фильм - релевантность 0.5
+        self.assertEqual(films, [{"id": second.id, "title": second.title, "image": None, "rating": None,
+                                  "score": 0.75}])
+        self.assertEqual(response.data["recommendations"]["genres"],
+                         [{"id": self.genre.id, "name": "Action", "score": 1.5}])
+        self.assertEqual(response.data["top"]["top_5_genres"][0]["id"], self.genre.id)
+
+    def test_ranked_recommendations_with_limit_and_offset(self):
+        """Тестируем порядок по оценке, исключение своих фильмов и срез по limit и offset."""
+        User = get_user_model()
+        other = User.objects.create_user(username='other', password='12345')
+        films = [Film.objects.create(title=f'Film {index}', release_date="2024-05-20", genre=self.genre,
+                                     director="test_director") for index in range(3)]
+        UserFilm.objects.create(user=self.user, film=self.film)
+        for film in [self.film] + films:
+            UserFilm.objects.create(user=other, film=film)
+        Rating.objects.create(user=other, film=films[2], rating=10)
+        Rating.objects.create(user=other, film=films[0], rating=2)
+
+        url = reverse('recommendation_system:recommendation')
+        response = self.client.get(url)
+        self.assertEqual([film["id"] for film in response.data["recommendations"]["films"]],
+                         [films[2].id, films[1].id, films[0].id])
+
+        response = self.client.get(url, {"limit": 1, "offset": 1})
+        self.assertEqual([film["id"] for film in response.data["recommendations"]["films"]], [films[1].id])
+        self.assertEqual(self.client.get(url, {"limit": "x"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        reset_process_caches()
+        self.genre = Genre.objects.create(name='Action')
+        self.films = [Film.objects.create(title=f'Film {index}', release_date="2024-05-20", genre=self.genre,
+                                          director="test_director") for index in range(3)]
+
+    def test_constant_queries(self):
+        """Тестируем, что метаданные загружаются одним запросом и далее берутся из кэша."""
+        ids = [film.id for film in reversed(self.films)]
+        with self.assertNumQueries(1):
+            entries = film_catalog.get_many(ids)
+        self.assertEqual([entry["id"] for entry in entries], ids)
+        with self.assertNumQueries(0):
+            film_catalog.get_many(ids)
+
+    def test_invalidated_on_save(self):
+        """Тестируем сброс записи при изменении фильма."""
+        film_catalog.get_many([self.films[0].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.films[0].title = 'Renamed'
+            self.films[0].save()
+        self.assertEqual(film_catalog.get_many([self.films[0].id])[0]["title"], 'Renamed')
+
 
 class RecommendationStatisticsAPIViewTestCase(APITestCase):
     def setUp(self):
+        reset_process_caches()
         self.client = APIClient()
         User = get_user_model()
         self.user = User.objects.create_user(username='testuser', password='12345')
@@ -179,3 +373,1037 @@ class RecommendationStatisticsAPIViewTestCase(APITestCase):
         self.assertIn('pagerank_scores', response.data)
         self.assertIn('similar_users', response.data)
         self.assertIn('k_neighbors', response.data)
+
+
+class RecommendationCacheTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{index}', password='12345') for index in range(2)]
+        self.genre = Genre.objects.create(name='Action')
+        self.films = [Film.objects.create(title=f'Film {index}', release_date="2024-05-20", genre=self.genre,
+                                          director="test_director") for index in range(2)]
+        UserFilm.objects.create(user=self.users[0], film=self.films[0])
+        UserFilm.objects.create(user=self.users[1], film=self.films[0])
+        self.url = reverse('recommendation_system:recommendation')
+
+    def recommended_film_ids(self, user):
+        self.client.force_authenticate(user=user)
+        return [film["id"] for film in self.client.get(self.url).data["recommendations"]["films"]]
+
+    def test_cached_per_user_and_invalidated_by_changes(self):
+        """Тестируем, что кэш разделен по пользователям и сбрасывается при изменении предпочтений."""
+        self.assertEqual(self.recommended_film_ids(self.users[0]), [])
+        self.assertEqual(self.recommended_film_ids(self.users[0]), [])
+        self.assertEqual(recommendation_cache.stats()["l1_hits"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserFilm.objects.create(user=self.users[1], film=self.films[1])
+        self.assertEqual(self.recommended_film_ids(self.users[0]), [])
+        self.assertEqual(self.recommended_film_ids(self.users[1]), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(user=self.users[0], film=self.films[0], rating=9)
+        self.assertEqual(self.recommended_film_ids(self.users[0]), [self.films[1].id])
+        self.assertEqual(recommendation_cache.stats()["misses"], 3)
+
+    def test_l2_hits_and_evictions(self):
+        """Тестируем чтение из L2 после вытеснения из L1 и счетчик вытеснений."""
+        small = RecommendationCache(max_entries=1, timeout=60)
+        self.assertEqual(small.get_or_compute('test', 1, lambda: "first"), "first")
+        small.get_or_compute('test', 2, lambda: "second")
+        self.assertEqual(small.get_or_compute('test', 1, lambda: "computed again"), "first")
+        self.assertEqual(small.stats(), {"l1_hits": 0, "l2_hits": 1, "misses": 2, "evictions": 2, "l1_size": 1})
+
+        small.bump(1)
+        self.assertEqual(small.get_or_compute('test', 1, lambda: "new"), "new")
+
+    def test_statistics_cache_without_pagerank(self):
+        """Тестируем, что в кэше пользователя нет общих оценок PageRank, а в ответе они есть."""
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse('recommendation_system:recommendation_statistics'))
+        self.assertIn(f"film_{self.films[0].id}", response.data["pagerank_scores"])
+        cached = [value for _, value in recommendation_cache._entries.values() if isinstance(value, dict)]
+        self.assertEqual([sorted(value) for value in cached], [['k_neighbors', 'similar_users']])
+
+
+class RecommendationOverviewAPIViewTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{index}', password='12345') for index in range(2)]
+        genre = Genre.objects.create(name='Action')
+        self.films = [Film.objects.create(title=f'Film {index}', release_date="2024-05-20", genre=genre,
+                                          director="test_director") for index in range(2)]
+        UserFilm.objects.create(user=self.users[0], film=self.films[0])
+        UserFilm.objects.create(user=self.users[1], film=self.films[0])
+        UserFilm.objects.create(user=self.users[1], film=self.films[1])
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_single_computation_pass(self):
+        """Тестируем, что рекомендации, топ и статистика считаются по одному поиску схожих пользователей."""
+        collaborative_filtering = RecommendationSystem.collaborative_filtering
+        k_nearest_neighbors = RecommendationSystem.k_nearest_neighbors
+        with patch.object(RecommendationSystem, 'collaborative_filtering', wraps=collaborative_filtering) as cf, \
+                patch.object(RecommendationSystem, 'k_nearest_neighbors', wraps=k_nearest_neighbors) as knn:
+            response = self.client.get(reverse('recommendation_system:recommendation_overview'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cf.call_count, 1)
+        self.assertEqual(knn.call_count, 1)
+        self.assertEqual([film["id"] for film in response.data["recommendations"]["films"]], [self.films[1].id])
+        self.assertEqual(response.data["statistics"]["similar_users"], [(f"user_{self.users[1].id}", 1)])
+        self.assertIn("top_5_films", response.data["top"])
+
+
+class StatisticsBufferTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+
+    def test_no_rows_lost_under_concurrent_adds(self):
+        """Тестируем, что при одновременных добавлениях и сбросах ни одна запись не теряется."""
+        buffer = StatisticsBuffer(RecommendationStatistics, max_size=10 ** 6, flush_interval=0)
+        threads = [threading.Thread(target=lambda: [buffer.add(RecommendationStatistics(user=self.user))
+                                                    for _ in range(250)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        saved = 0
+        # Сбросы в основном потоке идут одновременно с добавлениями
+        while any(thread.is_alive() for thread in threads):
+            saved += buffer.flush()
+        for thread in threads:
+            thread.join()
+        saved += buffer.flush()
+
+        self.assertEqual(saved, 2000)
+        self.assertEqual(RecommendationStatistics.objects.filter(user=self.user).count(), 2000)
+        self.assertEqual(len(buffer), 0)
+
+    def test_flush_on_size_threshold(self):
+        """Тестируем сброс буфера при заполнении."""
+        buffer = StatisticsBuffer(RecommendationStatistics, max_size=3, flush_interval=3600)
+        for _ in range(2):
+            buffer.add(RecommendationStatistics(user=self.user))
+        buffer.flush_if_due()
+        self.assertEqual(RecommendationStatistics.objects.count(), 0)
+        buffer.add(RecommendationStatistics(user=self.user))
+        self.assertEqual(RecommendationStatistics.objects.count(), 3)
+
+    def test_flush_at_end_of_request(self):
+        """Тестируем, что статистика выдачи сохраняется после ответа с временем выдачи."""
+        self.client.force_authenticate(user=self.user)
+        before = timezone.now()
+        self.client.get(reverse('recommendation_system:recommendation'))
+        statistic = RecommendationStatistics.objects.get(user=self.user)
+        self.assertGreaterEqual(statistic.timestamp, before)
+        self.assertEqual(len(statistics_buffer), 0)
+
+
+class StatisticsRollupTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.now = timezone.now().replace(hour=12, minute=30)
+
+    def add_statistics(self, *rows):
+        RecommendationStatistics.objects.bulk_create([
+            RecommendationStatistics(user=self.user, film_count=films, genre_count=genres, timestamp=timestamp)
+            for films, genres, timestamp in rows
+        ])
+
+    def test_incremental_compaction(self):
+        """Тестируем, что повторное сжатие добавляет к агрегатам только новые записи."""
+        self.add_statistics((4, 1, self.now), (8, 3, self.now - timedelta(hours=1)))
+        self.assertEqual(compact_statistics()["compacted"], 2)
+        self.add_statistics((2, 2, self.now))
+        self.assertEqual(compact_statistics()["compacted"], 1)
+        self.assertEqual(compact_statistics()["compacted"], 0)
+
+        daily = DailyStatistics.objects.get(user=self.user)
+        self.assertEqual((daily.count, daily.film_count_min, daily.film_count_max), (3, 2, 8))
+        self.assertEqual(daily.film_count_avg, 14 / 3)
+        self.assertEqual(daily.genre_count_sum, 6)
+        self.assertEqual(sorted(HourlyStatistics.objects.values_list('count', flat=True)), [1, 2])
+
+    def test_retention(self):
+        """Тестируем, что удаляются только учтенные в агрегатах записи старше срока хранения."""
+        self.add_statistics((1, 1, self.now - timedelta(days=40)), (1, 1, self.now))
+        self.assertEqual(compact_statistics(retention_days=30), {"compacted": 2, "deleted": 1})
+        self.assertEqual(RecommendationStatistics.objects.count(), 1)
+        self.assertEqual(DailyStatistics.objects.count(), 2)
+
+
+class ExplainIndexesCommandTestCase(TestCase):
+    def test_plans_before_and_after(self):
+        """Тестируем, что команда показывает планы без индексов и с ними и не меняет схему."""
+        User = get_user_model()
+        user = User.objects.create_user(username='testuser', password='12345')
+        genre = Genre.objects.create(name='Action')
+        film = Film.objects.create(title='Film', release_date="2024-05-20", genre=genre, director="test_director")
+        UserFilm.objects.create(user=user, film=film)
+
+        out = StringIO()
+        call_command('explain_indexes', stdout=out)
+        before, after = out.getvalue().split("Пользователи фильма")[1].split("с индексами:")[:2]
+        self.assertNotIn("userfilm_film_user_idx", before)
+        self.assertIn("userfilm_film_user_idx", after.split("Оценки фильма")[0])
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, UserFilm._meta.db_table)
+        self.assertIn("userfilm_film_user_idx", indexes)
+
+
+class ItemSimilarityTestCase(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{i}', password='12345') for i in range(3)]
+        self.client.force_authenticate(user=self.users[0])
+        action, drama = Genre.objects.create(name='Action'), Genre.objects.create(name='Drama')
+        self.films = [Film.objects.create(title=f'Film {i}', release_date="2024-05-20",
+                                          genre=action if i < 4 else drama, director="test_director")
+                      for i in range(5)]
+        a, b, c, _, _ = self.films
+        for user, films in ((self.users[0], (a, b)), (self.users[1], (a, b, c))):
+            for film in films:
+                UserFilm.objects.create(user=user, film=film)
+        reset_process_caches()
+
+    def test_similar_films_by_co_views_and_genre(self):
+        """Тестируем порядок похожих фильмов: совместные просмотры, затем популярные фильмы того же жанра."""
+        a, b, c, d, e = self.films
+        similar = item_similarity_store.similar(a.id)
+        self.assertEqual([pk for pk, _ in similar], [b.id, c.id, d.id])
+        self.assertGreater(similar[0][1], similar[1][1])
+
+        response = self.client.get(reverse('recommendation_system:film', args=[a.id]))
+        self.assertEqual([film['id'] for film in response.data['similar_films']], [b.id, c.id, d.id])
+
+    def test_incremental_update(self):
+        """Тестируем, что новый просмотр пересчитывает строки затронутых фильмов без перестроения индекса."""
+        a, _, _, _, e = self.films
+        index = item_similarity_store.get_index()
+        self.assertNotIn(e.id, [pk for pk, _ in index.similar(a.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserFilm.objects.create(user=self.users[2], film=a)
+            UserFilm.objects.create(user=self.users[2], film=e)
+
+        self.assertIs(item_similarity_store.get_index(), index)
+        self.assertIn(e.id, [pk for pk, _ in item_similarity_store.similar(a.id)])
+        self.assertIn(a.id, [pk for pk, _ in item_similarity_store.similar(e.id)])
+
+    def test_configured_engine(self):
+        """Тестируем, что индекс строится по графу движка из настроек, без второго графа в процессе."""
+        a, b, c, d, _ = self.films
+        for engine, other in (('networkx', 'sparse'), ('sparse', 'networkx')):
+            with self.subTest(engine=engine), self.settings(RECOMMENDATION_ENGINE=engine):
+                reset_process_caches()
+                self.assertEqual([pk for pk, _ in item_similarity_store.similar(a.id)], [b.id, c.id, d.id])
+                self.assertTrue(get_graph_store(engine).is_built)
+                self.assertFalse(get_graph_store(other).is_built)
+
+
+class FactorizationTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(FACTORIZATION_DIR=self.directory))
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{i}', password='12345') for i in range(6)]
+        self.genres = [Genre.objects.create(name='Action'), Genre.objects.create(name='Drama')]
+        self.films = [Film.objects.create(title=f'Film {i}', release_date="2024-05-20", genre=self.genres[i // 3],
+                                          director="test_director") for i in range(6)]
+        # Две группы: пользователи 0-2 смотрят фильмы 0-2, пользователи 3-5 - фильмы 3-5
+        for user in range(6):
+            group = self.films[:3] if user < 3 else self.films[3:]
+            for film in group[:2] if user in (0, 3) else group:
+                UserFilm.objects.create(user=self.users[user], film=film)
+        Rating.objects.create(user=self.users[1], film=self.films[2], rating=9)
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_train_evaluate_and_serve(self):
+        """Тестируем обучение командой, офлайн-оценку и выдачу рекомендаций по модели из отображенных файлов."""
+        out = StringIO()
+        call_command('train_factorization', '--iterations', '5', '--evaluate', '--k', '2', stdout=out)
+        self.assertIn("precision@2", out.getvalue())
+        self.assertIn("recall@2", out.getvalue())
+        self.assertIsInstance(get_factor_model().film_factors, np.memmap)
+
+        url = reverse('recommendation_system:recommendation')
+        films = self.client.get(url, {"recommender": "mf"}).data["recommendations"]["films"]
+        self.assertEqual(films[0]["id"], self.films[2].id)
+        self.assertNotIn(self.films[0].id, [film["id"] for film in films])
+        genres = self.client.get(url, {"recommender": "mf"}).data["recommendations"]["genres"]
+        self.assertEqual(genres[0]["id"], self.genres[0].id)
+
+    def test_fallback_to_graph_for_new_users(self):
+        """Тестируем, что без модели и для пользователя, появившегося после обучения, используется граф."""
+        url = reverse('recommendation_system:recommendation')
+        graph = self.client.get(url).data["recommendations"]
+        self.assertEqual(self.client.get(url, {"recommender": "mf"}).data["recommendations"], graph)
+
+        call_command('train_factorization', '--iterations', '2', stdout=StringIO())
+        user = get_user_model().objects.create_user(username='new', password='12345')
+        UserFilm.objects.create(user=user, film=self.films[0])
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(url, {"recommender": "mf"}).data["recommendations"],
+                         self.client.get(url).data["recommendations"])
+
+    def test_ann_search_for_neighbors_and_similar_films(self):
+        """Тестируем ближайших соседей и похожие фильмы из индекса приближенного поиска модели."""
+        call_command('train_factorization', '--iterations', '5', stdout=StringIO())
+        with self.settings(ANN_SEARCH=True):
+            response = self.client.get(reverse('recommendation_system:recommendation_statistics'))
+            neighbors = [node for node, _ in response.data['k_neighbors']]
+            self.assertEqual(set(neighbors[:2]), {f"user_{self.users[1].id}", f"user_{self.users[2].id}"})
+            # Расстояния по векторам дробные, в графе - целые
+            self.assertIsInstance(response.data['k_neighbors'][0][1], float)
+
+            response = self.client.get(reverse('recommendation_system:film', args=[self.films[0].id]))
+            similar = [film['id'] for film in response.data['similar_films']]
+            self.assertEqual(set(similar[:2]), {self.films[1].id, self.films[2].id})
+
+
+class IVFIndexTestCase(TestCase):
+    def test_build_save_load_and_search(self):
+        """Тестируем, что поиск по всем кластерам совпадает с точным, а индекс загружается отображением в память."""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 8))
+        ids = np.arange(1, 501)
+        index = IVFIndex.build(ids, vectors, n_lists=10)
+        query = vectors[7]
+        exact = np.argsort(-(vectors @ query / np.linalg.norm(vectors, axis=1)))[:5] + 1
+        self.assertEqual([pk for pk, _ in index.search(query, 5, n_probe=10)], exact.tolist())
+        self.assertNotIn(8, [pk for pk, _ in index.neighbors(8, 5)])
+        self.assertLessEqual(len(index.search(query, 5, n_probe=1)), 5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = IVFIndex.load(directory)
+            self.assertIsInstance(loaded.vectors, np.memmap)
+            self.assertEqual(loaded.search(query, 5, n_probe=3), index.search(query, 5, n_probe=3))
+
+
+class PersonalizedPageRankTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{i}', password='12345') for i in range(4)]
+        self.genres = [Genre.objects.create(name='Action'), Genre.objects.create(name='Drama')]
+        self.films = [Film.objects.create(title=f'Film {i}', release_date="2024-05-20", genre=self.genres[i // 3],
+                                          director="test_director") for i in range(6)]
+        # Две несвязанные группы: пользователи 0-1 и фильмы 0-2, пользователи 2-3 и фильмы 3-5
+        for user, film in ((0, 0), (1, 0), (1, 1), (1, 2), (2, 3), (3, 3), (3, 4), (3, 5)):
+            UserFilm.objects.create(user=self.users[user], film=self.films[film])
+        Rating.objects.create(user=self.users[1], film=self.films[2], rating=9)
+        UserGenre.objects.create(user=self.users[3], genre=self.genres[1])
+        self.matrix = get_graph_store('sparse').get_graph()
+
+    def test_forward_push_matches_exact_solution(self):
+        """Тестируем сходимость проталкивания к точному решению и продолжение от кэшированных остатков."""
+        adjacency = bipartite_adjacency(self.matrix).toarray()
+        transition = adjacency / np.maximum(adjacency.sum(axis=1, keepdims=True), 1)
+        seeds = seed_distribution(self.matrix, self.matrix.user_index[self.users[1].id])
+        start = np.zeros(len(adjacency))
+        start[list(seeds)] = list(seeds.values())
+        exact = 0.15 * start @ np.linalg.inv(np.eye(len(adjacency)) - 0.85 * transition)
+
+        coarse = personalized_pagerank(self.matrix, self.users[1].id, tolerance=1e-2)
+        estimate = personalized_pagerank(self.matrix, self.users[1].id, tolerance=1e-9)
+        csr = bipartite_adjacency(self.matrix).tocsr()
+        fresh, _, _ = forward_push(csr.indptr, csr.indices, seeds, tolerance=1e-9)
+        for node in range(len(adjacency)):
+            self.assertAlmostEqual(estimate.get(node, 0.0), exact[node], places=6)
+            self.assertAlmostEqual(fresh.get(node, 0.0), exact[node], places=6)
+        self.assertLess(sum(coarse.values()), sum(estimate.values()))
+
+    def test_personalized_recommendations_and_top(self):
+        """Тестируем, что рекомендации и топ по персонализированному PageRank берутся из окрестности пользователя."""
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse('recommendation_system:recommendation'), {"recommender": "ppr"})
+        films = response.data["recommendations"]["films"]
+        # Фильмы 1 и 2 симметричны в графе: равные оценки, порядок по id
+        self.assertEqual([film["id"] for film in films], [self.films[1].id, self.films[2].id])
+        self.assertEqual(films[0]["score"], films[1]["score"])
+        self.assertEqual([genre["id"] for genre in response.data["recommendations"]["genres"]], [])
+        self.assertEqual(response.data["top"]["top_5_films"][0]["id"], self.films[0].id)
+        self.assertNotIn(self.films[3].id, [film["id"] for film in response.data["top"]["top_5_films"]])
+
+    def test_configured_engine_matrix(self):
+        """Тестируем, что при движке networkx блуждание идет по матрице его графа с теми же оценками."""
+        expected = personalized_pagerank(self.matrix, self.users[1].id, tolerance=1e-9)
+        reset_process_caches()
+        self.client.force_authenticate(user=self.users[0])
+        with self.settings(RECOMMENDATION_ENGINE='networkx'):
+            response = self.client.get(reverse('recommendation_system:recommendation'), {"recommender": "ppr"})
+            matrix = get_graph_store().get_matrix()
+        self.assertEqual([film["id"] for film in response.data["recommendations"]["films"]],
+                         [self.films[1].id, self.films[2].id])
+        self.assertFalse(get_graph_store('sparse').is_built)
+        estimate = personalized_pagerank(matrix, self.users[1].id, tolerance=1e-9)
+        self.assertEqual(set(estimate), set(expected))
+        for node, score in expected.items():
+            self.assertAlmostEqual(estimate[node], score, places=9)
+
+
+class InvalidationBusTestCase(TestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.genre = Genre.objects.create(name='Action')
+        self.film = Film.objects.create(title='Test Film', release_date="2024-05-20", genre=self.genre,
+                                        director="test_director")
+        # Второй воркер - отдельная шина на общем транспорте
+        transport = LoopbackTransport()
+        self.enterContext(patch.object(invalidation_bus, '_transport', transport))
+        self.enterContext(patch.object(invalidation_bus, '_started_pid', None))
+        self.enterContext(patch.object(invalidation_bus, '_pending', queue.SimpleQueue()))
+        self.worker = InvalidationBus(transport)
+        self.received = []
+        self.worker.subscribe('deltas')(self.received.append)
+        self.worker.subscribe('interactions')(self.received.append)
+        self.worker.start()
+        invalidation_bus.start()
+
+    def test_changes_broadcast_to_other_workers(self):
+        """Тестируем рассылку дельт и смены версии кэша после фиксации записи."""
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(user=self.user, film=self.film, rating=7)
+        self.assertEqual(self.received, [])
+        self.worker.process_pending()
+        self.assertIn([{"op": "add_edge", "user": self.user.id, "type": "film", "id": self.film.id, "score": 7.0}],
+                      self.received)
+        self.assertIn({"user": self.user.id, "films": [self.film.id]}, self.received)
+
+    def test_remote_changes_applied_without_database(self):
+        """
+        Тестируем, что дельты другого воркера копятся в очереди и применяются к графу процесса в начале запроса
+        без обращения к базе данных, а resync сбрасывает структуры.
+        """
+        store = get_graph_store('networkx')
+        graph = store.get_graph()
+        version = recommendation_cache.get_version(self.user.id)
+        with self.assertNumQueries(0):
+            self.worker.publish('deltas', [{"op": "add_edge", "user": self.user.id, "type": "film",
+                                            "id": self.film.id, "score": 9.0}])
+            self.worker.publish('interactions', {"user": self.user.id, "films": [self.film.id]})
+        self.assertFalse(graph.has_edge(f"user_{self.user.id}", f"film_{self.film.id}"))
+
+        self.client.get(reverse('recommendation_system:film-search'))
+        self.assertIs(store.get_graph(), graph)
+        self.assertEqual(graph.edges[f"user_{self.user.id}", f"film_{self.film.id}"]["score"], 9.0)
+        self.assertNotEqual(recommendation_cache.get_version(self.user.id), version)
+
+        invalidation_bus.schedule_resync()
+        self.assertTrue(store.is_built)
+        invalidation_bus.process_pending()
+        self.assertFalse(store.is_built)
+
+    def test_failed_send_followed_by_resync(self):
+        """
+        Тестируем, что событие, которое не удалось разослать, не теряется молча: остальные воркеры
+        получают resync при следующей успешной рассылке, а повторно resync не рассылается.
+        """
+        resyncs = []
+        self.worker.subscribe('resync')(resyncs.append)
+        send = invalidation_bus.transport.send
+        failures = [ConnectionError("publish timeout")]
+
+        def flaky_send(message):
+            if failures:
+                raise failures.pop()
+            send(message)
+
+        delta = [{"op": "add_edge", "user": self.user.id, "type": "film", "id": self.film.id, "score": 9.0}]
+        with patch.object(invalidation_bus.transport, 'send', flaky_send):
+            with self.assertLogs('recommendation_system.invalidation', 'ERROR'):
+                invalidation_bus.publish('deltas', delta)
+            self.worker.process_pending()
+            self.assertEqual((resyncs, self.received), ([], []))
+
+            invalidation_bus.process_pending()
+            self.worker.process_pending()
+            self.assertEqual(resyncs, [None])
+
+            invalidation_bus.publish('deltas', delta)
+            self.worker.process_pending()
+            self.assertEqual(resyncs, [None])
+            self.assertEqual(self.received, [delta])
+
+    def test_sparse_deltas_during_flush_not_lost(self):
+        """Тестируем, что дельта, пришедшая во время слияния изменений матрицы, применяется при следующем чтении."""
+        matrix = get_graph_store('sparse').get_graph()
+        matrix.apply([{"op": "add_edge", "user": self.user.id, "type": "film", "id": self.film.id}])
+        merge = sparse_engine._merge
+        calls, threads = [], []
+
+        def slow_merge(*args):
+            result = merge(*args)
+            calls.append(args)
+            if len(calls) == 3:
+                # Матрицы уже слиты, очередь изменений еще не очищена: второй поток применяет дельту
+                threads.append(threading.Thread(target=matrix.apply, args=([{
+                    "op": "add_edge", "user": self.user.id, "type": "genre", "id": self.genre.id}],)))
+                threads[0].start()
+                threads[0].join(0.2)
+            return result
+
+        with patch.object(sparse_engine, '_merge', slow_merge):
+            matrix.user_film
+        threads[0].join()
+        self.assertEqual(matrix.user_genre[matrix.user_index[self.user.id], matrix.genre_index[self.genre.id]], 1)
+
+
+class GraphSnapshotTestCase(TestCase):
+    def setUp(self):
+        reset_process_caches()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(GRAPH_SNAPSHOT_DIR=self.directory))
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{i}', password='12345') for i in range(3)]
+        self.genres = [Genre.objects.create(name='Action'), Genre.objects.create(name='Drama')]
+        self.films = [Film.objects.create(title=f'Film {i}', release_date="2024-05-20", genre=self.genres[i % 2],
+                                          director="test_director") for i in range(3)]
+        UserFilm.objects.create(user=self.users[0], film=self.films[0])
+        Rating.objects.create(user=self.users[1], film=self.films[1], rating=7)
+        UserGenre.objects.create(user=self.users[0], genre=self.genres[0])
+        # Взаимодействия снимка созданы задолго до его отметки
+        hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (UserFilm, Rating, UserGenre):
+            model.objects.update(created_at=hour_ago)
+        Rating.objects.update(updated_at=hour_ago)
+        call_command('dump_graph', stdout=StringIO())
+
+    def test_load_and_replay(self):
+        """Тестируем отображение снимка в память и дозагрузку взаимодействий после отметки."""
+        matrix = load_graph_snapshot()
+        self.assertEqual(matrix.build_stats["replayed"], 0)
+        # Массивы - представления файлов, отображенных только для чтения, без копирования
+        self.assertFalse(matrix.user_ids.flags.writeable)
+        self.assertFalse(matrix.user_film.data.flags.writeable)
+
+        user = get_user_model().objects.create_user(username='new', password='12345')
+        Rating.objects.create(user=user, film=self.films[2], rating=9)
+        UserGenre.objects.create(user=self.users[1], genre=self.genres[1])
+        # Измененная оценка дозагружается по времени изменения, время создания не переписывается
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.users[1])
+            self.client.post(reverse('recommendation_system:home'), {'film': self.films[1].id, 'rating': 4})
+        self.assertLess(Rating.objects.get(user=self.users[1]).created_at, timezone.now() - timedelta(minutes=30))
+        reset_process_caches()
+        matrix = get_graph_store('sparse').get_graph()
+        self.assertEqual(matrix.build_stats["replayed"], 3)
+        self.assertEqual(matrix.film_scores[matrix.user_index[self.users[1].id],
+                                            matrix.film_index[self.films[1].id]], 4)
+        self.assertEqual(matrix.film_scores[matrix.user_index[user.id], matrix.film_index[self.films[2].id]], 9)
+        self.assertEqual(matrix.user_genre[matrix.user_index[self.users[1].id],
+                                           matrix.genre_index[self.genres[1].id]], 1)
+        # Дозагруженные изменения - наложение поверх отображенных матриц, которые не копируются
+        self.assertIsInstance(matrix.user_film, OverlayMatrix)
+        self.assertFalse(matrix.user_film.base.data.flags.writeable)
+
+    def test_margin_interactions_not_replayed(self):
+        """Тестируем, что взаимодействия из запаса перед отметкой, уже учтенные в снимке, не дозагружаются."""
+        for model in (UserFilm, Rating, UserGenre):
+            model.objects.update(created_at=timezone.now())
+        Rating.objects.update(updated_at=timezone.now())
+        matrix = load_graph_snapshot()
+        self.assertEqual(matrix.build_stats["replayed"], 0)
+        self.assertFalse(matrix.user_film.data.flags.writeable)
+
+    def test_full_build_after_deletions(self):
+        """Тестируем, что после удаления узлов или взаимодействий граф строится из базы данных."""
+        UserFilm.objects.create(user=self.users[1], film=self.films[2])
+        self.assertIsNotNone(load_graph_snapshot())
+        UserGenre.objects.filter(user=self.users[0]).delete()
+        with self.assertNumQueries(6):
+            # id пользователей, фильмов и жанров и по одной агрегации на таблицу взаимодействий
+            self.assertIsNone(load_graph_snapshot())
+        call_command('dump_graph', stdout=StringIO())
+        self.assertIsNotNone(load_graph_snapshot())
+        self.films[2].delete()
+        self.assertIsNone(load_graph_snapshot())
+        self.assertNotIn("snapshot", get_graph_store('sparse').get_graph().build_stats)
+
+
+class WarmUpTestCase(TestCase):
+    def setUp(self):
+        reset_process_caches()
+        self.user = get_user_model().objects.create_user(username='testuser', password='12345')
+        self.genre = Genre.objects.create(name='Action')
+        self.film = Film.objects.create(title='Test Film', release_date="2024-05-20", genre=self.genre,
+                                        director="test_director")
+        Rating.objects.create(user=self.user, film=self.film, rating=8)
+
+    def test_warm_up_command(self):
+        """Тестируем, что после прогрева граф, PageRank и каталог не обращаются к базе данных."""
+        out = StringIO()
+        self.enterContext(self.settings(RECOMMENDATION_ENGINE='sparse'))
+        call_command('warm_up', stdout=out)
+        self.assertIn("Прогрев выполнен", out.getvalue())
+        self.assertIn("граф предпочтений", out.getvalue())
+        with self.assertNumQueries(0):
+            matrix = get_graph_store('sparse').get_graph()
+            SparseRecommendationSystem.calculate_pagerank(matrix)
+            self.assertEqual(item_similarity_store.similar(self.film.id), [])
+            self.assertEqual(film_catalog.get_many([self.film.id])[0]["title"], 'Test Film')
+            self.assertEqual(genre_catalog.get_many([self.genre.id])[0]["name"], 'Action')
+
+    def test_worker_connects_bus_before_warm_up(self):
+        """Тестируем, что сброс после первой подписки воркера выполняется до прогрева и не стирает его структуры."""
+        class SubscribingTransport(LoopbackTransport):
+            def connect(self, bus):
+                super().connect(bus)
+                bus.schedule_resync()
+
+        hooks = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        worker = SimpleNamespace(pid=1, forked_at=time.perf_counter(), log=Mock())
+        self.enterContext(patch.object(invalidation_bus, '_transport', SubscribingTransport()))
+        self.enterContext(patch.object(invalidation_bus, '_started_pid', None))
+        self.enterContext(patch.object(invalidation_bus, '_pending', queue.SimpleQueue()))
+        self.enterContext(patch.object(connections, 'close_all'))
+        with self.settings(WARM_UP=True):
+            hooks['post_worker_init'](worker)
+        # Первый запрос воркера
+        process_invalidation_events(sender=None)
+        self.assertTrue(get_graph_store().is_built)
+
+    def test_urls_import_without_engine_libraries(self):
+        """Тестируем, что загрузка приложения и маршрутов не импортирует networkx и scipy."""
+        code = ("import os, sys, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings'); "
+                "django.setup(); import config.urls; "
+                "print(sorted({'networkx', 'scipy'} & {name.split('.')[0] for name in sys.modules}))")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+class HomePageCatalogTestCase(TestCase):
+    def setUp(self):
+        reset_process_caches()
+        self.user = get_user_model().objects.create_user(username='testuser', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.genre = Genre.objects.create(name='Action')
+        # Два фильма в каждый день: порядок внутри дня задает id
+        self.films = [Film.objects.create(title=f'Film {i}', release_date=f"2024-05-{1 + i // 2:02d}",
+                                          genre=self.genre, director="test_director") for i in range(25)]
+        self.url = reverse('recommendation_system:home')
+
+    def test_keyset_pagination(self):
+        """Тестируем страницы каталога от новых фильмов к старым и возврат на предыдущую страницу."""
+        expected = [film.id for film in reversed(self.films)]
+        first = self.client.get(self.url).context['films']
+        self.assertEqual([film.id for film in first], expected[:HOME_FILMS_PAGE_SIZE])
+        self.assertIsNone(first.previous_cursor)
+
+        second = self.client.get(self.url, {'after': first.next_cursor}).context['films']
+        self.assertEqual([film.id for film in second], expected[HOME_FILMS_PAGE_SIZE:])
+        self.assertIsNone(second.next_cursor)
+        back = self.client.get(self.url, {'before': second.previous_cursor}).context['films']
+        self.assertEqual([film.id for film in back], expected[:HOME_FILMS_PAGE_SIZE])
+        self.assertIsNone(back.previous_cursor)
+        self.assertEqual([film.id for film in self.client.get(self.url, {'after': 'bad'}).context['films']],
+                         expected[:HOME_FILMS_PAGE_SIZE])
+
+    def test_response_size_independent_of_catalog_size(self):
+        """
+        Тестируем, что размер главной страницы не растет с каталогом: фильм для оценки выбирается
+        из текущей страницы или результатов поиска, остальные оцениваются на странице фильма.
+        """
+        size = len(self.client.get(self.url).content)
+        Film.objects.bulk_create([Film(title=f'Old film {i}', release_date="2000-01-01", genre=self.genre,
+                                       director="test_director") for i in range(200)])
+        bump_catalog_version()
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.content), size)
+        self.assertNotContains(response, 'Old film')
+
+        oldest = self.films[0]
+        response = self.client.get(self.url, {'q': 'film 0'})
+        self.assertContains(response, f'<option value="{oldest.id}">{oldest.title}</option>', html=True)
+        response = self.client.get(reverse('recommendation_system:film_detail', args=[oldest.id]))
+        self.assertContains(response, f'<input type="hidden" name="film" value="{oldest.id}">', html=True)
+
+    def test_fragments_cached_until_catalog_changes(self):
+        """Тестируем, что фрагменты каталога берутся из кэша и сбрасываются при сохранении фильма и жанра."""
+        film = self.films[-1]
+        self.assertContains(self.client.get(self.url), 'Film 24')
+        # Изменение без сигналов не сбрасывает кэш: страница и список жанров не читаются из базы данных
+        Film.objects.filter(pk=film.pk).update(title='Renamed')
+        Genre.objects.filter(pk=self.genre.pk).update(name='Renamed genre')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Film 24')
+        self.assertNotIn('recommendation_system_film', " ".join(query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Film.objects.get(pk=film.pk).save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Renamed')
+        self.assertContains(response, 'Renamed genre')
+
+
+class FilmSearchTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        self.user = get_user_model().objects.create_user(username='testuser', password='12345')
+        self.client.force_authenticate(user=self.user)
+        genre = Genre.objects.create(name='Фантастика')
+        self.matrix = Film.objects.create(title='Матрица', release_date="1999-03-31", genre=genre,
+                                          director="Лана Вачовски", description="Хакер узнает правду о мире")
+        self.reloaded = Film.objects.create(title='Матрица: Перезагрузка', release_date="2003-05-15", genre=genre,
+                                            director="Лана Вачовски")
+        self.other = Film.objects.create(title='Тёмный город', release_date="1998-02-27", genre=genre,
+                                         director="Алекс Пройас", description="Похож на матрицу")
+        self.url = reverse('recommendation_system:film-search')
+
+    def search(self, query, **params):
+        return [film["id"] for film in self.client.get(self.url, {"q": query, **params}).data["results"]]
+
+    def test_prefix_search_and_ranking(self):
+        """Тестируем поиск по префиксу последнего слова, ранжирование по полям и пересечение слов запроса."""
+        self.assertEqual(self.search("матр"), [self.matrix.id, self.reloaded.id, self.other.id])
+        self.assertEqual(self.search("матр", limit=1), [self.matrix.id])
+        self.assertEqual(self.search("вачовски перез"), [self.reloaded.id])
+        self.assertEqual(self.search("темн"), [self.other.id])
+        self.assertEqual(self.search("пройас матрица"), [])
+        self.assertEqual(self.client.get(self.url, {"q": "матр", "limit": 100}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_film_changes(self):
+        """Тестируем обновление индекса при сохранении и удалении фильма и поиск на главной странице."""
+        self.assertEqual(self.search("пройас"), [self.other.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.director = "Ридли Скотт"
+            self.other.save()
+            self.matrix.delete()
+        self.assertEqual(self.search("пройас"), [])
+        self.assertEqual(self.search("скотт"), [self.other.id])
+        self.assertEqual(self.search("матриц"), [self.reloaded.id, self.other.id])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('recommendation_system:home'), {"q": "перезагрузка"})
+        self.assertEqual([film["id"] for film in response.context["search_results"]], [self.reloaded.id])
+
+    def test_admin_search_returns_all_matches(self):
+        """Тестируем, что поиск в админке по индексу не обрезается наибольшим размером выдачи API."""
+        genre = self.matrix.genre
+        films = [Film.objects.create(title=f'Хроники {i}', release_date="2024-05-20", genre=genre,
+                                     director="test_director") for i in range(SEARCH_MAX_LIMIT + 5)]
+        admin_user = get_user_model().objects.create_superuser(username='admin', password='12345')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:recommendation_system_film_changelist'), {"q": "хроники"})
+        self.assertEqual(response.context["cl"].result_count, len(films))
+        response = self.client.get(reverse('admin:recommendation_system_film_changelist'), {"q": str(self.other.id)})
+        self.assertIn(self.other, response.context["cl"].result_list)
+
+    def test_admin_search_invalid_id_terms(self):
+        """Тестируем, что поиск в админке по цифрам не-ASCII и по числу больше первичного ключа не падает."""
+        admin_user = get_user_model().objects.create_superuser(username='admin', password='12345')
+        self.client.force_login(admin_user)
+        for term in ('²', '99999999999999999999999', f' {self.other.id}x'):
+            response = self.client.get(reverse('admin:recommendation_system_film_changelist'), {"q": term})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.context["cl"].result_count, 0)
+
+
+class PreferenceGraphStoreTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.genre = Genre.objects.create(name='Action')
+        self.film = Film.objects.create(title='Test Film', description='Test Description',
+                                        release_date="2024-05-20", genre=self.genre, director="test_director",
+                                        rating=8)
+        reset_process_caches()
+        self.graph = get_graph_store('networkx').get_graph()
+
+    def test_graph_built_once(self):
+        """Тестируем, что граф строится один раз и переиспользуется."""
+        self.assertIs(get_graph_store('networkx').get_graph(), self.graph)
+        self.assertIn(f"user_{self.user.id}", self.graph)
+
+    def test_rating_delta_applied(self):
+        """Тестируем применение дельт при создании и удалении оценки."""
+        user_node, film_node = f"user_{self.user.id}", f"film_{self.film.id}"
+        with self.captureOnCommitCallbacks(execute=True):
+            rating = Rating.objects.create(user=self.user, film=self.film, rating=7)
+        self.assertEqual(self.graph.edges[user_node, film_node]["score"], 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rating.delete()
+        self.assertFalse(self.graph.has_edge(user_node, film_node))
+
+    def test_rating_delete_keeps_view_edge(self):
+        """Тестируем, что удаление оценки не удаляет ребро просмотренного фильма."""
+        user_node, film_node = f"user_{self.user.id}", f"film_{self.film.id}"
+        with self.captureOnCommitCallbacks(execute=True):
+            UserFilm.objects.create(user=self.user, film=self.film)
+            rating = Rating.objects.create(user=self.user, film=self.film, rating=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            rating.delete()
+        self.assertTrue(self.graph.has_edge(user_node, film_node))
+        self.assertNotIn("score", self.graph.edges[user_node, film_node])
+
+    def test_new_nodes_and_genre_edges(self):
+        """Тестируем добавление новых узлов и ребер с жанрами."""
+        User = get_user_model()
+        with self.captureOnCommitCallbacks(execute=True):
+            other = User.objects.create_user(username='other', password='12345')
+            UserGenre.objects.create(user=other, genre=self.genre)
+        self.assertTrue(self.graph.has_edge(f"user_{other.id}", f"genre_{self.genre.id}"))
+
+    def test_build_uses_constant_queries(self):
+        """Тестируем, что построение графа не делает запросов на каждое взаимодействие."""
+        User = get_user_model()
+        for index in range(5):
+            user = User.objects.create_user(username=f'user{index}', password='12345')
+            Rating.objects.create(user=user, film=self.film, rating=index + 1)
+            UserFilm.objects.create(user=user, film=self.film)
+            UserGenre.objects.create(user=user, genre=self.genre)
+
+        with self.assertNumQueries(6):
+            graph = RecommendationSystem.build_preference_graph(chunk_size=2)
+        self.assertEqual(graph.graph["build_stats"]["queries"], 6)
+        self.assertEqual(graph.edges[f"user_{user.id}", f"film_{self.film.id}"]["score"], 5)
+
+
+class SparseEngineParityTestCase(TestCase):
+    """Сравнение реализации на разреженных матрицах с реализацией на networkx."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{index}', password='12345') for index in range(5)]
+        self.genres = [Genre.objects.create(name=name) for name in ('Action', 'Drama', 'Comedy')]
+        self.films = [Film.objects.create(title=f'Film {index}', release_date="2024-05-20",
+                                          genre=self.genres[index % 3], director="test_director")
+                      for index in range(6)]
+        interactions = [(0, 0), (0, 1), (1, 1), (1, 2), (2, 2), (3, 4), (2, 5)]
+        for user, film in interactions:
+            UserFilm.objects.create(user=self.users[user], film=self.films[film])
+        Rating.objects.create(user=self.users[0], film=self.films[3], rating=9)
+        Rating.objects.create(user=self.users[3], film=self.films[3], rating=4)
+        UserGenre.objects.create(user=self.users[0], genre=self.genres[0])
+        UserGenre.objects.create(user=self.users[4], genre=self.genres[0])
+
+        self.graph = RecommendationSystem.build_preference_graph()
+        self.matrix = SparseRecommendationSystem.build_preference_graph()
+
+    def test_collaborative_filtering_parity(self):
+        for user in self.users:
+            self.assertEqual(dict(RecommendationSystem.collaborative_filtering(self.graph, user.id)),
+                             dict(SparseRecommendationSystem.collaborative_filtering(self.matrix, user.id)))
+
+    def test_similarity_metrics_parity(self):
+        """Тестируем все меры схожести и отбор top_n в обеих реализациях."""
+        for metric in SIMILARITY_METRICS:
+            for user in self.users:
+                expected = RecommendationSystem.collaborative_filtering(self.graph, user.id, metric, top_n=None)
+                actual = SparseRecommendationSystem.collaborative_filtering(self.matrix, user.id, metric, top_n=None)
+                self.assertEqual([node for node, _ in expected], [node for node, _ in actual])
+                for (_, expected_score), (_, actual_score) in zip(expected, actual):
+                    self.assertAlmostEqual(expected_score, actual_score, places=5)
+
+        similar = RecommendationSystem.collaborative_filtering(self.graph, self.users[1].id, 'jaccard', top_n=1)
+        self.assertEqual(similar, [(f"user_{self.users[2].id}", 1 / 3)])
+        rating = SparseRecommendationSystem.collaborative_filtering(self.matrix, self.users[0].id, 'rating')
+        self.assertEqual(rating, [(f"user_{self.users[3].id}", 1.0)])
+        with self.assertRaises(ValueError):
+            RecommendationSystem.collaborative_filtering(self.graph, self.users[0].id, 'unknown')
+
+    def test_k_nearest_neighbors_parity(self):
+        for user in self.users:
+            for k in (1, 2, 10):
+                self.assertEqual(RecommendationSystem.k_nearest_neighbors(self.graph, user.id, k=k),
+                                 SparseRecommendationSystem.k_nearest_neighbors(self.matrix, user.id, k=k))
+
+    def test_k_nearest_neighbors_depth_and_ties(self):
+        """Тестируем отсечение по глубине и упорядочивание по id при равном расстоянии."""
+        user_id = self.users[1].id
+        for system, structure in ((RecommendationSystem, self.graph), (SparseRecommendationSystem, self.matrix)):
+            self.assertEqual(system.k_nearest_neighbors(structure, user_id, k=10, max_depth=2),
+                             [(f"user_{self.users[0].id}", 2), (f"user_{self.users[2].id}", 2)])
+            self.assertEqual(system.k_nearest_neighbors(structure, user_id, k=10, max_depth=4)[2:],
+                             [(f"user_{self.users[3].id}", 4), (f"user_{self.users[4].id}", 4)])
+
+    def test_pagerank_parity(self):
+        expected, expected_top = RecommendationSystem.calculate_pagerank(self.graph)
+        actual, top = SparseRecommendationSystem.calculate_pagerank(self.matrix)
+        self.assertEqual(expected.keys(), actual.keys())
+        for node, score in expected.items():
+            self.assertAlmostEqual(score, actual[node], places=6)
+        self.assertEqual(set(expected_top["top_5_genres"]), set(top["top_5_genres"]))
+        self.assertEqual(len(top["top_5_films"]), 5)
+
+    def test_get_recommendations_parity(self):
+        for user in self.users:
+            expected = RecommendationSystem.get_recommendations(self.graph, user.id)
+            actual = SparseRecommendationSystem.get_recommendations(self.matrix, user.id)
+            self.assertEqual(expected, actual)
+
+    def test_deltas_parity(self):
+        """Тестируем, что дельты дают тот же результат, что и полное перестроение."""
+        deltas = [
+            {"op": "add_edge", "user": self.users[4].id, "type": "film", "id": self.films[0].id, "score": 7.0},
+            {"op": "remove_edge", "user": self.users[0].id, "type": "film", "id": self.films[1].id},
+            {"op": "add_node", "type": "user", "id": 1000},
+            {"op": "add_edge", "user": 1000, "type": "genre", "id": self.genres[0].id},
+        ]
+        RecommendationSystem.apply_deltas(self.graph, deltas)
+        self.assertTrue(SparseRecommendationSystem.apply_deltas(self.matrix, deltas))
+        for user_id in [user.id for user in self.users] + [1000]:
+            self.assertEqual(dict(RecommendationSystem.collaborative_filtering(self.graph, user_id)),
+                             dict(SparseRecommendationSystem.collaborative_filtering(self.matrix, user_id)))
+        self.assertEqual(self.matrix.film_scores[self.matrix.user_index[self.users[4].id],
+                                                 self.matrix.film_index[self.films[0].id]], 7.0)
+        self.assertFalse(self.matrix.apply([{"op": "remove_node", "type": "film", "id": self.films[0].id}]))
+
+    def test_empty_matrix(self):
+        """Тестируем работу на пустой матрице."""
+        matrix = InteractionMatrix.from_edges([], [], [])
+        self.assertEqual(SparseRecommendationSystem.calculate_pagerank(matrix)[0], {})
+        self.assertEqual(SparseRecommendationSystem.collaborative_filtering(matrix, 1), [])
+
+    def test_pagerank_cached_by_version(self):
+        """Тестируем кэширование PageRank по версии и пересчет после дельты."""
+        for system, structure in ((RecommendationSystem, self.graph), (SparseRecommendationSystem, self.matrix)):
+            first, _ = system.calculate_pagerank(structure)
+            self.assertIs(system.calculate_pagerank(structure)[0], first)
+
+            system.apply_deltas(structure, [{"op": "add_edge", "user": self.users[4].id, "type": "film",
+                                             "id": self.films[3].id}])
+            second, _ = system.calculate_pagerank(structure)
+            self.assertIsNot(second, first)
+            self.assertGreater(second[f"film_{self.films[3].id}"], first[f"film_{self.films[3].id}"])
+
+    def test_pagerank_warm_start(self):
+        """Тестируем, что теплый старт от сошедшегося вектора сходится за одну итерацию."""
+        adjacency = bipartite_adjacency(self.matrix)
+        scores = pagerank(adjacency)
+        warm = pagerank(adjacency, start=scores, max_iter=1)
+        self.assertTrue(np.allclose(scores, warm, atol=1e-6))
+        self.assertEqual(list(top_k_indices(np.array([0.1, 0.5, 0.3, 0.4]), 2)), [1, 3])
+
+    def test_save_and_load_memory_mapped(self):
+        """Тестируем, что матрицы, загруженные из файлов с отображением в память, дают те же рекомендации."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.matrix.save(directory)
+            loaded = InteractionMatrix.load(directory)
+            # Массивы - представления отображенных файлов без копирования, доступные только для чтения
+            self.assertFalse(loaded.interactions.indices.flags.writeable)
+            for user in self.users:
+                self.assertEqual(SparseRecommendationSystem.get_recommendations(loaded, user.id),
+                                 SparseRecommendationSystem.get_recommendations(self.matrix, user.id))
+            del loaded
+
+    def assert_parity(self, matrix):
+        for user_id in [user.id for user in self.users] + [1000]:
+            for metric in SIMILARITY_METRICS:
+                self.assertEqual(RecommendationSystem.collaborative_filtering(self.graph, user_id, metric),
+                                 SparseRecommendationSystem.collaborative_filtering(matrix, user_id, metric))
+            self.assertEqual(RecommendationSystem.k_nearest_neighbors(self.graph, user_id),
+                             SparseRecommendationSystem.k_nearest_neighbors(matrix, user_id))
+            self.assertEqual(RecommendationSystem.get_recommendations(self.graph, user_id),
+                             SparseRecommendationSystem.get_recommendations(matrix, user_id))
+        expected, _ = RecommendationSystem.calculate_pagerank(self.graph)
+        actual, _ = SparseRecommendationSystem.calculate_pagerank(matrix)
+        for node, score in expected.items():
+            self.assertAlmostEqual(score, actual[node], places=6)
+
+    def test_overlay_over_memory_mapped_base(self):
+        """
+        Тестируем, что дельты к матрицам из файлов хранятся в наложении без копирования отображенной базы
+        и дают те же результаты, что и граф networkx, в том числе после слияния наложения с базой.
+        """
+        deltas = [
+            {"op": "add_edge", "user": self.users[4].id, "type": "film", "id": self.films[0].id, "score": 7.0},
+            {"op": "remove_edge", "user": self.users[0].id, "type": "film", "id": self.films[1].id},
+            {"op": "add_node", "type": "user", "id": 1000},
+            {"op": "add_edge", "user": 1000, "type": "genre", "id": self.genres[0].id},
+            {"op": "add_edge", "user": 1000, "type": "film", "id": self.films[2].id},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            self.matrix.save(directory)
+            loaded = InteractionMatrix.load(directory)
+            RecommendationSystem.apply_deltas(self.graph, deltas)
+            loaded.apply(deltas)
+            self.assertIsInstance(loaded.user_film, OverlayMatrix)
+            self.assertFalse(loaded.user_film.base.data.flags.writeable)
+            self.assertFalse(loaded.interactions.base.indices.flags.writeable)
+            self.assertFalse(loaded.interactions_t.base.indices.flags.writeable)
+            self.assertEqual(loaded.film_scores[loaded.user_index[self.users[4].id],
+                                                loaded.film_index[self.films[0].id]], 7.0)
+            self.assert_parity(loaded)
+
+            # Новый фильм сдвигает столбцы жанров объединенной матрицы
+            film_deltas = [{"op": "add_node", "type": "film", "id": 2000},
+                           {"op": "add_edge", "user": self.users[1].id, "type": "film", "id": 2000}]
+            RecommendationSystem.apply_deltas(self.graph, film_deltas)
+            loaded.apply(film_deltas)
+            self.assert_parity(loaded)
+
+            with patch.object(sparse_engine, 'OVERLAY_MIN_NNZ', 0):
+                loaded.apply([{"op": "add_edge", "user": self.users[2].id, "type": "genre",
+                               "id": self.genres[1].id}])
+                RecommendationSystem.apply_deltas(self.graph, [{"op": "add_edge", "user": self.users[2].id,
+                                                                "type": "genre", "id": self.genres[1].id}])
+                self.assertNotIsInstance(loaded.user_film, OverlayMatrix)
+            self.assert_parity(loaded)
+            del loaded
+
+
+class RecommendationSnapshotTestCase(APITestCase):
+    def setUp(self):
+        reset_process_caches()
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f'user{index}', password='12345') for index in range(4)]
+        self.genre = Genre.objects.create(name='Action')
+        self.films = [Film.objects.create(title=f'Film {index}', release_date="2024-05-20", genre=self.genre,
+                                          director="test_director") for index in range(3)]
+        # user0 и user1 связаны фильмом 0, user2 и user3 - фильмом 2
+        for user, film in ((0, 0), (1, 0), (1, 1), (2, 2), (3, 2)):
+            UserFilm.objects.create(user=self.users[user], film=self.films[film])
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_full_refresh_and_serving(self):
+        """Тестируем расчет снимков и выдачу рекомендаций из снимка."""
+        self.assertEqual(refresh_snapshots(full=True), 4)
+        snapshot = RecommendationSnapshot.objects.get(user=self.users[0])
+        self.assertEqual(snapshot.films, [[self.films[1].id, 0.75]])
+
+        # Подменяем снимок, чтобы убедиться, что ответ берется из него
+        snapshot.films = [[self.films[2].id, 1.0]]
+        snapshot.save()
+        response = self.client.get(reverse('recommendation_system:recommendation'))
+        self.assertEqual([film["id"] for film in response.data["recommendations"]["films"]], [self.films[2].id])
+
+    def test_changed_preferences_fall_back_to_live(self):
+        """Тестируем, что после изменения предпочтений устаревший снимок не используется."""
+        refresh_snapshots(full=True)
+        RecommendationSnapshot.objects.filter(user=self.users[0]).update(films=[])
+        UserGenre.objects.create(user=self.users[0], genre=self.genre)
+        self.assertTrue(RecommendationSnapshot.objects.get(user=self.users[0]).is_stale)
+
+        response = self.client.get(reverse('recommendation_system:recommendation'))
+        self.assertEqual([film["id"] for film in response.data["recommendations"]["films"]], [self.films[1].id])
+
+    def test_incremental_refresh_recomputes_neighborhood(self):
+        """Тестируем, что пересчитываются только пользователи, чья окрестность изменилась."""
+        refresh_snapshots(full=True)
+        Rating.objects.create(user=self.users[1], film=self.films[1], rating=8)
+        self.assertEqual(refresh_snapshots(), 2)
+        self.assertEqual(refresh_snapshots(), 0)
+        self.assertFalse(RecommendationSnapshot.objects.get(user=self.users[1]).is_stale)
+
+    def test_parallel_precompute(self):
+        """Тестируем, что пересчет в пуле процессов совпадает с последовательным пересчетом."""
+        refresh_snapshots(full=True)
+        expected = {snapshot.user_id: (snapshot.films, snapshot.genres)
+                    for snapshot in RecommendationSnapshot.objects.all()}
+        RecommendationSnapshot.objects.all().delete()
+
+        result = precompute_recommendations(workers=2, chunk_size=1)
+        self.assertEqual(result["users"], 4)
+        self.assertEqual(set(result["timings"]), {"build", "dump", "compute", "write"})
+        self.assertEqual({snapshot.user_id: (snapshot.films, snapshot.genres)
+                          for snapshot in RecommendationSnapshot.objects.all()}, expected)
@@ -3,7 +3,7 @@ from django.urls import path
 from recommendation_system.apps import RecommendationSystemConfig
 from recommendation_system.views import FilmRetrieveAPIView, PreferenceCreateAPIView, RecommendationAPIView, \
     RecommendationStatisticsAPIView, HomePageView, FilmDetailView, RecommendationView, PreferenceView, \
-    StatisticRecommendationView
+    StatisticRecommendationView, RecommendationOverviewAPIView, BulkPreferenceCreateAPIView, FilmSearchAPIView
 
 app_name = RecommendationSystemConfig.name
 
@@ -15,7 +15,10 @@ urlpatterns = [
     path('statistics/', StatisticRecommendationView.as_view(), name='statistics'),
 
     path('film/<int:pk>/', FilmRetrieveAPIView.as_view(), name='film'),
+    path('film/search/', FilmSearchAPIView.as_view(), name='film-search'),
     path('add_preference/', PreferenceCreateAPIView.as_view(), name='add-preference'),
+    path('add_preference/bulk/', BulkPreferenceCreateAPIView.as_view(), name='add-preference-bulk'),
     path('recommendation/', RecommendationAPIView.as_view(), name='recommendation'),
     path('recommendation/statistics/', RecommendationStatisticsAPIView.as_view(), name='recommendation_statistics'),
+    path('recommendation/overview/', RecommendationOverviewAPIView.as_view(), name='recommendation_overview'),
 ]
@@ -0,0 +1,47 @@
+"""
+Версии наборов файлов в каталоге: каждая версия - подкаталог, текущая указана в файле current.
+Новая версия становится текущей атомарной заменой файла current: процессы, отобразившие в память
+файлы предыдущей версии, дочитывают их, пока не загрузят новую.
+"""
+import os
+import shutil
+from pathlib import Path
+
+from django.utils import timezone
+
+CURRENT_FILE = 'current'
+
+# Количество хранимых версий, включая текущую
+KEEP_VERSIONS = 2
+
+
+def save_version(directory, write):
+    """Запись новой версии функцией write(каталог версии) и переключение на нее. Возвращает каталог версии."""
+    directory = Path(directory)
+    version = directory / timezone.now().strftime('%Y%m%d%H%M%S%f')
+    version.mkdir(parents=True)
+    write(version)
+    current = directory / f"{CURRENT_FILE}.tmp"
+    current.write_text(version.name)
+    os.replace(current, directory / CURRENT_FILE)
+
+    versions = sorted(path for path in directory.iterdir() if path.is_dir())
+    for path in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(path, ignore_errors=True)
+    return version
+
+
+def current_version(directory):
+    """Каталог текущей версии, None - если версий нет."""
+    try:
+        return Path(directory) / (Path(directory) / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def version_marker(directory):
+    """Отметка смены текущей версии (время изменения файла current), None - если версий нет."""
+    try:
+        return os.stat(Path(directory) / CURRENT_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
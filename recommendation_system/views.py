@@ -1,8 +1,7 @@
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import render, redirect
-from django.utils.decorators import method_decorator
 from django.views import View
-from django.views.decorators.cache import cache_page
 from django.views.generic import ListView, DetailView
 from rest_framework import status
 from rest_framework.generics import RetrieveAPIView, CreateAPIView
@@ -10,10 +9,55 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from recommendation_system.models import Film, UserFilm, Genre, UserGenre, Rating, RecommendationStatistics
+from recommendation_system.catalog import FilmPage, film_catalog, genre_catalog, get_catalog_version
+from recommendation_system.context import get_recommendation_context
+from recommendation_system.film_search import SEARCH_MAX_LIMIT, SEARCH_TOP_N, film_search_store
+from recommendation_system.item_similarity import get_similar_films
+from recommendation_system.models import Film, UserFilm, Genre, UserGenre, Rating, RecommendationStatistics, \
+    DailyStatistics
+from recommendation_system.preferences import BULK_PREFERENCES_MAX_ITEMS, save_preferences
+from recommendation_system.recommendation_cache import recommendation_cache
+from recommendation_system.scoring import RECOMMENDATIONS_TOP_N, paginate
 from recommendation_system.serializers import FilmSerializer, RatingSerializer, UserFilmSerializer, \
     UserGenreSerializer
-from recommendation_system.services import RecommendationSystem
+from recommendation_system.statistics_buffer import statistics_buffer
+
+PAGE_PARAMS_ERROR = {"error": "Параметры 'limit' и 'offset' должны быть неотрицательными целыми числами."}
+
+
+def get_page_params(request):
+    """Параметры limit и offset запроса; None, если они не являются неотрицательными целыми числами."""
+    try:
+        limit = int(request.query_params.get('limit', RECOMMENDATIONS_TOP_N))
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        return None
+    if limit < 0 or offset < 0:
+        return None
+    return limit, offset
+
+
+def record_statistics(user, recommendations):
+    """Статистика выдачи записывается в буфер, сохраняемый пачками вне пути запроса."""
+    statistics_buffer.add(RecommendationStatistics(
+        user=user,
+        film_count=len(recommendations["films"]),
+        genre_count=len(recommendations["genres"])
+    ))
+
+
+def recommendations_payload(recommendations, top, limit, offset):
+    """Топ и срез рекомендаций с метаданными из кэша каталога."""
+    return {
+        "top": {
+            "top_5_films": film_catalog.get_many(top["top_5_films"]),
+            "top_5_genres": genre_catalog.get_many(top["top_5_genres"]),
+        },
+        "recommendations": {
+            "films": film_catalog.get_scored(paginate(recommendations["films"], limit, offset)),
+            "genres": genre_catalog.get_scored(paginate(recommendations["genres"], limit, offset)),
+        },
+    }
 
 
 class HomePageView(View):
@@ -23,13 +67,20 @@ class HomePageView(View):
     context_object_name = "films"
 
     def get(self, request):
-        genres = Genre.objects.all()  # Получаем все жанры
-        films = Film.objects.all()  # Получаем все фильмы
+        # Жанры и страница фильмов читаются из базы данных, только если их фрагменты шаблона не в кэше
+        genres = Genre.objects.only('id', 'name')
+        films = FilmPage(after=request.GET.get('after'), before=request.GET.get('before'))
+        query = request.GET.get('q', '').strip()
+        search_results = film_catalog.get_scored(film_search_store.search(query)) if query else None
         # Получаем сообщение об успехе
         success_message = request.session.pop('success_message', None)
         return render(request, self.template_name, {
             'genres': genres,
             'films': films,
+            'query': query,
+            'search_results': search_results,
+            'catalog_version': get_catalog_version(),
+            'fragment_timeout': settings.CATALOG_FRAGMENT_TIMEOUT,
             'success_message': success_message,
         })
 
@@ -75,8 +126,13 @@ class FilmDetailView(LoginRequiredMixin, DetailView):
             )
         return self.object
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Похожие фильмы из предрассчитанного индекса
+        context["similar_films"] = film_catalog.get_scored(get_similar_films(self.object.pk))
+        return context
+
 
-@method_decorator(cache_page(60 * 5), name='dispatch')
 class RecommendationView(LoginRequiredMixin, ListView):
     model = Film
     template_name = "recommendation_system/recommendation_film.html"
@@ -84,22 +140,14 @@ class RecommendationView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
-        recommendation_system = RecommendationSystem
+        get_recommendations, sorted_pagerank = get_recommendation_context(self.request).cached_result()
+        record_statistics(self.request.user, get_recommendations)
 
-        graph = recommendation_system.build_preference_graph()
-        get_recommendations = recommendation_system.get_recommendations(graph, self.request.user.id)
-        _, sorted_pagerank = recommendation_system.calculate_pagerank(graph)
-
-        RecommendationStatistics.objects.create(
-            user=self.request.user,
-            film_count=len(get_recommendations["films"]),
-            genre_count=len(get_recommendations["genres"])
-        )
-
-        context["top_5_films"] = Film.objects.filter(title__in=sorted_pagerank["top_5_films"][:4])
-        context["top_5_genres"] = Genre.objects.filter(name__in=sorted_pagerank["top_5_genres"])
-        context["genres"] = Genre.objects.filter(name__in=get_recommendations["genres"])
-        context["films"] = Film.objects.filter(title__in=get_recommendations["films"])
+        # Метаданные только для выводимых объектов, из кэша каталога
+        context["top_5_films"] = film_catalog.get_many(sorted_pagerank["top_5_films"][:4])
+        context["top_5_genres"] = genre_catalog.get_many(sorted_pagerank["top_5_genres"])
+        context["genres"] = genre_catalog.get_scored(get_recommendations["genres"])
+        context["films"] = film_catalog.get_scored(get_recommendations["films"])
 
         return context
 
@@ -120,13 +168,13 @@ class PreferenceView(LoginRequiredMixin, ListView):
 
 
 class StatisticRecommendationView(LoginRequiredMixin, ListView):
-    """Представление статистики рекомендаций для пользователя."""
-    model = RecommendationStatistics
+    """Представление статистики рекомендаций для пользователя: ежедневные агрегаты вместо отдельных записей."""
+    model = DailyStatistics
     template_name = "recommendation_system/statistics.html"
     context_object_name = "statistics"
 
     def get_queryset(self):
-        return RecommendationStatistics.objects.filter(user=self.request.user)
+        return DailyStatistics.objects.filter(user=self.request.user)
 
 
 class FilmRetrieveAPIView(RetrieveAPIView):
@@ -143,7 +191,29 @@ class FilmRetrieveAPIView(RetrieveAPIView):
                 user=user,
                 film=instance
             )
-        return Response(self.get_serializer(instance).data)
+        return Response({
+            **self.get_serializer(instance).data,
+            "similar_films": film_catalog.get_scored(get_similar_films(instance.pk)),
+        })
+
+
+class FilmSearchAPIView(APIView):
+    """
+    API поиска фильмов по названию, режиссеру и описанию: параметр q - запрос (последнее слово - префикс),
+    limit - количество фильмов (не больше 50). Фильмы упорядочены по оценке совпадения.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_TOP_N))
+        except ValueError:
+            limit = -1
+        if not 0 <= limit <= SEARCH_MAX_LIMIT:
+            return Response({"error": f"Параметр 'limit' должен быть целым числом от 0 до {SEARCH_MAX_LIMIT}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        query = request.query_params.get('q', '')
+        return Response({"results": film_catalog.get_scored(film_search_store.search(query, limit))})
 
 
 class PreferenceCreateAPIView(CreateAPIView):
@@ -176,24 +246,48 @@ class PreferenceCreateAPIView(CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class RecommendationAPIView(APIView):
-    """API для получения рекомендаций на основе графов"""
+class BulkPreferenceCreateAPIView(APIView):
+    """
+    Класс представления для пакетного добавления предпочтений пользователю.
+    Принимает список элементов в формате PreferenceCreateAPIView и возвращает результат по каждому элементу.
+    """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        recommendation_system = RecommendationSystem
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Передайте непустой список предпочтений."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > BULK_PREFERENCES_MAX_ITEMS:
+            return Response({"error": f"Не больше {BULK_PREFERENCES_MAX_ITEMS} предпочтений в одном запросе."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = save_preferences(request.user, items)
+        invalid = sum(result["status"] == "invalid" for result in results)
+        if not invalid:
+            response_status = status.HTTP_201_CREATED
+        elif invalid < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({"results": results}, status=response_status)
+
 
-        graph = recommendation_system.build_preference_graph()
-        get_recommendations = recommendation_system.get_recommendations(graph, request.user.id)
-        _, sorted_pagerank = recommendation_system.calculate_pagerank(graph)
+class RecommendationAPIView(APIView):
+    """
+    API для получения рекомендаций на основе графов.
+    Фильмы и жанры упорядочены по оценке; параметры limit и offset задают срез списков.
+    """
+    permission_classes = [IsAuthenticated]
 
-        RecommendationStatistics.objects.create(
-            user=request.user,
-            film_count=len(get_recommendations["films"]),
-            genre_count=len(get_recommendations["genres"])
-        )
+    def get(self, request):
+        page = get_page_params(request)
+        if page is None:
+            return Response(PAGE_PARAMS_ERROR, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"top": sorted_pagerank, "recommendations": get_recommendations})
+        get_recommendations, sorted_pagerank = get_recommendation_context(request).cached_result()
+        record_statistics(request.user, get_recommendations)
+        return Response(recommendations_payload(get_recommendations, sorted_pagerank, *page))
 
 
 class RecommendationStatisticsAPIView(APIView):
@@ -201,16 +295,26 @@ class RecommendationStatisticsAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        system = RecommendationSystem
-        graph = system.build_preference_graph()
+        statistics = get_recommendation_context(request).cached_statistics()
+        return Response({**statistics, 'cache': recommendation_cache.stats()})
+
 
-        # Получаем статистику рекомендации для текущего пользователя
-        pagerank_scores, _ = system.calculate_pagerank(graph)
-        similar_users = system.collaborative_filtering(graph, request.user.id)
-        k_neighbors = system.k_nearest_neighbors(graph, request.user.id)
+class RecommendationOverviewAPIView(APIView):
+    """
+    API для получения рекомендаций, топа и статистики одним запросом.
+    Все три вывода считаются по одному графу и одному набору схожих пользователей и соседей.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        page = get_page_params(request)
+        if page is None:
+            return Response(PAGE_PARAMS_ERROR, status=status.HTTP_400_BAD_REQUEST)
 
+        context = get_recommendation_context(request)
+        get_recommendations, sorted_pagerank = context.cached_result()
+        record_statistics(request.user, get_recommendations)
         return Response({
-            'pagerank_scores': pagerank_scores,
-            'similar_users': similar_users,
-            'k_neighbors': k_neighbors
+            **recommendations_payload(get_recommendations, sorted_pagerank, *page),
+            "statistics": context.cached_statistics(),
         })
@@ -0,0 +1,58 @@
+"""
+Прогрев процесса сервера до приема запросов: импорт движка рекомендаций, построение (или загрузка из снимка)
+графа предпочтений, расчет PageRank и индекса похожих фильмов, загрузка каталога фильмов и жанров.
+Без прогрева все это выполняет первый запрос рекомендаций в каждом воркере.
+"""
+import importlib
+import logging
+import time
+
+from django.conf import settings
+
+from recommendation_system.catalog import film_catalog, genre_catalog
+from recommendation_system.item_similarity import ItemSimilarityStore, item_similarity_store
+from recommendation_system.services import get_graph_store, get_recommendation_system
+
+logger = logging.getLogger(__name__)
+
+# Библиотеки движков, которые модули рекомендаций импортируют при первом использовании
+ENGINE_IMPORTS = {
+    'networkx': ('networkx', 'scipy.sparse'),
+    'sparse': ('scipy.sparse', 'recommendation_system.sparse_engine'),
+}
+
+
+def warm_up(engine=None):
+    """Прогрев структур процесса для движка engine (по умолчанию - из настроек). Возвращает время этапов в секундах."""
+    engine = engine or settings.RECOMMENDATION_ENGINE
+    timings = {}
+    started = total_started = time.perf_counter()
+    system = get_recommendation_system(engine)
+    for module in ENGINE_IMPORTS.get(engine, ()):
+        importlib.import_module(module)
+    timings["import"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    graph = get_graph_store(engine).get_graph()
+    timings["graph"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    system.calculate_pagerank(graph)
+    timings["pagerank"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # Индекс процесса строится по движку из настроек, прогрев другого движка строит отдельный индекс
+    similarity_store = item_similarity_store if engine == settings.RECOMMENDATION_ENGINE else \
+        ItemSimilarityStore(engine)
+    similarity_store.get_index()
+    timings["similar_films"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    film_catalog.preload()
+    genre_catalog.preload()
+    timings["catalog"] = time.perf_counter() - started
+
+    timings["total"] = time.perf_counter() - total_started
+    logger.info("Процесс прогрет за %(total).3f с: импорт %(import).3f с, граф %(graph).3f с, "
+                "PageRank %(pagerank).3f с, похожие фильмы %(similar_films).3f с, каталог %(catalog).3f с", timings)
+    return timings